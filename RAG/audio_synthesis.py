@@ -0,0 +1,207 @@
+# audio_synthesis.py
+import io
+import os
+import sys
+import math
+import wave
+import json
+import array
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+SAMPLE_WIDTH = 2  # PCM 16-bit
+CHANNELS = 1
+
+
+class UnsupportedLanguage(ValueError):
+    """Backend TTS tidak punya model untuk bahasa yang diminta."""
+
+
+def pcm_to_wav(pcm_bytes, sample_rate):
+    """Membungkus data PCM 16-bit mono menjadi file WAV."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(CHANNELS)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm_bytes)
+    return buffer.getvalue()
+
+
+# --- BACKEND TTS ---
+
+class ToneTTSBackend:
+    """
+    Backend pengganti yang deterministik dan tanpa model: setiap kata menjadi
+    nada pendek yang frekuensinya diturunkan dari hash kata tersebut.
+    Dipakai untuk pengujian dan pengembangan lokal.
+    """
+    name = "tone"
+
+    def __init__(self, sample_rate=16000, word_duration=0.18, gap_duration=0.04):
+        self.sample_rate = sample_rate
+        self.word_duration = word_duration
+        self.gap_duration = gap_duration
+
+    def supports(self, language):
+        return True
+
+    def synthesize(self, text, voice, language):
+        samples = array.array('h')
+        word_frames = int(self.sample_rate * self.word_duration)
+        gap = array.array('h', [0]) * int(self.sample_rate * self.gap_duration)
+        for word in text.split():
+            digest = hashlib.sha256(f"{voice}|{language}|{word}".encode('utf-8')).digest()
+            frequency = 220 + int.from_bytes(digest[:2], 'little') % 660
+            step = 2 * math.pi * frequency / self.sample_rate
+            samples.extend(int(8000 * math.sin(step * i)) for i in range(word_frames))
+            samples.extend(gap)
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        return pcm_to_wav(samples.tobytes(), self.sample_rate)
+
+
+class TransformersTTSBackend:
+    """
+    Backend TTS memakai pipeline text-to-speech transformers (model MMS per bahasa).
+    MMS tidak menyediakan model bahasa Jepang; tambahkan lewat `models` (env
+    TTS_MODELS) jika ada model text-to-speech lain untuk bahasa tersebut.
+    """
+    name = "mms"
+
+    DEFAULT_MODELS = {
+        "English": "facebook/mms-tts-eng",
+        "Indonesian": "facebook/mms-tts-ind",
+        "Malay": "facebook/mms-tts-zlm",
+        "Korean": "facebook/mms-tts-kor",
+    }
+
+    def __init__(self, models=None, device=None):
+        self.models = {**self.DEFAULT_MODELS, **(models or {})}
+        self.device = device
+        self.pipelines = {}
+        self.lock = threading.Lock()
+
+    def supports(self, language):
+        return language in self.models
+
+    def _pipeline(self, language):
+        with self.lock:
+            if language not in self.pipelines:
+                if language not in self.models:
+                    raise UnsupportedLanguage(f"Tidak ada model TTS untuk bahasa {language}.")
+                from transformers import pipeline
+                logging.info(f"Memuat model TTS untuk {language}: {self.models[language]}...")
+                self.pipelines[language] = pipeline("text-to-speech", model=self.models[language], device=self.device)
+            return self.pipelines[language]
+
+    def synthesize(self, text, voice, language):
+        # Model MMS hanya punya satu suara per bahasa; `voice` tetap ikut menentukan kunci cache
+        result = self._pipeline(language)(text)
+        audio = result["audio"].reshape(-1)
+        pcm = (audio.clip(-1.0, 1.0) * 32767).astype('<i2').tobytes()
+        return pcm_to_wav(pcm, int(result["sampling_rate"]))
+
+
+def create_tts_backend(name, models=None):
+    """Membuat backend TTS berdasarkan nama ("tone" atau "mms"). `models` menambah/mengganti model per bahasa."""
+    if name == ToneTTSBackend.name:
+        return ToneTTSBackend()
+    if name == TransformersTTSBackend.name:
+        return TransformersTTSBackend(models)
+    raise ValueError(f"Backend TTS tidak dikenal: {name}")
+
+
+# --- CACHE AUDIO ---
+
+def audio_key(text, voice, language, backend_name):
+    """Hash konten untuk satu potongan audio."""
+    payload = json.dumps([backend_name, voice, language, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    """Cache audio per kalimat di disk, dialamatkan dengan hash konten."""
+    def __init__(self, cache_dir="audio_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.wav")
+
+    def has(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, key, wav_bytes):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(wav_bytes)
+        os.replace(tmp_path, path)
+        return path
+
+
+# --- TAHAP SINTESIS ---
+
+class AudioSynthesizer:
+    """
+    Tahap sintesis suara setelah terjemahan. Pekerjaan dijalankan di thread pool
+    sehingga berjalan paralel dengan terjemahan, dan kalimat yang sudah ada di
+    cache (atau sedang disintesis) tidak pernah disintesis ulang.
+    """
+    def __init__(self, backend, cache, max_workers=2):
+        self.backend = backend
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stats = {"cache_hits": 0, "synthesized": 0, "failed": 0}
+
+    def key(self, text, voice, language):
+        return audio_key(text, voice, language, self.backend.name)
+
+    def require_language(self, language):
+        """Melempar UnsupportedLanguage sebelum pekerjaan dijadwalkan untuk bahasa tanpa model TTS."""
+        if not self.backend.supports(language):
+            raise UnsupportedLanguage(f"Sintesis suara belum tersedia untuk bahasa {language} (backend {self.backend.name}).")
+
+    def submit(self, text, voice, language):
+        """Menjadwalkan sintesis satu kalimat. Mengembalikan (kunci, Future yang berisi path WAV)."""
+        key = self.key(text, voice, language)
+        with self.lock:
+            if key in self.pending:
+                return key, self.pending[key]
+            if self.cache.has(key):
+                self.stats["cache_hits"] += 1
+                future = Future()
+                future.set_result(self.cache.path(key))
+                return key, future
+            future = self.executor.submit(self._synthesize, key, text, voice, language)
+            self.pending[key] = future
+            return key, future
+
+    def _synthesize(self, key, text, voice, language):
+        try:
+            wav_bytes = self.backend.synthesize(text, voice, language)
+            path = self.cache.put(key, wav_bytes)
+            with self.lock:
+                self.stats["synthesized"] += 1
+            return path
+        except Exception:
+            with self.lock:
+                self.stats["failed"] += 1
+            logging.error(f"Sintesis audio gagal untuk kalimat: '{text[:30]}...'", exc_info=True)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def is_pending(self, key):
+        with self.lock:
+            return key in self.pending
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,271 @@
+# batch_translate.py
+import os
+import json
+import time
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from translator import InteractiveTranslator, setup_logging, PROMPT_VERSION
+from book_scan import BookScan
+from epub_export import file_sha256, export_translated_epub
+from work_queue import find_epubs, DEFAULT_MODEL_ID
+import translation_cache as tcache
+
+DEFAULT_CHECKPOINT = "batch_checkpoint.json"
+
+
+def read_manifest(path, default_languages):
+    """
+    Membaca manifest JSON Lines: satu buku per baris, {"path": ..., "languages": [...]}.
+    "languages" opsional; path relatif dihitung dari lokasi manifest.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    books = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line)
+            books.append((os.path.join(base, entry["path"]), entry.get("languages") or default_languages))
+    return books
+
+
+def scan_book(path):
+    """Dijalankan di proses pemindai: (chunk dalam urutan baca seperti penomoran API, detik pemindaian)."""
+    scan = BookScan(path)
+    scan.run()
+    if scan.error:
+        raise RuntimeError(scan.error)
+    return scan.chunks, scan.seconds
+
+
+class Checkpoint:
+    """
+    Status run yang disimpan ke JSON setelah setiap batch. Terjemahan sendiri
+    tersimpan di cache per buku, sehingga run yang terputus cukup dijalankan ulang:
+    pasangan buku-bahasa yang selesai dilewati dan sisanya melanjutkan dari cache.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = {"books": {}}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+
+    def book(self, book_hash, path):
+        return self.data["books"].setdefault(book_hash, {"path": path, "total_chunks": None, "languages": {}})
+
+    def is_done(self, book_hash, language):
+        entry = self.data["books"].get(book_hash, {}).get("languages", {}).get(language)
+        return bool(entry and entry.get("done"))
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class BatchJob:
+    """Satu buku dalam satu bahasa target yang sedang dikerjakan."""
+    def __init__(self, book_hash, path, language, output_path):
+        self.book_hash = book_hash
+        self.path = path
+        self.language = language
+        self.output_path = output_path
+        self.remaining = 0
+
+
+class BatchTranslator:
+    """
+    Menerjemahkan banyak EPUB dengan satu model. Buku dipindai paralel di proses
+    terpisah, lalu kalimat yang belum ada di cache dari semua buku dimasukkan ke
+    satu antrean FIFO. Satu executor mengambil batch berisi hingga `batch_size`
+    kalimat berbahasa target sama (boleh lintas buku), sehingga batch tetap penuh
+    di batas antar-buku. Buku diekspor begitu semua kalimatnya diterjemahkan.
+    """
+    def __init__(self, translator, output_dir, checkpoint, batch_size=8, scan_workers=4):
+        self.translator = translator
+        self.output_dir = output_dir
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.scan_workers = scan_workers
+        self.queue = deque()  # (BatchJob, kalimat)
+        self.stats = {"books": 0, "skipped_books": 0, "failed_books": 0, "chunks": 0, "cached": 0,
+                      "memory": 0, "generated": 0, "batches": 0, "exported": 0, "failed_exports": 0,
+                      "scan_seconds": 0.0, "generate_seconds": 0.0}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def output_path(self, path, book_hash, language):
+        # Hash konten di nama file: buku bernama sama dari direktori berbeda tidak saling menimpa
+        base, _ = os.path.splitext(os.path.basename(path))
+        return os.path.join(self.output_dir, f"{base}.{book_hash[:10]}.{language.lower()}.epub")
+
+    def run(self, books):
+        start = time.perf_counter()
+        to_scan = {}
+        for path, languages in books:
+            book_hash = file_sha256(path)
+            languages = [lang for lang in languages if not self.checkpoint.is_done(book_hash, lang)]
+            if not languages:
+                self.stats["skipped_books"] += 1
+                continue
+            self.checkpoint.book(book_hash, os.path.abspath(path))
+            to_scan[path] = (book_hash, languages)
+        logging.info(f"{len(to_scan)} buku perlu diterjemahkan, {self.stats['skipped_books']} sudah selesai di checkpoint.")
+
+        # Pemindaian (BeautifulSoup, terikat CPU) berjalan di proses lain selagi model menerjemahkan
+        with ProcessPoolExecutor(max_workers=self.scan_workers) as pool:
+            scans = {pool.submit(scan_book, path): path for path in to_scan}
+            self.translator.load_model()
+            while scans or self.queue:
+                done = [future for future in scans if future.done()]
+                if not self.queue and not done:
+                    done, _ = wait(scans, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = scans.pop(future)
+                    self._add_book(path, *to_scan[path], future)
+                if self.queue:
+                    self._run_batch()
+
+        self.stats["seconds"] = round(time.perf_counter() - start, 1)
+        self.stats["scan_seconds"] = round(self.stats["scan_seconds"], 1)
+        self.stats["generate_seconds"] = round(self.stats["generate_seconds"], 1)
+        self.checkpoint.data["summary"] = self.stats
+        self.checkpoint.save()
+        return self.stats
+
+    def _add_book(self, path, book_hash, languages, future):
+        try:
+            chunks, seconds = future.result()
+        except Exception as e:
+            self.stats["failed_books"] += 1
+            logging.error(f"Gagal memindai {path}: {e}")
+            return
+        self.stats["books"] += 1
+        self.stats["scan_seconds"] += seconds
+        self.checkpoint.book(book_hash, path)["total_chunks"] = len(chunks)
+
+        cache_path = tcache.cache_path(self.translator.cache_dir, book_hash)
+        cache = tcache.load_cache(cache_path)
+        served = 0
+        jobs = []
+        for language in languages:
+            job = BatchJob(book_hash, path, language, self.output_path(path, book_hash, language))
+            jobs.append(job)
+            for chunk in chunks:
+                self.stats["chunks"] += 1
+                if tcache.lookup(cache, chunk, language) is not None:
+                    self.stats["cached"] += 1
+                    continue
+                match = self.translator.memory.lookup(chunk, language)
+                if match is not None and match.similarity >= self.translator.memory.serve_threshold:
+                    tcache.store(cache, chunk, language, match.translation, match.model_tag)
+                    served += 1
+                    continue
+                self.queue.append((job, chunk))
+                job.remaining += 1
+            logging.info(f"{os.path.basename(path)} [{language}]: {len(chunks)} chunk, {job.remaining} perlu diterjemahkan.")
+        self.stats["memory"] += served
+        if served:
+            tcache.merge_save_cache(cache, cache_path)
+        # Buku yang seluruhnya sudah ada di cache langsung diekspor
+        for job in jobs:
+            if not job.remaining:
+                self._finish(job)
+
+    def _run_batch(self):
+        language = self.queue[0][0].language
+        batch = []
+        while self.queue and len(batch) < self.batch_size and self.queue[0][0].language == language:
+            batch.append(self.queue.popleft())
+
+        start = time.perf_counter()
+        translations = self.translator.translate_texts([chunk for _, chunk in batch], language)
+        self.stats["generate_seconds"] += time.perf_counter() - start
+        self.stats["batches"] += 1
+        self.stats["generated"] += len(batch)
+
+        by_book = {}
+        for (job, chunk), translation in zip(batch, translations):
+            by_book.setdefault(job.book_hash, []).append((job, chunk, translation))
+        finished = []
+        for book_hash, items in by_book.items():
+            cache_path = tcache.cache_path(self.translator.cache_dir, book_hash)
+            with tcache.locked(cache_path):
+                cache = tcache.load_cache(cache_path)
+                for job, chunk, translation in items:
+                    tcache.store(cache, chunk, language, translation, self.translator.model_id, PROMPT_VERSION)
+                    self.translator.memory.add(chunk, language, translation)
+                    job.remaining -= 1
+                    if not job.remaining:
+                        finished.append(job)
+                tcache.save_cache(cache, cache_path)
+        for job in finished:
+            self._finish(job)
+        self.checkpoint.save()
+
+    def _finish(self, job):
+        languages = self.checkpoint.book(job.book_hash, job.path)["languages"]
+        try:
+            export_translated_epub(job.path, job.output_path, job.language, self.translator.cache_dir, job.book_hash)
+        except Exception as e:
+            # Terjemahan tetap ada di cache; run berikutnya hanya mengulang ekspor buku ini
+            self.stats["failed_exports"] += 1
+            languages[job.language] = {"done": False, "error": str(e), "failed": time.time()}
+            self.checkpoint.save()
+            logging.error(f"Gagal mengekspor {os.path.basename(job.path)} [{job.language}]: {e}", exc_info=True)
+            return
+        self.stats["exported"] += 1
+        languages[job.language] = {"done": True, "output": job.output_path, "finished": time.time()}
+        self.checkpoint.save()
+        logging.info(f"Selesai: {os.path.basename(job.path)} [{job.language}] -> {job.output_path}")
+
+
+def print_summary(stats):
+    seconds = stats["seconds"] or 1e-9
+    generate_seconds = stats["generate_seconds"] or 1e-9
+    print("\n================ RINGKASAN BATCH ================")
+    print(f"Buku diproses      : {stats['books']} (dilewati {stats['skipped_books']}, gagal {stats['failed_books']})")
+    print(f"EPUB diekspor      : {stats['exported']} (gagal {stats['failed_exports']})")
+    print(f"Kalimat            : {stats['chunks']} (cache {stats['cached']}, translation memory {stats['memory']}, "
+          f"diterjemahkan {stats['generated']} dalam {stats['batches']} batch)")
+    print(f"Waktu total        : {stats['seconds']:.1f} detik (generasi {stats['generate_seconds']:.1f} detik, "
+          f"pemindaian paralel {stats['scan_seconds']:.1f} detik-proses)")
+    print(f"Throughput         : {stats['chunks'] / seconds:.2f} kalimat/detik total, "
+          f"{stats['generated'] / generate_seconds:.2f} kalimat/detik generasi, "
+          f"{stats['exported'] / seconds * 3600:.1f} EPUB/jam")
+    print("=================================================\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate directories or manifests of Arabic EPUBs non-interactively.")
+    parser.add_argument("paths", nargs="*", help="EPUB files or directories containing EPUB files.")
+    parser.add_argument("--manifest", help="JSON Lines file: one {\"path\": ..., \"languages\": [...]} per book.")
+    parser.add_argument("-lang", "--languages", nargs="+", default=["English"], help="Target languages (default for manifest entries without languages).")
+    parser.add_argument("-o", "--output_dir", default="translated", help="Directory for translated EPUBs.")
+    parser.add_argument("--cache_dir", default="cache", help="Translation cache directory (shared with the API).")
+    parser.add_argument("--model_id", default=DEFAULT_MODEL_ID, help="Model ID from Hugging Face.")
+    parser.add_argument("--batch_size", type=int, default=8, help="Sentences per generate call, across books.")
+    parser.add_argument("--scan_workers", type=int, default=min(4, os.cpu_count() or 1), help="Processes scanning EPUBs in parallel.")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Progress file; rerun with the same file to resume.")
+    parser.add_argument("--log_file", default="batch_translate.log", help="File to store logs.")
+    args = parser.parse_args()
+
+    setup_logging(args.log_file)
+    books = [(path, args.languages) for path in find_epubs(args.paths)]
+    if args.manifest:
+        books.extend(read_manifest(args.manifest, args.languages))
+    if not books:
+        parser.error("Berikan direktori/file EPUB atau --manifest.")
+
+    translator = InteractiveTranslator(args.model_id, cache_dir=args.cache_dir)
+    batch = BatchTranslator(translator, args.output_dir, Checkpoint(args.checkpoint), args.batch_size, args.scan_workers)
+    print_summary(batch.run(books))
+
+
+if __name__ == "__main__":
+    main()
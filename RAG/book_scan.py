@@ -0,0 +1,75 @@
+# book_scan.py
+import os
+import time
+import logging
+import threading
+
+from translator import epub_documents, iter_document_sentences
+
+
+class BookScan:
+    """
+    Memindai satu EPUB secara bertahap di latar belakang. Dokumen dibaca dalam
+    urutan baca (spine lebih dulu), dan setiap kalimat unik mendapat nomor chunk
+    sesuai kemunculan pertamanya, sehingga nomor chunk yang sudah dibagikan tidak
+    berubah selama pemindaian berlanjut. `chunks` dan `chapters` hanya bertambah
+    dan bisa dibaca thread lain kapan saja.
+    """
+    def __init__(self, epub_path, ready_chapters=1):
+        self.epub_path = epub_path
+        self.ready_chapters = ready_chapters  # Bab berisi kalimat sebelum pemindaian dianggap siap dipakai
+        self.chunks = []     # Kalimat unik, nomor chunk = indeks + 1
+        self.index = {}      # Kalimat -> indeks di `chunks`; dilepas setelah pemindaian selesai
+        self.chapters = []   # {"name", "chunks": [indeks]} per dokumen spine yang selesai dipindai
+        self.documents_scanned = 0
+        self.documents_total = None
+        self.complete = False
+        self.error = None
+        self.ready = threading.Event()
+        self.started = time.monotonic()
+        self.seconds = None
+
+    def run(self):
+        try:
+            documents = epub_documents(self.epub_path)
+            self.documents_total = len(documents)
+            for item, in_spine in documents:
+                positions = []
+                for sentence in iter_document_sentences(item):
+                    position = self.index.get(sentence)
+                    if position is None:
+                        position = len(self.chunks)
+                        self.chunks.append(sentence)
+                        self.index[sentence] = position
+                    positions.append(position)
+                if in_spine and positions:
+                    self.chapters.append({"name": item.get_name(), "chunks": positions})
+                self.documents_scanned += 1
+                if len(self.chapters) >= self.ready_chapters:
+                    self.ready.set()
+        except Exception as e:
+            self.error = str(e)
+            logging.error(f"Gagal memindai {os.path.basename(self.epub_path)}: {e}", exc_info=True)
+        finally:
+            # Indeks hanya diperlukan selama pemindaian; setelahnya hanya menggandakan kalimat di memori
+            self.index = None
+            self.seconds = round(time.monotonic() - self.started, 2)
+            self.complete = True
+            self.ready.set()
+            logging.info(f"Pemindaian {os.path.basename(self.epub_path)} selesai: {len(self.chunks)} chunk "
+                         f"dari {self.documents_scanned} dokumen dalam {self.seconds} detik.")
+
+    def wait_ready(self, timeout=None):
+        """Menunggu hingga bab pertama terindeks (atau pemindaian selesai). Mengembalikan True jika siap."""
+        return self.ready.wait(timeout)
+
+    def status(self):
+        return {
+            "total": len(self.chunks),
+            "scan_complete": self.complete,
+            "chapters": len(self.chapters),
+            "documents_scanned": self.documents_scanned,
+            "documents_total": self.documents_total,
+            "seconds": self.seconds if self.complete else round(time.monotonic() - self.started, 2),
+            "error": self.error,
+        }
@@ -0,0 +1,265 @@
+# cache_snapshot.py
+import io
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import socket
+import logging
+import argparse
+
+from translator import setup_logging
+import translation_cache as tcache
+
+try:
+    import zstandard
+except ImportError:  # zstd opsional; gzip dipakai sebagai cadangan
+    zstandard = None
+
+SNAPSHOT_FORMAT = "translation-cache-snapshot"
+SNAPSHOT_VERSION = 1
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Aturan konflik saat impor: entri mana yang dipakai jika kunci yang sama sudah ada
+CONFLICT_RULES = ("newest", "local", "incoming")
+
+
+# --- FORMAT SNAPSHOT ---
+#
+# Snapshot adalah JSON Lines terkompresi (zstd, atau gzip jika zstandard tidak
+# terpasang). Baris pertama adalah header; setiap baris berikutnya berisi satu
+# buku: {"book": <hash>, "entries": [[bahasa, kalimat, terjemahan, model, prompt, ts], ...]}.
+# Satu baris per buku membuat snapshot bisa di-stream dan diimpor buku demi buku
+# tanpa memuat seluruh snapshot ke memori.
+
+def open_snapshot_writer(path, level=10):
+    """Membuka snapshot untuk ditulis. Kompresi dipilih dari ekstensi (.zst atau .gz)."""
+    if path.endswith(".gz") or zstandard is None:
+        if not path.endswith(".gz"):
+            logging.warning("Modul zstandard tidak terpasang; snapshot dikompresi dengan gzip.")
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+    raw = open(path, 'wb')
+    writer = zstandard.ZstdCompressor(level=level, threads=-1).stream_writer(raw, closefd=True)
+    return io.TextIOWrapper(writer, encoding='utf-8')
+
+
+def open_snapshot_reader(path):
+    """Membuka snapshot untuk dibaca; kompresi dikenali dari magic bytes."""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("Snapshot dikompresi dengan zstd; pasang paket 'zstandard' untuk membacanya.")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def entry_row(key, value):
+    """Mengubah satu entri cache menjadi baris snapshot."""
+    language, source = tcache.split_cache_key(key)
+    model, prompt, ts = tcache.entry_meta(value)
+    return [language, source, tcache.entry_text(value), model, prompt, ts]
+
+
+def row_entry(row):
+    """Mengubah baris snapshot menjadi (kunci, nilai) cache. Entri tanpa metadata tetap berupa string."""
+    language, source, text, model, prompt, ts = row
+    key = tcache.cache_key(source, language) if language else source
+    if model is None and prompt is None and not ts:
+        return key, text
+    return key, tcache.make_entry(text, model, prompt, ts)
+
+
+def is_kept(row, keep_models=None, keep_prompts=None, drop_legacy=False):
+    """Menentukan apakah baris lolos filter versi model/prompt."""
+    _, _, text, model, prompt, _ = row
+    if text is None:
+        return False
+    if model is None and prompt is None:
+        # Entri lama tanpa metadata (termasuk kunci tanpa bahasa)
+        return not drop_legacy
+    if keep_models and model not in keep_models:
+        return False
+    if keep_prompts and prompt not in keep_prompts:
+        return False
+    return True
+
+
+def iter_cache_files(cache_dir, books=None):
+    for path in sorted(glob.glob(os.path.join(cache_dir, f"*{tcache.CACHE_SUFFIX}"))):
+        book_hash = os.path.basename(path)[:-len(tcache.CACHE_SUFFIX)]
+        if books and book_hash not in books:
+            continue
+        yield book_hash, path
+
+
+# --- PERINTAH ---
+
+def export_snapshot(cache_dir, output_path, books=None, keep_models=None, keep_prompts=None, drop_legacy=False):
+    """Menulis semua cache buku di direktori ke satu snapshot terkompresi."""
+    start = time.perf_counter()
+    stats = {"books": 0, "entries": 0, "skipped": 0}
+    with open_snapshot_writer(output_path) as out:
+        header = {"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION, "created": time.time(), "node": socket.gethostname()}
+        out.write(json.dumps(header) + "\n")
+        for book_hash, path in iter_cache_files(cache_dir, books):
+            rows = [entry_row(key, value) for key, value in tcache.load_cache(path).items()]
+            kept = [row for row in rows if is_kept(row, keep_models, keep_prompts, drop_legacy)]
+            stats["skipped"] += len(rows) - len(kept)
+            if not kept:
+                continue
+            out.write(json.dumps({"book": book_hash, "entries": kept}, ensure_ascii=False, separators=(',', ':')) + "\n")
+            stats["books"] += 1
+            stats["entries"] += len(kept)
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    stats["bytes"] = os.path.getsize(output_path)
+    logging.info(f"Snapshot {output_path}: {stats['entries']} entri dari {stats['books']} buku "
+                 f"({stats['bytes'] / 1024 ** 2:.1f} MB) dalam {stats['seconds']} detik.")
+    return stats
+
+
+def resolve_conflict(local, incoming, rule):
+    """Memilih nilai entri untuk kunci yang sudah ada sesuai aturan konflik."""
+    if rule == "local":
+        return local
+    if rule == "incoming":
+        return incoming
+    # newest: ts lebih baru menang; seri dimenangkan entri lokal
+    return incoming if tcache.entry_meta(incoming)[2] > tcache.entry_meta(local)[2] else local
+
+
+def import_snapshots(snapshot_paths, cache_dir, rule="newest", keep_models=None, keep_prompts=None, drop_legacy=False):
+    """
+    Menggabungkan satu atau beberapa snapshot (mis. dari beberapa node) ke direktori cache.
+    Setiap buku digabung di bawah kunci file cache, sehingga aman dijalankan saat server berjalan.
+    """
+    start = time.perf_counter()
+    stats = {"books": 0, "added": 0, "replaced": 0, "kept": 0, "skipped": 0}
+    os.makedirs(cache_dir, exist_ok=True)
+    for snapshot_path in snapshot_paths:
+        with open_snapshot_reader(snapshot_path) as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("format") != SNAPSHOT_FORMAT or header.get("version", 0) > SNAPSHOT_VERSION:
+                raise ValueError(f"{snapshot_path} bukan snapshot cache terjemahan yang didukung.")
+            for line in f:
+                book = json.loads(line)
+                path = tcache.cache_path(cache_dir, book["book"])
+                with tcache.locked(path):
+                    cache = tcache.load_cache(path)
+                    changed = False
+                    for row in book["entries"]:
+                        if not is_kept(row, keep_models, keep_prompts, drop_legacy):
+                            stats["skipped"] += 1
+                            continue
+                        key, value = row_entry(row)
+                        local = cache.get(key)
+                        if local is None:
+                            cache[key] = value
+                            stats["added"] += 1
+                            changed = True
+                        else:
+                            chosen = resolve_conflict(local, value, rule)
+                            if chosen is local:
+                                stats["kept"] += 1
+                            else:
+                                cache[key] = chosen
+                                stats["replaced"] += 1
+                                changed = True
+                    if changed:
+                        tcache.save_cache(cache, path)
+                stats["books"] += 1
+        logging.info(f"Snapshot {snapshot_path} (node {header.get('node', '?')}) diimpor.")
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    logging.info(f"Impor selesai: {stats}")
+    return stats
+
+
+def compact_cache_dir(cache_dir, keep_models=None, keep_prompts=None, drop_legacy=False):
+    """Membuang entri dari versi model/prompt lama dan menulis ulang file cache dalam format ringkas."""
+    stats = {"books": 0, "entries": 0, "dropped": 0, "bytes_before": 0, "bytes_after": 0}
+    for _, path in iter_cache_files(cache_dir):
+        with tcache.locked(path):
+            stats["bytes_before"] += os.path.getsize(path)
+            cache = tcache.load_cache(path)
+            kept = {key: value for key, value in cache.items()
+                    if is_kept(entry_row(key, value), keep_models, keep_prompts, drop_legacy)}
+            stats["dropped"] += len(cache) - len(kept)
+            stats["entries"] += len(kept)
+            stats["books"] += 1
+            if kept:
+                tcache.save_cache(kept, path)
+            else:
+                os.remove(path)
+            stats["bytes_after"] += os.path.getsize(path) if kept else 0
+    logging.info(f"Kompaksi selesai: {stats}")
+    return stats
+
+
+def cache_stats(cache_dir):
+    """Jumlah entri per (model, prompt) untuk menentukan versi mana yang perlu dikompaksi."""
+    counts = {}
+    for _, path in iter_cache_files(cache_dir):
+        for key, value in tcache.load_cache(path).items():
+            model, prompt, _ = tcache.entry_meta(value)
+            if tcache.split_cache_key(key)[0] is None:
+                model, prompt = "(tanpa bahasa)", None
+            label = f"{model or '-'} | {prompt or '-'}"
+            counts[label] = counts.get(label, 0) + 1
+    return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, import and compact translation-cache snapshots.")
+    parser.add_argument("--cache_dir", default="cache", help="Directory containing the translation caches.")
+    parser.add_argument("--log_file", default="cache_snapshot.log", help="File to store logs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_filters(command):
+        command.add_argument("--keep_model", action="append", help="Keep only entries from this model (repeatable).")
+        command.add_argument("--keep_prompt", action="append", help="Keep only entries from this prompt version (repeatable).")
+        command.add_argument("--drop_legacy", action="store_true", help="Drop entries without model/prompt metadata or language.")
+
+    export_parser = commands.add_parser("export", help="Write the cache directory to a compressed snapshot.")
+    export_parser.add_argument("output", help="Snapshot path (.jsonl.zst, or .jsonl.gz for gzip).")
+    export_parser.add_argument("--book", action="append", help="Export only this book hash (repeatable).")
+    add_filters(export_parser)
+
+    import_parser = commands.add_parser("import", help="Merge one or more snapshots into the cache directory.")
+    import_parser.add_argument("snapshots", nargs="+", help="Snapshot files, e.g. one per node.")
+    import_parser.add_argument("--conflict", choices=CONFLICT_RULES, default="newest",
+                               help="newest: later timestamp wins; local: keep existing; incoming: snapshot wins.")
+    add_filters(import_parser)
+
+    compact_parser = commands.add_parser("compact", help="Drop stale entries and rewrite cache files compactly.")
+    add_filters(compact_parser)
+
+    commands.add_parser("stats", help="Count cache entries per model and prompt version.")
+
+    args = parser.parse_args()
+    setup_logging(args.log_file)
+    filters = {}
+    if args.command != "stats":
+        filters = dict(keep_models=set(args.keep_model or ()), keep_prompts=set(args.keep_prompt or ()), drop_legacy=args.drop_legacy)
+
+    if args.command == "export":
+        result = export_snapshot(args.cache_dir, args.output, books=set(args.book or ()), **filters)
+    elif args.command == "import":
+        result = import_snapshots(args.snapshots, args.cache_dir, rule=args.conflict, **filters)
+    elif args.command == "compact":
+        if not (filters["keep_models"] or filters["keep_prompts"] or filters["drop_legacy"]):
+            parser.error("compact memerlukan --keep_model, --keep_prompt, atau --drop_legacy.")
+        result = compact_cache_dir(args.cache_dir, **filters)
+    else:
+        result = cache_stats(args.cache_dir)
+    json.dump(result, sys.stdout, indent=2, ensure_ascii=False)
+    print()
+
+
+if __name__ == "__main__":
+    main()
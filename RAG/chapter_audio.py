@@ -0,0 +1,161 @@
+# chapter_audio.py
+import queue
+import struct
+import wave
+import logging
+import threading
+
+# Ukuran RIFF/data "tidak diketahui" untuk WAV yang di-stream sebelum panjangnya pasti
+STREAMING_SIZE = 0xFFFFFFFF
+WAV_HEADER_SIZE = 44
+READ_FRAMES = 16384
+
+
+def wav_header(data_size, sample_rate, channels, sample_width):
+    """Header WAV PCM 44 byte. data_size=None menghasilkan header untuk streaming."""
+    riff_size = STREAMING_SIZE if data_size is None else 36 + data_size
+    data_size = STREAMING_SIZE - 36 if data_size is None else data_size
+    byte_rate = sample_rate * channels * sample_width
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', riff_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8,
+        b'data', data_size
+    )
+
+
+def wav_params(path):
+    """Mengembalikan ((sample_rate, channels, sample_width), ukuran data PCM) dari file WAV."""
+    with wave.open(path, 'rb') as wav:
+        params = (wav.getframerate(), wav.getnchannels(), wav.getsampwidth())
+        return params, wav.getnframes() * wav.getnchannels() * wav.getsampwidth()
+
+
+def iter_pcm(path, start=0, end=None):
+    """Membaca data PCM dari file WAV tanpa decode ulang, opsional dalam rentang byte [start, end)."""
+    with wave.open(path, 'rb') as wav:
+        frame_size = wav.getnchannels() * wav.getsampwidth()
+        total = wav.getnframes() * frame_size
+        end = total if end is None else min(end, total)
+        first_frame = start // frame_size
+        wav.setpos(first_frame)
+        skip = start - first_frame * frame_size
+        remaining = end - first_frame * frame_size
+        while remaining > 0:
+            data = wav.readframes(READ_FRAMES)
+            if not data:
+                break
+            data = data[:remaining]
+            remaining -= len(data)
+            if skip:
+                data = data[skip:]
+                skip = 0
+            if data:
+                yield data
+
+
+class ChapterAudio:
+    """
+    Menyusun audio satu bab dari audio per kalimat dalam urutan spine.
+    Segmen PCM disambung langsung di balik satu header WAV tanpa encode ulang.
+    """
+    def __init__(self, synthesizer, sentences, translate, lookup, voice, language):
+        self.synthesizer = synthesizer
+        self.sentences = sentences  # Kalimat sumber dalam urutan baca
+        self.translate = translate  # Callable(kalimat) -> terjemahan (boleh memanggil model)
+        self.lookup = lookup        # Callable(kalimat) -> terjemahan dari cache atau None
+        self.voice = voice
+        self.language = language
+
+    def cached_segments(self):
+        """Daftar path WAV jika seluruh bab sudah diterjemahkan dan disintesis, selain itu None."""
+        paths = []
+        for sentence in self.sentences:
+            translation = self.lookup(sentence)
+            if translation is None:
+                return None
+            key = self.synthesizer.key(translation, self.voice, self.language)
+            if not self.synthesizer.cache.has(key):
+                return None
+            paths.append(self.synthesizer.cache.path(key))
+        return paths
+
+    @staticmethod
+    def layout(paths):
+        """Menghitung parameter audio, total ukuran file, dan (path, offset, ukuran) tiap segmen."""
+        params = None
+        segments = []
+        offset = WAV_HEADER_SIZE
+        for path in paths:
+            segment_params, size = wav_params(path)
+            if params is None:
+                params = segment_params
+            elif segment_params != params:
+                logging.warning(f"Format audio {path} berbeda dari segmen pertama. Segmen dilewati.")
+                continue
+            segments.append((path, offset, size))
+            offset += size
+        return params, offset, segments
+
+    @staticmethod
+    def iter_range(params, total_size, segments, start, end):
+        """Menghasilkan byte [start, end] (inklusif) dari file WAV bab yang utuh."""
+        header = wav_header(total_size - WAV_HEADER_SIZE, *params)
+        if start < WAV_HEADER_SIZE:
+            yield header[start:min(end + 1, WAV_HEADER_SIZE)]
+        for path, offset, size in segments:
+            if offset + size <= start or offset > end:
+                continue
+            yield from iter_pcm(path, max(0, start - offset), min(size, end + 1 - offset))
+
+    def stream(self, lookahead=4):
+        """
+        Men-stream audio bab selagi kalimat diterjemahkan dan disintesis. Terjemahan
+        berjalan di thread terpisah beberapa kalimat di depan, sehingga byte pertama
+        dikirim segera setelah kalimat pertama siap. Kegagalan di tengah stream
+        dilempar ulang sehingga koneksi diputus, bukan diakhiri seperti audio lengkap.
+        """
+        futures = queue.Queue(maxsize=lookahead)
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for sentence in self.sentences:
+                    if stop.is_set():
+                        return
+                    translation = self.translate(sentence)
+                    futures.put(self.synthesizer.submit(translation, self.voice, self.language)[1])
+            except Exception as e:
+                logging.error(f"Gagal menyiapkan audio bab: {e}", exc_info=True)
+                futures.put(e)
+            finally:
+                futures.put(None)
+
+        producer = threading.Thread(target=produce, name="chapter-audio", daemon=True)
+        producer.start()
+
+        params = None
+        try:
+            while True:
+                future = futures.get()
+                if future is None:
+                    break
+                if isinstance(future, Exception):
+                    raise future
+                path = future.result()
+                segment_params, _ = wav_params(path)
+                if params is None:
+                    params = segment_params
+                    yield wav_header(None, *params)
+                elif segment_params != params:
+                    logging.warning(f"Format audio {path} berbeda dari segmen pertama. Segmen dilewati.")
+                    continue
+                yield from iter_pcm(path)
+        finally:
+            stop.set()
+            # Membebaskan producer jika sedang menunggu antrean penuh
+            while producer.is_alive():
+                try:
+                    futures.get(timeout=0.1)
+                except queue.Empty:
+                    pass
@@ -0,0 +1,155 @@
+# epub_export.py
+import os
+import copy
+import struct
+import hashlib
+import logging
+import argparse
+import zipfile
+
+from bs4 import BeautifulSoup, NavigableString, Comment, ProcessingInstruction, Doctype
+
+from translator import sentence_splitter, setup_logging
+import translation_cache as tcache
+
+XHTML_EXTENSIONS = ('.xhtml', '.html', '.htm')
+SKIPPED_TAGS = ('script', 'style')
+COPY_BLOCK_SIZE = 1024 * 1024
+LOCAL_HEADER_SIZE = 30
+DATA_DESCRIPTOR_FLAG = 0x08
+
+
+def file_sha256(path):
+    """Menghitung sha256 file secara streaming (sama dengan file_id di API)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class EpubExporter:
+    """
+    Membangun EPUB terjemahan dengan membaca arsip asli entri demi entri.
+    Hanya dokumen XHTML yang diurai dan ditulis ulang; resource lain (gambar,
+    font, CSS) disalin dalam bentuk terkompresi apa adanya tanpa dekompresi.
+    """
+    def __init__(self, translation_cache, target_language):
+        self.translation_cache = translation_cache
+        self.target_language = target_language
+        self.stats = {"documents": 0, "copied": 0, "translated": 0, "untranslated": 0}
+
+    def export(self, source_path, output_path):
+        tmp_path = f"{output_path}.tmp"
+        with zipfile.ZipFile(source_path, 'r') as zin, zipfile.ZipFile(tmp_path, 'w') as zout:
+            for info in zin.infolist():
+                if info.filename.lower().endswith(XHTML_EXTENSIONS):
+                    self._write_document(zin, zout, info)
+                else:
+                    self._copy_raw(zin, zout, info)
+        os.replace(tmp_path, output_path)
+        logging.info(
+            f"EPUB terjemahan ditulis ke {output_path}: {self.stats['documents']} dokumen ditulis ulang, "
+            f"{self.stats['copied']} resource disalin, {self.stats['translated']} kalimat diterjemahkan, "
+            f"{self.stats['untranslated']} kalimat tanpa terjemahan di cache."
+        )
+        return self.stats
+
+    def _write_document(self, zin, zout, info):
+        soup = BeautifulSoup(zin.read(info), 'xml')
+        for text_node in soup.find_all(string=True):
+            if isinstance(text_node, (Comment, ProcessingInstruction, Doctype)):
+                continue
+            if text_node.parent is not None and text_node.parent.name in SKIPPED_TAGS:
+                continue
+            if isinstance(text_node, NavigableString) and text_node.strip():
+                translated = self._translate_node(str(text_node))
+                if translated is not None:
+                    text_node.replace_with(translated)
+
+        # Teks terjemahan tidak lagi ditulis dari kanan ke kiri
+        for tag in soup.find_all(['html', 'body'], attrs={'dir': 'rtl'}):
+            tag['dir'] = 'ltr'
+
+        new_info = copy.copy(info)
+        new_info.compress_type = zipfile.ZIP_DEFLATED
+        zout.writestr(new_info, str(soup).encode('utf-8'))
+        self.stats["documents"] += 1
+
+    def _translate_node(self, text):
+        """Mengganti setiap kalimat di satu node teks. Mengembalikan None jika tidak ada yang berubah."""
+        sentences = sentence_splitter(text.strip())
+        changed = False
+        output = []
+        for sentence in sentences:
+            translation = tcache.lookup(self.translation_cache, sentence, self.target_language)
+            if translation is None:
+                # Kalimat pendek (<= 2 kata) memang tidak pernah diterjemahkan
+                if len(sentence.split()) > 2:
+                    self.stats["untranslated"] += 1
+                output.append(sentence)
+            else:
+                self.stats["translated"] += 1
+                output.append(translation)
+                changed = True
+        if not changed:
+            return None
+        leading = text[:len(text) - len(text.lstrip())]
+        trailing = text[len(text.rstrip()):]
+        return f"{leading}{' '.join(output)}{trailing}"
+
+    def _copy_raw(self, zin, zout, info):
+        """Menyalin data terkompresi satu entri tanpa dekompresi ulang."""
+        zin.fp.seek(info.header_offset)
+        header = zin.fp.read(LOCAL_HEADER_SIZE)
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        zin.fp.seek(info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length)
+
+        new_info = copy.copy(info)
+        # CRC dan ukuran sudah diketahui dari central directory, jadi ditulis langsung di header lokal
+        new_info.flag_bits &= ~DATA_DESCRIPTOR_FLAG
+        new_info.header_offset = zout.fp.tell()
+        zout.fp.write(new_info.FileHeader())
+
+        remaining = info.compress_size
+        while remaining > 0:
+            block = zin.fp.read(min(COPY_BLOCK_SIZE, remaining))
+            if not block:
+                raise zipfile.BadZipFile(f"Data entri {info.filename} terpotong.")
+            zout.fp.write(block)
+            remaining -= len(block)
+
+        zout.filelist.append(new_info)
+        zout.NameToInfo[new_info.filename] = new_info
+        zout.start_dir = zout.fp.tell()
+        zout._didModify = True
+        self.stats["copied"] += 1
+
+
+def export_translated_epub(epub_path, output_path, target_language, cache_dir="cache", book_hash=None):
+    """Mengekspor EPUB terjemahan memakai cache terjemahan buku tersebut."""
+    book_hash = book_hash or file_sha256(epub_path)
+    translation_cache = tcache.load_cache(tcache.cache_path(cache_dir, book_hash))
+    if not translation_cache:
+        logging.warning(f"Cache terjemahan untuk buku {book_hash[:10]}... kosong. EPUB akan tetap berisi teks asli.")
+    return EpubExporter(translation_cache, target_language).export(epub_path, output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a translated EPUB from the original file and its translation cache.")
+    parser.add_argument("input_path", help="Path to the source Arabic EPUB file.")
+    parser.add_argument("-lang", "--target_language", default="English", help="Target language stored in the cache (e.g., 'English', 'Indonesian').")
+    parser.add_argument("-o", "--output", help="Output EPUB path. Defaults to '<input>.<language>.epub'.")
+    parser.add_argument("--cache_dir", default="cache", help="Directory containing the translation caches.")
+    parser.add_argument("--book_hash", help="Cache ID of the book. Defaults to the sha256 of the EPUB file.")
+    parser.add_argument("--log_file", default="epub_export.log", help="File to store logs.")
+    args = parser.parse_args()
+
+    setup_logging(args.log_file)
+    base, _ = os.path.splitext(args.input_path)
+    output = args.output or f"{base}.{args.target_language.lower()}.epub"
+    export_translated_epub(args.input_path, output, args.target_language, args.cache_dir, args.book_hash)
+
+
+if __name__ == "__main__":
+    main()
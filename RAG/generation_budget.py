@@ -0,0 +1,238 @@
+# generation_budget.py
+import math
+import logging
+from collections import deque
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+# Bahasa target yang memakai aksara Latin. Entri cache lama tidak mencatat bahasa,
+# jadi rasio dari entri tersebut dipelajari per kelompok aksara.
+LATIN_BUCKET = "_latin"
+SCRIPT_LANGUAGES = ("Japanese", "Korean")
+
+
+def script_bucket(text):
+    """Menebak kelompok aksara dari teks hasil terjemahan."""
+    for ch in text:
+        code = ord(ch)
+        if 0x3040 <= code <= 0x30FF or 0x4E00 <= code <= 0x9FFF:
+            return "Japanese"
+        if 0xAC00 <= code <= 0xD7AF or 0x1100 <= code <= 0x11FF:
+            return "Korean"
+    return LATIN_BUCKET
+
+
+def language_bucket(target_language):
+    """Memetakan nama bahasa target ke kelompok aksaranya."""
+    return target_language if target_language in SCRIPT_LANGUAGES else LATIN_BUCKET
+
+
+def find_repetition(token_ids, max_period=8, min_repeats=3, min_span=12):
+    """
+    Mencari pola berulang di ujung deretan token.
+    Mengembalikan (periode, jumlah_ulang) atau None jika tidak ada loop.
+    """
+    n = len(token_ids)
+    for period in range(1, max_period + 1):
+        repeats = max(min_repeats, math.ceil(min_span / period))
+        span = period * repeats
+        if n < span:
+            continue
+        tail = token_ids[n - span:]
+        pattern = tail[:period]
+        if all(tail[i] == pattern[i % period] for i in range(period, span)):
+            # Hitung semua pengulangan, tidak hanya yang minimal
+            count = repeats
+            while n >= (count + 1) * period and token_ids[n - (count + 1) * period:n - count * period] == pattern:
+                count += 1
+            return period, count
+    return None
+
+
+def trim_padding(token_ids, special_ids):
+    """
+    Membuang token pad/EOS di ekor baris hasil generate batch. Tanpa ini ekor
+    padding dianggap pola berulang oleh strip_repetition.
+    """
+    token_ids = list(token_ids)
+    end = len(token_ids)
+    while end and token_ids[end - 1] in special_ids:
+        end -= 1
+    return token_ids[:end]
+
+
+def strip_repetition(token_ids, max_period=8, min_repeats=3, min_span=12):
+    """Membuang ekor yang berulang dan menyisakan satu salinan polanya."""
+    token_ids = list(token_ids)
+    found = find_repetition(token_ids, max_period, min_repeats, min_span)
+    if found is None:
+        return token_ids
+    period, count = found
+    return token_ids[:len(token_ids) - (count - 1) * period]
+
+
+class RepetitionStoppingCriteria(StoppingCriteria):
+    """
+    Menghentikan generasi begitu ekor output berisi pola token yang berulang
+    (mis. frasa yang sama diulang terus), alih-alih menghabiskan seluruh anggaran.
+    Baris batch yang sudah selesai (token terakhir pad/EOS) diabaikan, dan loop
+    dicatat per baris di `triggered`.
+    """
+    def __init__(self, prompt_length, special_ids=(), max_period=8, min_repeats=3, min_span=12):
+        self.prompt_length = prompt_length
+        self.special_ids = sorted({i for i in special_ids if i is not None})
+        self.max_period = max_period
+        self.min_repeats = min_repeats
+        self.min_span = min_span
+        self.triggered = None  # Tensor bool per baris (batch × beam) yang pernah terdeteksi loop
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        generated = input_ids[:, self.prompt_length:]
+        if generated.shape[1] < self.min_repeats:
+            return done
+        for period in range(1, self.max_period + 1):
+            repeats = max(self.min_repeats, math.ceil(self.min_span / period))
+            span = period * repeats
+            if generated.shape[1] < span:
+                continue
+            tail = generated[:, -span:].reshape(-1, repeats, period)
+            done |= (tail == tail[:, :1, :]).all(dim=2).all(dim=1)
+        if self.special_ids:
+            # Ekor pad/EOS dari baris yang sudah selesai bukan loop
+            finished = torch.isin(input_ids[:, -1], torch.tensor(self.special_ids, device=input_ids.device))
+            done &= ~finished
+        if self.triggered is None or self.triggered.shape != done.shape:
+            self.triggered = done.clone()
+        else:
+            self.triggered |= done
+        return done
+
+    def triggered_rows(self, batch_size):
+        """Flag loop per baris batch; beam dari baris yang sama digabung."""
+        if self.triggered is None:
+            return [False] * batch_size
+        return self.triggered.reshape(batch_size, -1).any(dim=1).tolist()
+
+
+class GenerationBudget:
+    """
+    Pengendali anggaran generasi. Batas token baru diturunkan dari jumlah token
+    sumber dan rasio panjang per bahasa yang dipelajari dari cache terjemahan,
+    lebar beam dipilih berdasarkan panjang input, dan generasi yang berulang
+    dihentikan lebih awal.
+    """
+    def __init__(self, legacy_budget=1024, min_new_tokens=32, max_new_tokens=1024,
+                 default_ratio=2.0, margin=1.3, slack=16, max_beams=1,
+                 beam_schedule=((32, 4), (96, 2)), history_size=2000):
+        self.legacy_budget = legacy_budget
+        self.min_new_tokens = min_new_tokens
+        self.max_new_tokens = max_new_tokens
+        self.default_ratio = default_ratio
+        self.margin = margin
+        self.slack = slack
+        self.max_beams = max_beams
+        # (batas_token_sumber, jumlah_beam): input yang lebih pendek boleh memakai beam lebih lebar
+        self.beam_schedule = beam_schedule
+        self.history_size = history_size
+        self.ratios = {}
+        self.total_saved = 0
+
+    # --- RASIO PANJANG PER BAHASA ---
+
+    def observe(self, target_language, source_tokens, output_tokens):
+        """Mencatat rasio panjang output/sumber dari satu terjemahan."""
+        if source_tokens <= 0 or output_tokens <= 0:
+            return
+        ratio = output_tokens / source_tokens
+        for key in {target_language, language_bucket(target_language)}:
+            self.ratios.setdefault(key, deque(maxlen=self.history_size)).append(ratio)
+
+    def ratio_for(self, target_language):
+        """Rasio persentil ke-95 untuk bahasa target, atau default jika belum ada data."""
+        for key in (target_language, language_bucket(target_language)):
+            history = self.ratios.get(key)
+            if history and len(history) >= 20:
+                ordered = sorted(history)
+                return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        return self.default_ratio
+
+    def learn(self, entries, tokenizer, sample_size=2000, batch_size=256):
+        """
+        Mempelajari rasio panjang dari entri cache (bahasa, kalimat, terjemahan).
+        Entri lama tanpa bahasa dikelompokkan berdasarkan aksara terjemahannya.
+        """
+        pairs = []
+        for language, source, translation in entries:
+            if source and translation:
+                pairs.append((language or script_bucket(translation), source, translation))
+            if len(pairs) >= sample_size:
+                break
+
+        if not pairs:
+            logging.info("Tidak ada data cache untuk mempelajari rasio panjang. Memakai rasio default.")
+            return 0
+
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            sources = tokenizer([s for _, s, _ in batch], add_special_tokens=False)["input_ids"]
+            outputs = tokenizer([t for _, _, t in batch], add_special_tokens=False)["input_ids"]
+            for (language, _, _), src_ids, out_ids in zip(batch, sources, outputs):
+                self.observe(language, len(src_ids), len(out_ids))
+
+        summary = ", ".join(f"{key}={self.ratio_for(key):.2f}" for key in sorted(self.ratios))
+        logging.info(f"Rasio panjang dipelajari dari {len(pairs)} entri cache: {summary}")
+        return len(pairs)
+
+    # --- PARAMETER GENERASI ---
+
+    def max_new_tokens_for(self, source_tokens, target_language):
+        """Batas token baru untuk satu input."""
+        cap = math.ceil(source_tokens * self.ratio_for(target_language) * self.margin) + self.slack
+        return max(self.min_new_tokens, min(self.max_new_tokens, cap))
+
+    def num_beams_for(self, source_tokens):
+        """Lebar beam berdasarkan panjang input, tidak melebihi max_beams."""
+        for limit, beams in self.beam_schedule:
+            if source_tokens <= limit:
+                return max(1, min(self.max_beams, beams))
+        return 1
+
+    def stopping_criteria(self, prompt_length, special_ids=()):
+        """
+        Membuat kriteria berhenti untuk deteksi loop. `special_ids` (pad/EOS)
+        menandai baris batch yang sudah selesai. Simpan objeknya untuk report().
+        """
+        return StoppingCriteriaList([RepetitionStoppingCriteria(prompt_length, special_ids)])
+
+    def looped_rows(self, stopping_criteria, batch_size):
+        """Flag loop per baris batch dari kriteria yang dibuat stopping_criteria()."""
+        flags = [False] * batch_size
+        for criteria in stopping_criteria or ():
+            if isinstance(criteria, RepetitionStoppingCriteria):
+                flags = [a or b for a, b in zip(flags, criteria.triggered_rows(batch_size))]
+        return flags
+
+    def report(self, target_language, source_tokens, max_new_tokens, generated_tokens,
+               stopping_criteria=None, legacy_budget=None, looped=None):
+        """
+        Mencatat statistik satu generasi (satu baris batch). Token dihitung hemat
+        hanya jika generasi akan terus berjalan dengan konfigurasi lama (loop atau
+        batas baru tercapai). Untuk batch, berikan `looped` dari looped_rows().
+        """
+        legacy_budget = self.legacy_budget if legacy_budget is None else legacy_budget
+        if looped is None:
+            looped = any(self.looped_rows(stopping_criteria, 1))
+        hit_cap = generated_tokens >= max_new_tokens
+        saved = max(0, legacy_budget - generated_tokens) if (looped or hit_cap) else 0
+        self.total_saved += saved
+        if not (looped or hit_cap):
+            # Output yang terpotong tidak mencerminkan rasio panjang yang sebenarnya
+            self.observe(target_language, source_tokens, generated_tokens)
+        logging.info(
+            f"Anggaran generasi ({target_language}): sumber={source_tokens} token, batas={max_new_tokens}, "
+            f"terpakai={generated_tokens}, loop={'ya' if looped else 'tidak'}, "
+            f"hemat={saved} token (total hemat {self.total_saved})"
+        )
+        return saved
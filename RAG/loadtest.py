@@ -0,0 +1,334 @@
+# loadtest.py
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import zipfile
+import logging
+import argparse
+import tempfile
+
+import httpx
+
+LANGUAGES = ("English", "Indonesian", "Malay", "Japanese", "Korean")
+ARABIC_WORDS = (
+    "الكتاب", "العلم", "الرحمن", "الرحيم", "قال", "النبي", "الله", "في", "من", "على", "الصلاة",
+    "الناس", "الحديث", "رسول", "الحمد", "الأرض", "السماء", "القلب", "الإيمان", "العمل",
+)
+
+
+# --- EPUB SINTETIS ---
+
+def build_synthetic_epub(path, seed, chapters=5, sentences_per_chapter=100):
+    """Membuat EPUB Arab sintetis yang valid agar pemindaian asli ikut diuji."""
+    rng = random.Random(seed)
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        zf.writestr("META-INF/container.xml", (
+            '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles></container>'
+        ))
+        manifest, spine = [], []
+        for number in range(1, chapters + 1):
+            sentences = [
+                " ".join(rng.choice(ARABIC_WORDS) for _ in range(rng.randint(4, 18))) + "."
+                for _ in range(sentences_per_chapter)
+            ]
+            zf.writestr(f"OEBPS/chapter{number}.xhtml", (
+                '<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml" dir="rtl">'
+                f'<head><title>{number}</title></head><body><p>{" ".join(sentences)}</p></body></html>'
+            ))
+            manifest.append(f'<item id="c{number}" href="chapter{number}.xhtml" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="c{number}"/>')
+        zf.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="utf-8"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            f'<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:identifier id="id">loadtest-{seed}</dc:identifier>'
+            f'<dc:title>Loadtest {seed}</dc:title><dc:language>ar</dc:language></metadata>'
+            f'<manifest>{"".join(manifest)}</manifest><spine>{"".join(spine)}</spine></package>'
+        ))
+    return path
+
+
+# --- TRANSLATOR PALSU ---
+
+def make_fake_translator(base_latency, per_token_latency):
+    """
+    Membuat kelas translator yang memakai seluruh jalur InteractiveTranslator
+    (cache, translation memory, prefetch, scheduler) tetapi mengganti model dengan
+    jeda waktu: base_latency + per_token_latency x perkiraan token keluaran.
+    """
+    from translator import InteractiveTranslator, PACKED_LINE_RE
+
+    class WhitespaceTokenizer:
+        eos_token_id = 0
+
+        def __call__(self, text, add_special_tokens=False, **kwargs):
+            if isinstance(text, str):
+                return _Encoding(list(range(len(text.split()))))
+            return _Encoding([list(range(len(t.split()))) for t in text])
+
+    class _Encoding:
+        def __init__(self, input_ids):
+            self.input_ids = input_ids
+
+    class FakeTranslator(InteractiveTranslator):
+        def load_model(self):
+            if self.tokenizer is None:
+                self.tokenizer = WhitespaceTokenizer()
+                logging.info("Translator palsu siap (tanpa model).")
+
+        def unload_model(self):
+            pass
+
+        def _generate_batch(self, messages_list, source_tokens, target_languages):
+            with self.scheduler.turn():
+                time.sleep(base_latency + per_token_latency * 1.5 * source_tokens)
+            outputs = []
+            for messages, language in zip(messages_list, target_languages):
+                prompt = messages[-1]["content"]
+                numbered = [PACKED_LINE_RE.match(line) for line in prompt.splitlines()]
+                numbered = [match for match in numbered if match]
+                if numbered:
+                    outputs.append("\n".join(f"[{m.group(1)}] {language} translation {m.group(1)}" for m in numbered))
+                else:
+                    outputs.append(f"{language} translation of {len(prompt)} characters")
+            return outputs
+
+    return FakeTranslator
+
+
+# --- PENGUMPUL METRIK ---
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Metrics:
+    def __init__(self):
+        self.samples = {}  # endpoint -> [(detik, ok)]
+        self.aborted = {}  # nomor pembaca -> alasan berhenti sebelum membaca
+
+    def record(self, endpoint, seconds, ok):
+        self.samples.setdefault(endpoint, []).append((seconds, ok))
+
+    def abort(self, number, reason):
+        logging.error(f"Pembaca {number} berhenti: {reason}")
+        self.aborted[number] = reason
+
+    def summary(self, elapsed, readers=None):
+        endpoints = {}
+        total = errors = 0
+        for endpoint, samples in self.samples.items():
+            latencies = sorted(seconds for seconds, _ in samples)
+            failed = sum(1 for _, ok in samples if not ok)
+            total += len(samples)
+            errors += failed
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": failed,
+                "mean_ms": round(1000 * sum(latencies) / len(latencies), 1),
+                "p50_ms": round(1000 * percentile(latencies, 0.50), 1),
+                "p95_ms": round(1000 * percentile(latencies, 0.95), 1),
+                "p99_ms": round(1000 * percentile(latencies, 0.99), 1),
+                "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+            }
+        return {
+            "duration_seconds": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+            "error_rate": round(errors / total, 4) if total else None,
+            "readers": readers,
+            "aborted_readers": len(self.aborted),
+            "aborted": {str(number): reason for number, reason in sorted(self.aborted.items())},
+            "endpoints": endpoints,
+        }
+
+
+# --- PEMBACA VIRTUAL ---
+
+async def timed(client, metrics, endpoint, method, url, validate=None, **kwargs):
+    """Mengirim satu request dan mencatat latensinya; `validate` memeriksa isi respons yang sukses."""
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        ok = response.status_code < 400 and (validate is None or bool(validate(response)))
+    except (httpx.HTTPError, ValueError) as e:
+        logging.warning(f"{endpoint} gagal: {e}")
+        response, ok = None, False
+    metrics.record(endpoint, time.perf_counter() - start, ok)
+    return response if ok else None
+
+
+async def reader(client, metrics, number, epub_path, args):
+    """
+    Satu pembaca: mengunggah buku lalu membaca chunk berurutan, sesekali
+    melompat ke chunk acak, dengan jeda berpikir di antara permintaan.
+    """
+    rng = random.Random(args.seed * 1000 + number)
+    with open(epub_path, 'rb') as f:
+        # Upload tanpa chunk terindeks dihitung sebagai error, bukan dilewati diam-diam
+        response = await timed(client, metrics, "/total-chunk", "POST", "/total-chunk",
+                               validate=lambda r: r.json().get("total"),
+                               files={"file": (os.path.basename(epub_path), f.read(), "application/epub+zip")})
+    if response is None:
+        metrics.abort(number, f"upload {os.path.basename(epub_path)} gagal atau tanpa chunk")
+        return
+    upload = response.json()
+    file_id, total = upload["file_id"], upload["total"]
+
+    language = LANGUAGES[number % len(LANGUAGES)] if args.mixed_languages else args.language
+    chunk = rng.randint(1, total) if args.random_start else 1
+    for _ in range(args.requests):
+        await timed(client, metrics, "/process-chunk", "POST", "/process-chunk", data={
+            "file_id": file_id, "chunk": str(chunk), "target_language": language,
+            "prefetch": str(args.prefetch),
+        })
+        if args.think_ms:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+        if rng.random() < args.random_ratio:
+            chunk = rng.randint(1, total)
+        else:
+            chunk = chunk % total + 1
+
+
+async def run(client, args, epub_paths):
+    metrics = Metrics()
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        reader(client, metrics, number, epub_paths[number % len(epub_paths)], args)
+        for number in range(args.concurrency)
+    ))
+    report = metrics.summary(time.perf_counter() - start, readers=args.concurrency)
+
+    server = {}
+    for name in ("scheduler", "prefetch"):
+        try:
+            response = await client.get(f"/{name}")
+            if response.status_code == 200:
+                server[name] = response.json()
+        except httpx.HTTPError:
+            pass
+    report["server"] = server
+    return report
+
+
+async def run_in_process(args, epub_paths):
+    """Menjalankan aplikasi FastAPI asli di proses ini (termasuk lifespan) lewat ASGITransport."""
+    if args.translator == "real":
+        os.environ["TRANSLATOR_MODEL_ID"] = args.model_id
+    os.environ.setdefault("TTS_BACKEND", "tone")
+    import main as api
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    if args.translator == "fake":
+        api.InteractiveTranslator = make_fake_translator(args.latency_ms / 1000, args.per_token_ms / 1000)
+    async with api.lifespan(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            return await run(client, args, epub_paths)
+
+
+async def run_remote(args, epub_paths):
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        return await run(client, args, epub_paths)
+
+
+def to_markdown(report, config):
+    lines = [
+        f"# Load test: {config['concurrency']} pembaca x {config['requests']} request ({config['target']})",
+        "",
+        f"Durasi {report['duration_seconds']} detik | {report['requests']} request | "
+        f"{report['throughput_rps']} req/detik | error rate {report['error_rate']}",
+        "",
+    ]
+    if report["aborted_readers"]:
+        lines += [
+            f"**{report['aborted_readers']} dari {report['readers']} pembaca berhenti sebelum membaca**; "
+            f"angka di bawah tidak mewakili beban penuh.",
+            "",
+        ]
+    lines += [
+        "| endpoint | requests | errors | mean ms | p50 ms | p95 ms | p99 ms | req/detik |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for endpoint, stats in report["endpoints"].items():
+        lines.append(
+            f"| {endpoint} | {stats['requests']} | {stats['errors']} | {stats['mean_ms']} | {stats['p50_ms']} | "
+            f"{stats['p95_ms']} | {stats['p99_ms']} | {stats['throughput_rps']} |"
+        )
+    scheduler = report["server"].get("scheduler")
+    if scheduler:
+        lines += ["", "| kelas | selesai | tunggu rata-rata (s) | tunggu p95 (s) | tunggu maks (s) |", "|---|---|---|---|---|"]
+        for name, stats in scheduler["classes"].items():
+            lines.append(f"| {name} | {stats['completed']} | {stats['wait_mean']} | {stats['wait_p95']} | {stats['wait_max']} |")
+    prefetch = report["server"].get("prefetch")
+    if prefetch:
+        lines += ["", f"Prefetch: hit rate {prefetch['hit_rate']}, dijadwalkan {prefetch['scheduled']}, dibatalkan {prefetch['cancelled']}."]
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay dashboard reading traffic against the translation API.")
+    parser.add_argument("--url", help="Base URL of a running server. Without it the app is started in-process.")
+    parser.add_argument("--translator", choices=("fake", "real"), default="fake", help="In-process translator: simulated latency or a real model.")
+    parser.add_argument("--model_id", default="Qwen/Qwen2-0.5B-Instruct", help="Model for --translator real.")
+    parser.add_argument("--latency_ms", type=float, default=150, help="Fake translator: fixed latency per generation.")
+    parser.add_argument("--per_token_ms", type=float, default=4, help="Fake translator: latency per generated token.")
+    parser.add_argument("--epub", nargs="*", default=[], help="EPUB files to upload. Defaults to synthetic books.")
+    parser.add_argument("--books", type=int, default=4, help="Number of synthetic books when --epub is not given.")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Number of concurrent readers.")
+    parser.add_argument("-n", "--requests", type=int, default=25, help="/process-chunk calls per reader.")
+    parser.add_argument("--random_ratio", type=float, default=0.1, help="Probability of jumping to a random chunk.")
+    parser.add_argument("--random_start", action="store_true", help="Start each reader at a random chunk.")
+    parser.add_argument("--think_ms", type=float, default=0, help="Mean think time between requests.")
+    parser.add_argument("--prefetch", type=int, default=4, help="Prefetch depth sent with each request.")
+    parser.add_argument("--language", default="Indonesian", help="Target language.")
+    parser.add_argument("--mixed_languages", action="store_true", help="Spread readers over all target languages.")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-request timeout in seconds.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Working directory for the in-process app (cache, temp). Defaults to a new temp dir.")
+    parser.add_argument("--json", dest="json_path", help="Write the JSON report to this path.")
+    parser.add_argument("--markdown", dest="markdown_path", help="Write the Markdown report to this path.")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    epub_paths = [os.path.abspath(path) for path in args.epub]
+    # Path keluaran dibuat absolut sebelum pindah ke direktori kerja aplikasi
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    markdown_path = os.path.abspath(args.markdown_path) if args.markdown_path else None
+    if not epub_paths:
+        book_dir = tempfile.mkdtemp(prefix="loadtest-books-")
+        epub_paths = [build_synthetic_epub(os.path.join(book_dir, f"book{i}.epub"), args.seed + i) for i in range(args.books)]
+
+    if args.url:
+        target = args.url
+        report = asyncio.run(run_remote(args, epub_paths))
+    else:
+        target = f"in-process, translator {args.translator}"
+        # Aplikasi memakai path relatif (cache/, temp/), jadi dijalankan di direktori kerja terpisah
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        os.chdir(args.workdir or tempfile.mkdtemp(prefix="loadtest-"))
+        report = asyncio.run(run_in_process(args, epub_paths))
+
+    config = {key: value for key, value in vars(args).items() if key not in ("json_path", "markdown_path", "verbose")}
+    config.update(target=target, books=len(epub_paths))
+    report["config"] = config
+    markdown = to_markdown(report, config)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if markdown_path:
+        with open(markdown_path, 'w', encoding='utf-8') as f:
+            f.write(markdown)
+    print(markdown)
+    if report["aborted_readers"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
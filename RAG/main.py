@@ -1,13 +1,35 @@
 # main.py
 import os
+import re
+import json
 import uuid
+import time
+import asyncio
 import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
 from enum import Enum
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, status
+from typing import List
+from itertools import chain
+from fastapi import FastAPI, UploadFile, File, Form, Query, Request, HTTPException, status
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from translator import InteractiveTranslator, setup_logging
+from epub_export import export_translated_epub
+from audio_synthesis import AudioSynthesizer, AudioCache, UnsupportedLanguage, create_tts_backend
+from chapter_audio import ChapterAudio
+from prefetch import Prefetcher
+from book_scan import BookScan
+from memory_manager import MemoryManager, MemoryBudgetExceeded, strings_size
+from scheduler import GenerationScheduler, scheduling, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, PRIORITY_BULK
+import translation_cache as tcache
+from model_registry import (
+    GB, ModelRegistry, ModelSpec, Seq2SeqBackend, PromptCausalBackend, translate_cached,
+    TIER_INTERACTIVE, TIER_BULK, TIER_QUALITY
+)
 
 # --- KONFIGURASI DAN STATE GLOBAL ---
 
@@ -18,12 +40,140 @@ setup_logging('api_translation.log')
 # Ini penting agar model hanya dimuat sekali saat startup.
 state = {}
 
+# Konfigurasi registry model
+DEFAULT_MODEL = "qwen2-1.5b"
+ALL_LANGUAGES = ("English", "Indonesian", "Malay", "Japanese", "Korean")
+MODEL_MEMORY_BUDGET_GB = float(os.environ.get("MODEL_MEMORY_BUDGET_GB", "16"))
+MODEL_IDLE_TIMEOUT = int(os.environ.get("MODEL_IDLE_TIMEOUT", "900"))
+MARIAN_MODEL_PATH = os.environ.get(
+    "MARIAN_MODEL_PATH",
+    "fine_tuned_model" if os.path.isdir("fine_tuned_model") else "Helsinki-NLP/opus-mt-ar-en"
+)
+
+# Konfigurasi tahap sintesis audio ("mms" = model TTS per bahasa, "tone" = pengganti lokal untuk pengujian)
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "mms")
+# Model TTS tambahan/pengganti per bahasa dalam JSON, mis. {"Japanese": "<model text-to-speech>"}
+TTS_MODELS = json.loads(os.environ.get("TTS_MODELS", "{}"))
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", "2"))
+
+# Jumlah chunk berikutnya yang diterjemahkan di latar belakang selagi pengguna membaca
+PREFETCH_DEPTH = int(os.environ.get("PREFETCH_DEPTH", "4"))
+
+# Batas endpoint /chunks dan ukuran paket untuk menerjemahkan chunk yang belum ada di cache
+MAX_RANGE_COUNT = 200
+BULK_PACK_SIZE = int(os.environ.get("BULK_PACK_SIZE", "4"))
+
+# Anggaran memori proses (RSS) dan akselerator; kosong = 80% RAM / 90% memori GPU
+MEMORY_RSS_BUDGET_GB = float(os.environ.get("MEMORY_RSS_BUDGET_GB", "0"))
+MEMORY_ACCELERATOR_BUDGET_GB = float(os.environ.get("MEMORY_ACCELERATOR_BUDGET_GB", "0"))
+# Buku yang tidak dibaca selama ini boleh dilepas dari memori saat RSS melewati anggaran
+BOOK_IDLE_SECONDS = int(os.environ.get("BOOK_IDLE_SECONDS", "1800"))
+
+# Pemindaian EPUB berjalan di latar belakang; /total-chunk menunggu paling lama
+# SCAN_READY_TIMEOUT detik hingga bab pertama terindeks
+SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS", "2"))
+SCAN_READY_TIMEOUT = float(os.environ.get("SCAN_READY_TIMEOUT", "10"))
+
 # Membuat direktori yang diperlukan jika belum ada
 os.makedirs("temp", exist_ok=True)
 os.makedirs("cache", exist_ok=True)
 
 # --- LIFESPAN MANAGER UNTUK MEMUAT MODEL SAAT STARTUP ---
 
+async def unload_idle_models(registry, interval=60):
+    """Tugas latar belakang yang membongkar model idle agar RAM kembali tersedia."""
+    while True:
+        await asyncio.sleep(interval)
+        await run_in_threadpool(registry.unload_idle)
+
+async def watch_memory(memory_manager, interval=30):
+    """Tugas latar belakang yang memeriksa anggaran memori secara berkala."""
+    while True:
+        await asyncio.sleep(interval)
+        await run_in_threadpool(memory_manager.check)
+
+def touch_book(file_id):
+    """Mencatat waktu akses terakhir buku untuk penentuan eviksi memori."""
+    state['book_access'][file_id] = time.monotonic()
+
+def scan_complete(file_id):
+    scan = state['scans'].get(file_id)
+    return scan is None or scan.complete
+
+def require_indexed(file_id, chunk, total_chunks):
+    """Memvalidasi nomor chunk terhadap chunk yang sudah terindeks."""
+    if 1 <= chunk <= total_chunks:
+        return
+    if chunk > total_chunks and not scan_complete(file_id):
+        raise HTTPException(
+            status_code=status.HTTP_425_TOO_EARLY,
+            detail=f"Chunk {chunk} belum terindeks ({total_chunks} chunk sejauh ini). Pantau /scan-status lalu coba lagi."
+        )
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Nomor chunk tidak valid. Harap masukkan angka antara 1 dan {total_chunks}."
+    )
+
+def require_tts_language(language):
+    """Menolak permintaan audio untuk bahasa tanpa model TTS dengan 400, bukan 500."""
+    try:
+        state['audio'].require_language(language)
+    except UnsupportedLanguage as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+def book_caches_size():
+    return sum(strings_size(chunks) for chunks in list(state['chunk_cache'].values()))
+
+def evict_idle_books():
+    """
+    Melepas daftar chunk dan bab dari buku yang tidak dibaca lebih lama dari
+    BOOK_IDLE_SECONDS. Buku yang sedang dibaca tidak pernah dilepas. File EPUB di
+    temp/ tetap ada; pengguna cukup mengunggah ulang lewat /total-chunk.
+    """
+    access = state['book_access']
+    now = time.monotonic()
+    # Buku yang masih dipindai tidak dilepas agar nomor chunk-nya tetap konsisten
+    victims = [
+        file_id for file_id in list(state['chunk_cache'])
+        if scan_complete(file_id) and now - access.get(file_id, 0) > BOOK_IDLE_SECONDS
+    ]
+    freed = 0
+    for file_id in victims:
+        freed += strings_size(state['chunk_cache'].pop(file_id, ()))
+        state['chapter_cache'].pop(file_id, None)
+        state['scans'].pop(file_id, None)
+        state['prefetcher'].forget(file_id)
+        access.pop(file_id, None)
+    if victims:
+        logging.warning(f"{len(victims)} buku dilepas dari memori karena RSS melewati anggaran.")
+    return freed
+
+def prefetch_translate(file_id, target_language, chunk, model_name):
+    """Menerjemahkan satu chunk untuk prefetch; hasilnya hanya masuk ke cache terjemahan."""
+    with scheduling(PRIORITY_PREFETCH, file_id), state['registry'].lease(model_name) as translator:
+        if translator is state['translator']:
+            return translator.get_single_translation(chunk, target_language, file_id)
+        return translate_cached(translator, chunk, target_language, "cache", file_id, model=model_name)
+
+def cached_chunks(file_id, target_language, chunks):
+    """Mengembalikan himpunan chunk yang sudah ada di cache terjemahan buku."""
+    translation_cache = tcache.load_cache(tcache.cache_path("cache", file_id))
+    return {chunk for chunk in chunks if tcache.lookup(translation_cache, chunk, target_language) is not None}
+
+def translate_range_misses(file_id, target_language, chunks):
+    """Menerjemahkan chunk yang belum ada di cache dalam paket, dengan prioritas bulk."""
+    try:
+        with scheduling(PRIORITY_BULK, file_id), state['registry'].lease(DEFAULT_MODEL) as translator:
+            translator.get_packed_translations(chunks, target_language, file_id, pack_size=BULK_PACK_SIZE)
+    except Exception as e:
+        logging.error(f"Gagal menerjemahkan rentang chunk untuk file {file_id[:10]}...: {e}", exc_info=True)
+        # Mengubah ETag /chunks agar klien yang polling menerima 200 dan chunk yang gagal dijadwalkan ulang
+        failures = state['bulk_failures']
+        failures[file_id] = failures.get(file_id, 0) + 1
+    finally:
+        for chunk in chunks:
+            state['bulk_pending'].discard((file_id, target_language, chunk))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -33,25 +183,97 @@ async def lifespan(app: FastAPI):
     logging.info("Server startup: Memulai proses pemuatan model...")
     
     # Konfigurasi model (bisa dipindahkan ke file config jika perlu)
-    model_id = "Qwen/Qwen2-1.5B-Instruct"
+    model_id = os.environ.get("TRANSLATOR_MODEL_ID", "Qwen/Qwen2-1.5B-Instruct")
     
+    # Satu scheduler untuk semua model: generasi interaktif menyalip prefetch dan pekerjaan massal
+    scheduler = GenerationScheduler()
+    state['scheduler'] = scheduler
+
+    # Pembersihan memori hanya saat anggaran terlewati, bukan setelah setiap generasi
+    memory_manager = MemoryManager(
+        rss_budget_bytes=int(MEMORY_RSS_BUDGET_GB * GB) or None,
+        accelerator_budget_bytes=int(MEMORY_ACCELERATOR_BUDGET_GB * GB) or None
+    )
+    state['memory'] = memory_manager
+
     # Inisialisasi translator dan simpan di state global
-    state['translator'] = InteractiveTranslator(model_id=model_id, cache_dir="cache")
-    state['translator'].load_model() # Memuat model dan tokenizer
+    state['translator'] = InteractiveTranslator(
+        model_id=model_id, cache_dir="cache", scheduler=scheduler, memory_manager=memory_manager
+    )
+
+    # Registry memuat model secara lazy dan membongkar model yang lama tidak dipakai
+    registry = ModelRegistry(
+        memory_budget_bytes=int(MODEL_MEMORY_BUDGET_GB * GB), idle_timeout=MODEL_IDLE_TIMEOUT, pinned=(DEFAULT_MODEL,)
+    )
+    registry.register(ModelSpec(
+        DEFAULT_MODEL, lambda: state['translator'], ALL_LANGUAGES,
+        tiers=(TIER_INTERACTIVE, TIER_BULK, TIER_QUALITY), memory_bytes=int(1.5 * GB), priority=1
+    ))
+    registry.register(ModelSpec(
+        "opus-mt-ar-en", lambda: Seq2SeqBackend(MARIAN_MODEL_PATH, scheduler=scheduler), ("English",),
+        tiers=(TIER_BULK,), memory_bytes=int(0.35 * GB), priority=0
+    ))
+    registry.register(ModelSpec(
+        "bloomz-7b1-mt", lambda: PromptCausalBackend(
+            "bigscience/bloomz-7b1-mt", cache_dir="./model_cache/bloomz-7b1-mt",
+            dtype=os.environ.get("BLOOMZ_DTYPE"), max_cpu_memory=os.environ.get("BLOOMZ_MAX_CPU_MEMORY") or None,
+            offload_dir=os.environ.get("BLOOMZ_OFFLOAD_DIR") or None, scheduler=scheduler
+        ),
+        ALL_LANGUAGES, tiers=(TIER_QUALITY,), memory_bytes=15 * GB, priority=0
+    ))
+    state['registry'] = registry
+
+    # Sintesis audio per kalimat berjalan di thread pool terpisah dari terjemahan
+    state['audio'] = AudioSynthesizer(create_tts_backend(TTS_BACKEND, TTS_MODELS), AudioCache("audio_cache"), max_workers=TTS_WORKERS)
+    state['prefetcher'] = Prefetcher(
+        prefetch_translate, cached_chunks, depth=PREFETCH_DEPTH, idle_timeout=BOOK_IDLE_SECONDS
+    )
+    # Chunk yang diminta lewat /chunks tetapi belum diterjemahkan; satu thread agar antre di scheduler sebagai bulk
+    state['bulk_executor'] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk")
+    state['bulk_pending'] = set()
+    state['bulk_failures'] = {}  # file_id -> jumlah penerjemahan bulk yang gagal (bagian dari ETag /chunks)
+    state['scan_executor'] = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="scan")
+    registry.get(DEFAULT_MODEL) # Memuat model dan tokenizer
+    idle_task = asyncio.create_task(unload_idle_models(registry))
+    memory_task = asyncio.create_task(watch_memory(memory_manager))
     
-    # Cache untuk menyimpan chunk yang sudah dipindai dari file
+    # Cache untuk menyimpan chunk yang sudah dipindai dari file (bertambah selama pemindaian)
     # Key: hash file, Value: list of chunks
     state['chunk_cache'] = {}
     
+    # Cache untuk menyimpan daftar bab (urutan spine) beserta indeks chunk-nya
+    # Key: hash file, Value: list of {"name", "chunks"}
+    state['chapter_cache'] = {}
+
+    # Status pemindaian latar belakang per file
+    # Key: hash file, Value: BookScan
+    state['scans'] = {}
+    
     # Cache untuk menyimpan path file sementara
     # Key: hash file, Value: path file
     state['file_path_cache'] = {}
+
+    # Waktu akses terakhir per buku; buku yang lama tidak dibaca dilepas lebih dulu
+    state['book_access'] = {}
+
+    # Komponen yang dilaporkan di /memory, dalam urutan eviksi
+    memory_manager.register("book_chunks", book_caches_size, evict_idle_books)
+    memory_manager.register(
+        "models", registry.used_bytes, lambda: registry.evict_unused(keep=(DEFAULT_MODEL,))
+    )
+    memory_manager.register("translation_memory", state['translator'].memory.approximate_bytes)
     
     logging.info("Model berhasil dimuat. Server siap menerima permintaan.")
     
     yield # Aplikasi berjalan di sini
     
     # Kode setelah yield akan dieksekusi saat shutdown
+    idle_task.cancel()
+    memory_task.cancel()
+    state['prefetcher'].shutdown()
+    state['bulk_executor'].shutdown(wait=False, cancel_futures=True)
+    state['scan_executor'].shutdown(wait=False, cancel_futures=True)
+    state['audio'].shutdown()
     logging.info("Server shutdown.")
     state.clear()
 
@@ -74,6 +296,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Respons besar (mis. /chunks) dikompresi jika klien mendukung gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Enum untuk bahasa target agar input lebih terstruktur
 class TargetLanguage(str, Enum):
     english = "English"
@@ -82,26 +307,49 @@ class TargetLanguage(str, Enum):
     japanese = "Japanese"
     korean = "Korean"
 
+# Enum untuk tingkat kualitas yang menentukan model mana yang dipakai
+class QualityTier(str, Enum):
+    interactive = TIER_INTERACTIVE
+    bulk = TIER_BULK
+    quality = TIER_QUALITY
+
+# Enum untuk kelas prioritas generasi (klien massal sebaiknya memakai "bulk")
+class SchedulingClass(str, Enum):
+    interactive = PRIORITY_INTERACTIVE
+    bulk = PRIORITY_BULK
+
 # --- ENDPOINTS API ---
 
 @app.post("/total-chunk", summary="Menganalisis EPUB dan Mendapatkan Jumlah Chunk")
 async def get_total_chunks(file: UploadFile = File(..., description="File EPUB yang akan dianalisis.")):
     """
-    Endpoint ini menerima file EPUB, memindainya untuk mengekstrak semua kalimat
-    unik (chunk), dan mengembalikan jumlah total chunk yang ditemukan.
+    Endpoint ini menerima file EPUB dan mulai memindainya di latar belakang untuk
+    mengekstrak semua kalimat unik (chunk) dalam urutan baca. Respons dikirim segera
+    setelah bab pertama terindeks: `total` adalah jumlah chunk yang sudah terindeks
+    dan `scan_complete` menandakan pemindaian selesai. Pantau /scan-status untuk
+    jumlah yang terus bertambah; chunk yang sudah terindeks bisa langsung diterjemahkan.
 
     Proses ini di-cache berdasarkan konten file. Jika file yang sama diunggah lagi,
     hasil akan dikembalikan dari cache tanpa memindai ulang.
     """
     try:
+        # Tolak upload baru jika memori tidak cukup walau sudah dibersihkan
+        await run_in_threadpool(state['memory'].admit_upload, file.size or 0)
         contents = await file.read()
         file_hash = hashlib.sha256(contents).hexdigest()
 
-        # Cek apakah hasil scan untuk file ini sudah ada di cache
+        # Cek apakah file ini sudah (atau sedang) dipindai
         if file_hash in state['chunk_cache']:
+            touch_book(file_hash)
             logging.info(f"Cache hit untuk file hash: {file_hash[:10]}...")
-            total_chunks = len(state['chunk_cache'][file_hash])
-            return {"total": total_chunks, "file_id": file_hash}
+            chunks = state['chunk_cache'][file_hash]
+            scan = state['scans'].get(file_hash)
+            if scan is not None:
+                # Upload kedua selagi pemindaian berjalan: tunggu bab pertama seperti upload pertama
+                await run_in_threadpool(scan.wait_ready, SCAN_READY_TIMEOUT)
+                if scan.complete and not scan.chunks and scan.error:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"EPUB tidak dapat dibaca: {scan.error}")
+            return {"total": len(chunks), "file_id": file_hash, "scan_complete": scan_complete(file_hash)}
 
         logging.info(f"Cache miss. Memproses file baru dengan hash: {file_hash[:10]}...")
         
@@ -111,26 +359,59 @@ async def get_total_chunks(file: UploadFile = File(..., description="File EPUB y
         with open(temp_filepath, "wb") as f:
             f.write(contents)
 
-        # Pindai file untuk mendapatkan semua chunk
-        all_chunks = state['translator'].scan_and_get_chunks(epub_path=temp_filepath)
-        
-        # Simpan hasil scan dan path file ke cache
-        state['chunk_cache'][file_hash] = all_chunks
+        # Pindai file di latar belakang; list chunk dan bab bertambah selama pemindaian
+        scan = BookScan(temp_filepath)
+        state['scans'][file_hash] = scan
+        state['chunk_cache'][file_hash] = scan.chunks
+        state['chapter_cache'][file_hash] = scan.chapters
         state['file_path_cache'][file_hash] = temp_filepath
+        touch_book(file_hash)
+        state['scan_executor'].submit(scan.run)
 
-        logging.info(f"File berhasil dipindai. Ditemukan {len(all_chunks)} chunk.")
+        await run_in_threadpool(scan.wait_ready, SCAN_READY_TIMEOUT)
+        if scan.complete and not scan.chunks and scan.error:
+            # File rusak atau bukan EPUB: jangan simpan hasil kosong di cache
+            for cache in ('scans', 'chunk_cache', 'chapter_cache', 'file_path_cache'):
+                state[cache].pop(file_hash, None)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"EPUB tidak dapat dibaca: {scan.error}")
+
+        logging.info(f"{len(scan.chunks)} chunk terindeks sejauh ini (selesai: {scan.complete}).")
         
-        return {"total": len(all_chunks), "file_id": file_hash}
+        return {"total": len(scan.chunks), "file_id": file_hash, "scan_complete": scan.complete}
 
+    except HTTPException:
+        raise
+    except MemoryBudgetExceeded as e:
+        logging.warning(f"Upload ditolak: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         logging.error(f"Error di /total-chunk: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+@app.get("/scan-status", summary="Kemajuan Pemindaian EPUB")
+def get_scan_status(file_id: str):
+    """Menampilkan jumlah chunk yang sudah terindeks dan apakah pemindaian sudah selesai."""
+    if file_id not in state['chunk_cache']:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File ID tidak ditemukan. Harap unggah file melalui /total-chunk terlebih dahulu."
+        )
+    scan = state['scans'].get(file_id)
+    if scan is None:
+        return {"file_id": file_id, "total": len(state['chunk_cache'][file_id]), "scan_complete": True}
+    return {"file_id": file_id, **scan.status()}
+
 @app.post("/process-chunk", summary="Menerjemahkan Satu Chunk Spesifik")
 async def process_chunk(
     file_id: str = Form(..., description="ID unik file yang didapat dari endpoint /total-chunk."),
     chunk: int = Form(..., gt=0, description="Nomor chunk yang akan diterjemahkan (dimulai dari 1)."),
-    target_language: TargetLanguage = Form(TargetLanguage.indonesian, description="Bahasa target terjemahan.")
+    target_language: TargetLanguage = Form(TargetLanguage.indonesian, description="Bahasa target terjemahan."),
+    pack_size: int = Form(1, ge=1, le=16, description="Jumlah kalimat berurutan yang diterjemahkan dalam satu prompt (1 = tanpa paket)."),
+    tier: QualityTier = Form(QualityTier.interactive, description="Tingkat kualitas yang menentukan model penerjemah."),
+    audio: bool = Form(False, description="Jadwalkan sintesis suara untuk hasil terjemahan."),
+    voice: str = Form("default", description="Nama suara untuk sintesis audio."),
+    prefetch: int = Form(PREFETCH_DEPTH, ge=0, le=32, description="Jumlah chunk berikutnya yang diterjemahkan di latar belakang (0 = nonaktif)."),
+    priority: SchedulingClass = Form(SchedulingClass.interactive, description="Kelas prioritas generasi.")
 ):
     """
     Endpoint ini menerjemahkan satu chunk (kalimat) dari file yang sudah diproses sebelumnya.
@@ -146,31 +427,339 @@ async def process_chunk(
 
         all_chunks = state['chunk_cache'][file_id]
         total_chunks = len(all_chunks)
+        touch_book(file_id)
 
         # Validasi nomor chunk
-        if not (1 <= chunk <= total_chunks):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Nomor chunk tidak valid. Harap masukkan angka antara 1 dan {total_chunks}."
-            )
+        require_indexed(file_id, chunk, total_chunks)
+        if audio:
+            require_tts_language(target_language.value)
         
         chunk_to_translate = all_chunks[chunk - 1]
         
-        logging.info(f"Menerjemahkan chunk #{chunk} dari file {file_id[:10]}... ke {target_language.value}")
+        model_name = await run_in_threadpool(state['registry'].route, target_language.value, tier.value)
+        logging.info(f"Menerjemahkan chunk #{chunk} dari file {file_id[:10]}... ke {target_language.value} dengan {model_name}")
         
-        # Panggil fungsi terjemahan dari instance global
-        translated_text = state['translator'].get_single_translation(
-            chunk_to_translate=chunk_to_translate,
-            target_language=target_language.value,
-            book_hash=file_id # Menggunakan file_id sebagai ID unik untuk cache terjemahan
-        )
+        # Status prefetch (hit/late/miss) ditentukan saat request tiba, sebelum menerjemahkan
+        pending_prefetch = state['prefetcher'].on_request(file_id, target_language.value, chunk) if prefetch else None
+
+        def translate():
+            # Berjalan di thread pool agar event loop tetap melayani request lain selama menunggu giliran
+            if pending_prefetch is not None:
+                # Prefetch sedang menerjemahkan chunk ini; tunggu lalu baca hasilnya dari cache
+                pending_prefetch.wait()
+            with scheduling(priority.value, file_id), state['registry'].lease(model_name) as translator:
+                if translator is not state['translator']:
+                    return translate_cached(
+                        translator, chunk_to_translate, target_language.value, "cache", file_id, model=model_name
+                    )
+                if pack_size > 1:
+                    # Kalimat berikutnya ikut diterjemahkan dalam satu prompt dan masuk cache
+                    return translator.get_packed_translations(
+                        chunks=all_chunks[chunk - 1:chunk - 1 + pack_size],
+                        target_language=target_language.value,
+                        book_hash=file_id,
+                        pack_size=pack_size
+                    )[0]
+                return translator.get_single_translation(
+                    chunk_to_translate=chunk_to_translate,
+                    target_language=target_language.value,
+                    book_hash=file_id # Menggunakan file_id sebagai ID unik untuk cache terjemahan
+                )
+
+        translated_text = await run_in_threadpool(translate)
+
+        if prefetch:
+            state['prefetcher'].on_access(file_id, target_language.value, chunk, all_chunks, model_name, depth=prefetch)
         
-        return {"output": translated_text, "original": chunk_to_translate, "chunk_number": chunk}
+        response = {"output": translated_text, "original": chunk_to_translate, "chunk_number": chunk, "model": model_name}
+        if audio:
+            # Sintesis berjalan di latar belakang; ambil hasilnya lewat /audio/{audio_id}
+            response["audio_id"], _ = state['audio'].submit(translated_text, voice, target_language.value)
+        return response
 
+    except HTTPException:
+        raise
+    except MemoryError as e:
+        # Anggaran memori model penuh: sementara, klien boleh mencoba lagi
+        logging.warning(f"/process-chunk ditolak: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         logging.error(f"Error di /process-chunk: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+@app.post("/process-chunk-multi", summary="Menerjemahkan Satu Chunk ke Beberapa Bahasa Sekaligus")
+async def process_chunk_multi(
+    file_id: str = Form(..., description="ID unik file yang didapat dari endpoint /total-chunk."),
+    chunk: int = Form(..., gt=0, description="Nomor chunk yang akan diterjemahkan (dimulai dari 1)."),
+    target_languages: List[TargetLanguage] = Form(..., description="Daftar bahasa target terjemahan."),
+    priority: SchedulingClass = Form(SchedulingClass.interactive, description="Kelas prioritas generasi.")
+):
+    """
+    Endpoint ini menerjemahkan satu chunk ke beberapa bahasa target dalam satu
+    batch generasi, sehingga teks Arab yang sama tidak diproses ulang per bahasa.
+    """
+    try:
+        if file_id not in state['chunk_cache']:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="File ID tidak ditemukan. Harap unggah file melalui /total-chunk terlebih dahulu."
+            )
+
+        all_chunks = state['chunk_cache'][file_id]
+        total_chunks = len(all_chunks)
+        touch_book(file_id)
+
+        require_indexed(file_id, chunk, total_chunks)
+
+        chunk_to_translate = all_chunks[chunk - 1]
+        languages = [language.value for language in target_languages]
+
+        logging.info(f"Menerjemahkan chunk #{chunk} dari file {file_id[:10]}... ke {', '.join(languages)}")
+
+        def translate():
+            with scheduling(priority.value, file_id), state['registry'].lease(DEFAULT_MODEL) as translator:
+                return translator.get_multi_translation(
+                    chunk_to_translate=chunk_to_translate,
+                    target_languages=languages,
+                    book_hash=file_id
+                )
+
+        outputs = await run_in_threadpool(translate)
+
+        return {"outputs": outputs, "original": chunk_to_translate, "chunk_number": chunk}
+
+    except HTTPException:
+        raise
+    except MemoryError as e:
+        logging.warning(f"/process-chunk-multi ditolak: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error di /process-chunk-multi: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+@app.get("/chunks", summary="Mengambil Banyak Terjemahan Sekaligus")
+def get_chunk_range(
+    request: Request,
+    file_id: str,
+    start: int = Query(1, gt=0, description="Nomor chunk pertama (dimulai dari 1)."),
+    count: int = Query(50, gt=0, le=MAX_RANGE_COUNT, description="Jumlah chunk yang diambil."),
+    target_language: TargetLanguage = TargetLanguage.indonesian,
+    include_original: bool = Query(False, description="Sertakan teks Arab asli di setiap item.")
+):
+    """
+    Mengembalikan terjemahan dari cache untuk rentang chunk dalam satu respons.
+    Chunk yang belum diterjemahkan bernilai null dan dijadwalkan untuk diterjemahkan
+    di latar belakang. Mendukung If-None-Match: ETag berubah setiap kali cache buku berubah.
+    """
+    all_chunks = state['chunk_cache'].get(file_id)
+    if all_chunks is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File ID tidak ditemukan. Harap unggah file melalui /total-chunk terlebih dahulu."
+        )
+    total_chunks = len(all_chunks)
+    touch_book(file_id)
+    require_indexed(file_id, start, total_chunks)
+    end = min(total_chunks, start + count - 1)
+    language = target_language.value
+
+    # ETag dihitung dari versi file cache tanpa membaca isinya, ditambah jumlah kegagalan
+    # bulk agar chunk yang gagal diterjemahkan tidak tertahan di balik 304 selamanya
+    cache_path = tcache.cache_path("cache", file_id)
+    version = tcache.cache_version(cache_path)
+    etag = '"' + hashlib.sha256(
+        f"{file_id}|{language}|{start}|{end}|{total_chunks}|{int(include_original)}|{version}|"
+        f"{state['bulk_failures'].get(file_id, 0)}".encode()
+    ).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    translation_cache = tcache.load_cache(cache_path)
+    items, missing = [], []
+    for number in range(start, end + 1):
+        chunk = all_chunks[number - 1]
+        translation = tcache.lookup(translation_cache, chunk, language)
+        item = {"chunk": number, "output": translation}
+        if include_original:
+            item["original"] = chunk
+        items.append(item)
+        if translation is None:
+            missing.append(number)
+
+    pending = state['bulk_pending']
+    new = [all_chunks[number - 1] for number in missing if (file_id, language, all_chunks[number - 1]) not in pending]
+    if new:
+        pending.update((file_id, language, chunk) for chunk in new)
+        state['bulk_executor'].submit(translate_range_misses, file_id, language, new)
+        logging.info(f"{len(new)} chunk dari file {file_id[:10]}... dijadwalkan untuk diterjemahkan ({language}).")
+
+    return JSONResponse(
+        content={
+            "file_id": file_id, "target_language": language, "start": start, "end": end,
+            "total": total_chunks, "scan_complete": scan_complete(file_id), "items": items, "missing": missing,
+        },
+        headers=headers
+    )
+
+@app.get("/export-epub", summary="Mengunduh EPUB Terjemahan")
+def export_epub(file_id: str, target_language: TargetLanguage = TargetLanguage.indonesian):
+    """
+    Membangun EPUB terjemahan dari file asli dan cache terjemahannya. Kalimat yang
+    belum diterjemahkan tetap berisi teks asli. Resource selain XHTML disalin apa adanya.
+    """
+    if file_id not in state['file_path_cache']:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File ID tidak ditemukan. Harap unggah file melalui /total-chunk terlebih dahulu."
+        )
+    try:
+        output_path = os.path.join("temp", f"{file_id}.{target_language.value.lower()}.epub")
+        export_translated_epub(
+            state['file_path_cache'][file_id], output_path, target_language.value,
+            cache_dir="cache", book_hash=file_id
+        )
+        return FileResponse(
+            output_path, media_type="application/epub+zip",
+            filename=f"{file_id[:10]}.{target_language.value.lower()}.epub"
+        )
+    except Exception as e:
+        logging.error(f"Error di /export-epub: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+@app.get("/audio/{audio_id}", summary="Mengunduh Audio Satu Kalimat")
+def get_audio(audio_id: str):
+    """Mengembalikan file WAV untuk satu kalimat, atau status 202 jika sintesis masih berjalan."""
+    audio_cache = state['audio'].cache
+    if len(audio_id) == 64 and all(c in "0123456789abcdef" for c in audio_id) and audio_cache.has(audio_id):
+        return FileResponse(audio_cache.path(audio_id), media_type="audio/wav")
+    if state['audio'].is_pending(audio_id):
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"status": "pending"})
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Audio tidak ditemukan.")
+
+@app.get("/chapters", summary="Daftar Bab dalam Urutan Baca")
+def get_chapters(file_id: str):
+    """Menampilkan bab (dokumen spine) beserta jumlah kalimat di setiap bab. Selama pemindaian berjalan, daftar ini terus bertambah."""
+    if file_id not in state['chapter_cache']:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File ID tidak ditemukan. Harap unggah file melalui /total-chunk terlebih dahulu."
+        )
+    chapters = state['chapter_cache'][file_id]
+    return {
+        "file_id": file_id,
+        "scan_complete": scan_complete(file_id),
+        "chapters": [
+            {"chapter": i, "name": chapter["name"], "total": len(chapter["chunks"])}
+            for i, chapter in enumerate(chapters, start=1)
+        ]
+    }
+
+@app.get("/chapter-audio", summary="Streaming Audio Satu Bab")
+def get_chapter_audio(
+    request: Request,
+    file_id: str,
+    chapter: int = Query(..., gt=0, description="Nomor bab (dimulai dari 1) sesuai /chapters."),
+    target_language: TargetLanguage = TargetLanguage.indonesian,
+    voice: str = "default"
+):
+    """
+    Mengirim audio satu bab sebagai WAV. Jika bab belum lengkap, audio di-stream
+    selagi kalimat diterjemahkan dan disintesis. Jika sudah lengkap, ukuran file
+    diketahui dan permintaan HTTP Range didukung.
+    """
+    chapters = state['chapter_cache'].get(file_id)
+    if chapters is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File ID tidak ditemukan. Harap unggah file melalui /total-chunk terlebih dahulu."
+        )
+    if not (1 <= chapter <= len(chapters)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Nomor bab tidak valid. Harap masukkan angka antara 1 dan {len(chapters)}."
+        )
+
+    language = target_language.value
+    require_tts_language(language)
+    all_chunks = state['chunk_cache'][file_id]
+    sentences = [all_chunks[i] for i in chapters[chapter - 1]["chunks"]]
+    translation_cache = tcache.load_cache(tcache.cache_path("cache", file_id))
+
+    def translate(sentence):
+        with scheduling(PRIORITY_INTERACTIVE, file_id), state['registry'].lease(DEFAULT_MODEL) as translator:
+            return translator.get_single_translation(sentence, language, file_id)
+
+    chapter_audio = ChapterAudio(
+        state['audio'], sentences, translate,
+        lambda sentence: tcache.lookup(translation_cache, sentence, language),
+        voice, language
+    )
+    paths = chapter_audio.cached_segments()
+    if paths is None:
+        logging.info(f"Audio bab #{chapter} dari file {file_id[:10]}... belum lengkap. Streaming sambil menyiapkan.")
+        stream = chapter_audio.stream()
+        try:
+            # Segmen pertama disiapkan sebelum header respons dikirim, sehingga kegagalan awal menjadi error HTTP
+            first = next(stream)
+        except StopIteration:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Audio bab kosong.")
+        except Exception as e:
+            logging.error(f"Gagal menyiapkan audio bab #{chapter}: {e}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+        return StreamingResponse(chain([first], stream), media_type="audio/wav")
+
+    params, total_size, segments = ChapterAudio.layout(paths)
+    headers = {"Accept-Ranges": "bytes"}
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", request.headers.get("range", "").strip())
+    if not match or not (match.group(1) or match.group(2)):
+        headers["Content-Length"] = str(total_size)
+        return StreamingResponse(
+            ChapterAudio.iter_range(params, total_size, segments, 0, total_size - 1),
+            media_type="audio/wav", headers=headers
+        )
+
+    if match.group(1):
+        start = int(match.group(1))
+        end = min(int(match.group(2)), total_size - 1) if match.group(2) else total_size - 1
+    else:
+        # Rentang akhiran, mis. "bytes=-500"
+        start = max(0, total_size - int(match.group(2)))
+        end = total_size - 1
+    if start >= total_size or start > end:
+        return JSONResponse(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            content={"detail": "Rentang tidak valid."},
+            headers={"Content-Range": f"bytes */{total_size}"}
+        )
+
+    headers["Content-Range"] = f"bytes {start}-{end}/{total_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        ChapterAudio.iter_range(params, total_size, segments, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT, media_type="audio/wav", headers=headers
+    )
+
+@app.get("/prefetch", summary="Statistik Prefetch")
+def get_prefetch_stats():
+    """Menampilkan jumlah prefetch yang dijadwalkan, dibatalkan, dan hit rate-nya."""
+    return state['prefetcher'].report()
+
+@app.get("/scheduler", summary="Antrean dan Waktu Tunggu Generasi")
+def get_scheduler_status():
+    """Menampilkan panjang antrean dan waktu tunggu per kelas prioritas (interactive, prefetch, bulk)."""
+    return state['scheduler'].status()
+
+@app.get("/models", summary="Status Model yang Terdaftar")
+def get_models():
+    """Menampilkan model yang terdaftar, yang sedang dimuat, dan pemakaian anggaran memorinya."""
+    return state['registry'].status()
+
+@app.get("/memory", summary="Pemakaian Memori dan Anggaran")
+def get_memory():
+    """Menampilkan RSS, memori akselerator, anggaran, dan perkiraan ukuran cache/model di memori."""
+    return state['memory'].status()
+
 @app.get("/", include_in_schema=False)
 def root():
     return {"message": "Selamat datang di API Penerjemah EPUB. Kunjungi /docs untuk dokumentasi."}
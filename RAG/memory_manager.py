@@ -0,0 +1,135 @@
+# memory_manager.py
+import gc
+import os
+import sys
+import logging
+import threading
+
+import torch
+
+from model_loading import current_rss_bytes
+
+GB = 1024 ** 3
+
+
+def total_ram_bytes():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 16 * GB
+
+
+def strings_size(strings):
+    """Perkiraan ukuran memori list/koleksi string (objek string + wadahnya)."""
+    return sys.getsizeof(strings) + sum(sys.getsizeof(s) for s in strings)
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """Dilempar saat pekerjaan baru ditolak karena memori di atas anggaran."""
+
+
+class MemoryComponent:
+    def __init__(self, name, size, evict=None):
+        self.name = name
+        self.size = size    # Callable() -> perkiraan byte
+        self.evict = evict  # Callable() -> byte yang dibebaskan (perkiraan), atau None jika tidak bisa dikosongkan
+
+
+class MemoryManager:
+    """
+    Memantau RSS proses dan memori akselerator terhadap anggaran. Pembersihan
+    hanya dilakukan saat ambang terlewati:
+    - di atas soft_ratio x anggaran: gc.collect() / torch.cuda.empty_cache();
+    - masih di atas anggaran: komponen dikosongkan sesuai urutan pendaftaran
+      (mis. cache chunk buku yang lama tidak dibaca, model idle), kecuali
+      komponen yang ukurannya terlalu kecil dibanding kelebihan memori;
+    - upload baru ditolak jika setelah pembersihan tidak ada ruang.
+    check() dipanggil dari tugas latar belakang, bukan dari thread generasi.
+    """
+    def __init__(self, rss_budget_bytes=None, accelerator_budget_bytes=None, soft_ratio=0.85, min_evict_ratio=0.05):
+        self.rss_budget_bytes = rss_budget_bytes or int(0.8 * total_ram_bytes())
+        self.accelerator = torch.cuda.is_available()
+        if self.accelerator and not accelerator_budget_bytes:
+            accelerator_budget_bytes = int(0.9 * torch.cuda.get_device_properties(0).total_memory)
+        self.accelerator_budget_bytes = accelerator_budget_bytes if self.accelerator else None
+        self.soft_ratio = soft_ratio
+        # Komponen yang lebih kecil dari porsi ini dari kelebihan RSS tidak dikosongkan
+        self.min_evict_ratio = min_evict_ratio
+        self.components = []
+        self.lock = threading.Lock()
+        self.stats = {"gc": 0, "empty_cache": 0, "evictions": 0, "rejected_uploads": 0}
+
+    def register(self, name, size, evict=None):
+        """Mendaftarkan komponen yang ukurannya dilaporkan dan (opsional) bisa dikosongkan."""
+        self.components.append(MemoryComponent(name, size, evict))
+
+    def accelerator_reserved(self):
+        return torch.cuda.memory_reserved() if self.accelerator else 0
+
+    def after_generation(self):
+        """
+        Dipanggil setelah setiap generasi. Cache allocator CUDA hanya dikosongkan jika
+        memori yang dicadangkan melewati ambang; RSS tidak diperiksa di sini.
+        """
+        if self.accelerator and self.accelerator_reserved() > self.soft_ratio * self.accelerator_budget_bytes:
+            torch.cuda.empty_cache()
+            self.stats["empty_cache"] += 1
+            logging.info(f"Memori akselerator di atas {self.soft_ratio:.0%} anggaran; cache allocator dikosongkan.")
+
+    def check(self, extra_bytes=0):
+        """
+        Memeriksa RSS (ditambah extra_bytes yang akan dialokasikan) terhadap anggaran
+        dan membersihkan secara bertahap. Mengembalikan True jika masih muat.
+        """
+        with self.lock:
+            soft_limit = self.soft_ratio * self.rss_budget_bytes
+            if current_rss_bytes() + extra_bytes <= soft_limit:
+                return True
+
+            gc.collect()
+            self.stats["gc"] += 1
+            if self.accelerator:
+                torch.cuda.empty_cache()
+                self.stats["empty_cache"] += 1
+            if current_rss_bytes() + extra_bytes <= self.rss_budget_bytes:
+                return True
+
+            for component in self.components:
+                if component.evict is None:
+                    continue
+                overage = current_rss_bytes() + extra_bytes - self.rss_budget_bytes
+                if component.size() < self.min_evict_ratio * overage:
+                    # Mengosongkan komponen ini tidak akan berarti; RSS didominasi hal lain
+                    continue
+                freed = component.evict()
+                if freed:
+                    self.stats["evictions"] += 1
+                    gc.collect()
+                    logging.warning(f"RSS di atas anggaran; komponen '{component.name}' dikosongkan (~{freed / GB:.2f} GB).")
+                if current_rss_bytes() + extra_bytes <= self.rss_budget_bytes:
+                    return True
+            return current_rss_bytes() + extra_bytes <= self.rss_budget_bytes
+
+    def admit_upload(self, size_bytes):
+        """Menolak upload baru (MemoryBudgetExceeded) jika tidak ada ruang setelah pembersihan."""
+        if not self.check(extra_bytes=size_bytes):
+            self.stats["rejected_uploads"] += 1
+            raise MemoryBudgetExceeded(
+                f"Memori server penuh ({current_rss_bytes() / GB:.2f}/{self.rss_budget_bytes / GB:.2f} GB). Coba lagi nanti."
+            )
+
+    def status(self):
+        """Pemakaian memori saat ini, anggaran, dan perkiraan ukuran per komponen."""
+        report = {
+            "rss_gb": round(current_rss_bytes() / GB, 3),
+            "rss_budget_gb": round(self.rss_budget_bytes / GB, 2),
+            "components_gb": {component.name: round(component.size() / GB, 3) for component in self.components},
+            "stats": dict(self.stats),
+        }
+        if self.accelerator:
+            report["accelerator"] = {
+                "allocated_gb": round(torch.cuda.memory_allocated() / GB, 3),
+                "reserved_gb": round(torch.cuda.memory_reserved() / GB, 3),
+                "budget_gb": round(self.accelerator_budget_bytes / GB, 2),
+            }
+        return report
@@ -0,0 +1,111 @@
+# model_loading.py
+import os
+import sys
+import time
+import logging
+import resource
+
+import torch
+from transformers import AutoModelForCausalLM
+
+DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+}
+
+
+def peak_rss_bytes():
+    """RSS puncak proses sejauh ini."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux melaporkan KB, macOS melaporkan byte
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss_bytes():
+    """RSS proses saat ini (Linux), atau RSS puncak jika /proc tidak tersedia."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def quantize_linear_int8_(model, skip=("lm_head",)):
+    """
+    Mengkuantisasi setiap nn.Linear menjadi int8 dinamis (CPU) satu per satu, sehingga
+    salinan float32 sementara hanya sebesar satu layer. lm_head dilewati agar tetap
+    berbagi bobot dengan embedding.
+    """
+    from torch.ao.quantization import default_dynamic_qconfig
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+
+    replaced = 0
+    for module_name, module in list(model.named_modules()):
+        for child_name, child in list(module.named_children()):
+            full_name = f"{module_name}.{child_name}" if module_name else child_name
+            if not isinstance(child, torch.nn.Linear) or full_name in skip:
+                continue
+            child.float()
+            child.qconfig = default_dynamic_qconfig
+            setattr(module, child_name, DynamicQuantizedLinear.from_float(child))
+            replaced += 1
+    # Linear int8 dinamis menerima aktivasi float32, jadi sisa parameter ikut float32
+    model.float()
+    return replaced
+
+
+def load_causal_lm_low_memory(checkpoint, cache_dir=None, dtype="bfloat16", max_cpu_memory=None, offload_dir=None):
+    """
+    Memuat model causal di CPU dengan memori terbatas:
+    - low_cpu_mem_usage: shard (safetensors diutamakan bila tersedia) dibaca lewat mmap
+      langsung ke bobot akhir tanpa salinan kedua state_dict;
+    - dtype "bfloat16"/"float16"/"float32", atau "int8" (dimuat bf16 lalu dikuantisasi per layer);
+    - max_cpu_memory (mis. "20GiB") + offload_dir: layer di luar anggaran RAM di-offload ke disk.
+    Mengembalikan (model, laporan) dengan waktu muat dan RSS puncak.
+    """
+    if dtype != "int8" and dtype not in DTYPES:
+        raise ValueError(f"dtype tidak dikenal: {dtype}. Pilih salah satu dari {sorted(DTYPES) + ['int8']}.")
+    if dtype == "int8" and max_cpu_memory:
+        raise ValueError("Mode int8 tidak dapat digabung dengan offload disk; kosongkan max_cpu_memory.")
+
+    kwargs = {
+        "cache_dir": cache_dir,
+        "low_cpu_mem_usage": True,
+        "torch_dtype": torch.bfloat16 if dtype == "int8" else DTYPES[dtype],
+    }
+    if max_cpu_memory:
+        offload_dir = offload_dir or os.path.join(cache_dir or ".", "offload")
+        os.makedirs(offload_dir, exist_ok=True)
+        kwargs.update(
+            device_map="auto",
+            max_memory={"cpu": max_cpu_memory},
+            offload_folder=offload_dir,
+            offload_state_dict=True,
+        )
+    else:
+        kwargs["device_map"] = {"": "cpu"}
+
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    logging.info(f"Memuat {checkpoint} (dtype={dtype}, batas RAM={max_cpu_memory or 'tanpa batas'})...")
+    model = AutoModelForCausalLM.from_pretrained(checkpoint, **kwargs)
+    if dtype == "int8":
+        replaced = quantize_linear_int8_(model)
+        logging.info(f"{replaced} layer Linear dikuantisasi ke int8.")
+    model.eval()
+
+    report = {
+        "checkpoint": checkpoint,
+        "dtype": dtype,
+        "seconds": round(time.perf_counter() - start, 1),
+        "rss_before_gb": round(rss_before / 1024 ** 3, 2),
+        "rss_after_gb": round(current_rss_bytes() / 1024 ** 3, 2),
+        "peak_rss_gb": round(peak_rss_bytes() / 1024 ** 3, 2),
+        "offloaded": "disk" in set(getattr(model, "hf_device_map", {}).values()),
+    }
+    logging.info(
+        f"Model dimuat dalam {report['seconds']} detik. RSS {report['rss_before_gb']} -> {report['rss_after_gb']} GB, "
+        f"puncak {report['peak_rss_gb']} GB{', sebagian layer di-offload ke disk' if report['offloaded'] else ''}."
+    )
+    return model, report
@@ -0,0 +1,370 @@
+# model_registry.py
+import gc
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+from generation_budget import GenerationBudget, strip_repetition, trim_padding
+import translation_cache as tcache
+from model_loading import load_causal_lm_low_memory
+from scheduler import GenerationScheduler
+
+GB = 1024 ** 3
+
+# Tingkat kualitas untuk routing
+TIER_INTERACTIVE = "interactive"
+TIER_BULK = "bulk"
+TIER_QUALITY = "quality"
+
+
+def release_memory():
+    """Melepas memori yang tidak terpakai setelah model dibongkar."""
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+# --- BACKEND MODEL ---
+
+class Seq2SeqBackend:
+    """Model seq2seq (mis. opus-mt Marian hasil fine-tuning) untuk terjemahan massal yang cepat."""
+    prompt_version = "seq2seq"  # Tanpa prompt; dicatat di entri cache
+
+    def __init__(self, model_path, batch_size=16, max_length=256, scheduler=None):
+        self.model_path = model_path
+        self.scheduler = scheduler or GenerationScheduler()
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = None
+        self.tokenizer = None
+        self.budget = GenerationBudget(legacy_budget=max_length, max_new_tokens=max_length, max_beams=4)
+
+    def load_model(self):
+        if self.model is not None:
+            return
+        logging.info(f"Memuat model seq2seq: {self.model_path}...")
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        self.model = AutoModelForSeq2SeqLM.from_pretrained(self.model_path).to(self.device)
+        self.model.eval()
+
+    def unload_model(self):
+        self.model = None
+        self.tokenizer = None
+        release_memory()
+
+    def translate_texts(self, texts, target_language):
+        translations = []
+        with torch.no_grad():
+            for start in range(0, len(texts), self.batch_size):
+                batch = texts[start:start + self.batch_size]
+                with self.scheduler.turn():
+                    # Tokenizer dipakai bersama antar thread; tokenisasi ikut giliran generasi
+                    inputs = self.tokenizer(
+                        batch, max_length=self.max_length, truncation=True, padding="longest", return_tensors="pt"
+                    ).to(self.device)
+                    row_source_tokens = inputs.attention_mask.sum(dim=1).tolist()
+                    source_tokens = max(row_source_tokens)
+                    max_new_tokens = self.budget.max_new_tokens_for(source_tokens, target_language)
+                    special_ids = {self.tokenizer.pad_token_id, self.tokenizer.eos_token_id}
+                    stopping_criteria = self.budget.stopping_criteria(1, special_ids)
+                    outputs = self.model.generate(
+                        input_ids=inputs.input_ids,
+                        attention_mask=inputs.attention_mask,
+                        max_new_tokens=max_new_tokens,
+                        num_beams=self.budget.num_beams_for(source_tokens),
+                        early_stopping=True,
+                        stopping_criteria=stopping_criteria
+                    )
+                rows = []
+                looped = self.budget.looped_rows(stopping_criteria, len(batch))
+                for row, row_tokens, row_looped in zip(outputs.tolist(), row_source_tokens, looped):
+                    # Token pertama adalah token start decoder; ekor pad/EOS bukan bagian terjemahan
+                    generated = trim_padding(row[1:], special_ids)
+                    self.budget.report(target_language, row_tokens, max_new_tokens, len(generated),
+                                       legacy_budget=self.max_length, looped=row_looped)
+                    rows.append(strip_repetition(generated))
+                translations.extend(self.tokenizer.batch_decode(rows, skip_special_tokens=True))
+        return [t.strip() for t in translations]
+
+
+class PromptCausalBackend:
+    """Model causal berbasis prompt "Translation:" (mis. bloomz-7b1-mt)."""
+    prompt_version = "islamic-v1"  # Naikkan saat prompt di translate_texts diubah
+
+    def __init__(self, checkpoint, cache_dir=None, max_input_length=256, max_output_length=512,
+                 dtype=None, max_cpu_memory=None, offload_dir=None, scheduler=None):
+        self.checkpoint = checkpoint
+        self.scheduler = scheduler or GenerationScheduler()
+        self.cache_dir = cache_dir
+        self.dtype = dtype or ("float16" if torch.cuda.is_available() else "float32")
+        self.max_cpu_memory = max_cpu_memory
+        self.offload_dir = offload_dir
+        self.load_report = None
+        self.max_input_length = max_input_length
+        self.max_output_length = max_output_length
+        self.model = None
+        self.tokenizer = None
+        self.budget = GenerationBudget(legacy_budget=max_output_length, max_new_tokens=max_output_length, max_beams=2)
+
+    def load_model(self):
+        if self.model is not None:
+            return
+        logging.info(f"Memuat model causal: {self.checkpoint}...")
+        self.tokenizer = AutoTokenizer.from_pretrained(self.checkpoint, cache_dir=self.cache_dir)
+        self.model, self.load_report = load_causal_lm_low_memory(
+            self.checkpoint,
+            cache_dir=self.cache_dir,
+            dtype=self.dtype,
+            max_cpu_memory=self.max_cpu_memory,
+            offload_dir=self.offload_dir
+        )
+
+    def unload_model(self):
+        self.model = None
+        self.tokenizer = None
+        release_memory()
+
+    def translate_texts(self, texts, target_language):
+        translations = []
+        with torch.no_grad():
+            for text in texts:
+                prompt = f"Translate the following Islamic Arabic text to {target_language}.\nText: {text}\n\nTranslation:"
+                with self.scheduler.turn():
+                    # Tokenizer dipakai bersama antar thread; tokenisasi ikut giliran generasi
+                    inputs = self.tokenizer(prompt, return_tensors='pt').to(self.model.device)
+                    prompt_length = inputs['input_ids'].shape[1]
+                    source_tokens = len(self.tokenizer(text, add_special_tokens=False)['input_ids'])
+                    legacy_budget = max(1, self.max_output_length - prompt_length)
+                    max_new_tokens = min(legacy_budget, self.budget.max_new_tokens_for(source_tokens, target_language))
+                    special_ids = {self.tokenizer.pad_token_id, self.tokenizer.eos_token_id}
+                    stopping_criteria = self.budget.stopping_criteria(prompt_length, special_ids)
+                    outputs = self.model.generate(
+                        **inputs,
+                        max_new_tokens=max_new_tokens,
+                        num_beams=self.budget.num_beams_for(source_tokens),
+                        no_repeat_ngram_size=2,
+                        early_stopping=True,
+                        stopping_criteria=stopping_criteria
+                    )
+                generated = outputs[0][prompt_length:].tolist()
+                self.budget.report(target_language, source_tokens, max_new_tokens, len(generated),
+                                   stopping_criteria, legacy_budget)
+                translations.append(self.tokenizer.decode(
+                    strip_repetition(trim_padding(generated, special_ids)), skip_special_tokens=True
+                ).strip())
+        return translations
+
+
+# --- REGISTRY ---
+
+class ModelSpec:
+    """Deskripsi satu model yang bisa dimuat oleh registry."""
+    def __init__(self, name, factory, languages, tiers, memory_bytes, priority=0):
+        self.name = name
+        self.factory = factory          # Callable tanpa argumen yang mengembalikan backend
+        self.languages = set(languages) # Bahasa target yang didukung (sumber selalu Arab)
+        self.tiers = set(tiers)
+        self.memory_bytes = memory_bytes # Perkiraan awal; diperbarui setelah model dimuat
+        self.priority = priority         # Angka lebih kecil lebih diutamakan saat routing
+
+
+class ModelRegistry:
+    """
+    Registry model dengan pemuatan lazy dan LRU berbatas memori. Model yang
+    sedang dipakai (lease) tidak akan dibongkar; model yang lama tidak dipakai
+    dibongkar oleh unload_idle(). Model `pinned` (mis. model interaktif default)
+    tidak pernah dibongkar demi model lain, sehingga routing tidak bolak-balik
+    memuat model besar.
+    """
+    def __init__(self, memory_budget_bytes, idle_timeout=900, pinned=()):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_timeout = idle_timeout
+        self.pinned = set(pinned)
+        self.specs = {}
+        self.backends = {}
+        self.resident = OrderedDict()  # name -> waktu terakhir dipakai, urutan LRU
+        self.in_use = {}
+        self.loading = {}  # name -> threading.Event selama model dimuat
+        self.lock = threading.RLock()
+
+    def register(self, spec):
+        self.specs[spec.name] = spec
+
+    def route(self, target_language, tier):
+        """Memilih nama model untuk bahasa target dan tingkat kualitas."""
+        candidates = [spec for spec in self.specs.values() if target_language in spec.languages]
+        if not candidates:
+            raise LookupError(f"Tidak ada model yang mendukung bahasa {target_language}.")
+        matching = [spec for spec in candidates if tier in spec.tiers] or candidates
+        # Utamakan prioritas, lalu model yang sudah ada di memori
+        matching.sort(key=lambda spec: (spec.priority, spec.name not in self.resident))
+        with self.lock:
+            for spec in matching:
+                if self.fits(spec.name):
+                    return spec.name
+            # Kandidat tier ini tidak muat; pakai model lain yang mendukung bahasa tersebut
+            candidates.sort(key=lambda spec: (spec.priority, spec.name not in self.resident))
+            for spec in candidates:
+                if self.fits(spec.name):
+                    logging.info(f"Model tier {tier} tidak muat di anggaran memori; memakai {spec.name}.")
+                    return spec.name
+        raise MemoryError(f"Tidak ada model untuk {target_language} yang muat tanpa membongkar model yang sedang dipakai.")
+
+    def fits(self, name):
+        """True jika model sudah dimuat atau bisa dimuat tanpa membongkar model yang dipakai/di-pin."""
+        if name in self.resident or name in self.loading:
+            return True
+        held = sum(
+            self.specs[other].memory_bytes for other in self.resident
+            if other in self.pinned or self.in_use.get(other, 0) > 0
+        ) + sum(self.specs[other].memory_bytes for other in self.loading)
+        return held + self.specs[name].memory_bytes <= self.memory_budget_bytes
+
+    @contextmanager
+    def lease(self, name):
+        """Memuat model jika perlu dan menahannya selama blok `with` berjalan."""
+        backend = self._ensure_loaded(name, lease=True)
+        try:
+            yield backend
+        finally:
+            with self.lock:
+                self.in_use[name] -= 1
+                self.resident[name] = time.monotonic()
+                self.resident.move_to_end(name)
+
+    def get(self, name):
+        """Memuat model jika perlu dan mengembalikan backend-nya."""
+        return self._ensure_loaded(name)
+
+    def _ensure_loaded(self, name, lease=False):
+        """
+        Memuat model tanpa memegang `self.lock`, sehingga request untuk model
+        yang sudah ada di memori tetap dilayani selama model lain dimuat.
+        Pemanggil lain untuk model yang sama menunggu event pemuatannya.
+        """
+        spec = self.specs[name]
+        while True:
+            with self.lock:
+                if name in self.resident:
+                    self.resident[name] = time.monotonic()
+                    self.resident.move_to_end(name)
+                    if lease:
+                        self.in_use[name] = self.in_use.get(name, 0) + 1
+                    return self.backends[name]
+                loading = self.loading.get(name)
+                if loading is None:
+                    if spec.memory_bytes > self.memory_budget_bytes:
+                        raise MemoryError(
+                            f"Model {name} (~{spec.memory_bytes / GB:.1f} GB) melebihi anggaran memori "
+                            f"{self.memory_budget_bytes / GB:.1f} GB."
+                        )
+                    self._evict_for(spec.memory_bytes)
+                    # Ukuran model yang sedang dimuat sudah dihitung di used_bytes()
+                    loading = self.loading[name] = threading.Event()
+                    break
+            # Model sedang dimuat thread lain; periksa ulang setelah selesai (atau gagal)
+            loading.wait()
+
+        try:
+            backend = self.backends.get(name) or spec.factory()
+            backend.load_model()
+        except BaseException:
+            with self.lock:
+                del self.loading[name]
+            loading.set()
+            raise
+
+        footprint = getattr(getattr(backend, "model", None), "get_memory_footprint", None)
+        with self.lock:
+            if footprint is not None:
+                spec.memory_bytes = footprint()
+            self.backends[name] = backend
+            self.resident[name] = time.monotonic()
+            del self.loading[name]
+            if lease:
+                self.in_use[name] = self.in_use.get(name, 0) + 1
+        loading.set()
+        logging.info(f"Model {name} dimuat (~{spec.memory_bytes / GB:.2f} GB). "
+                     f"Terpakai {self.used_bytes() / GB:.2f}/{self.memory_budget_bytes / GB:.1f} GB.")
+        return backend
+
+    def _evict_for(self, needed_bytes):
+        """Membongkar model LRU yang tidak sedang dipakai sampai ada ruang."""
+        for name in list(self.resident):
+            if self.used_bytes() + needed_bytes <= self.memory_budget_bytes:
+                return
+            if self.in_use.get(name, 0) == 0 and name not in self.pinned:
+                self.unload(name, reason="LRU")
+        if self.used_bytes() + needed_bytes > self.memory_budget_bytes:
+            raise MemoryError("Anggaran memori model penuh oleh model yang sedang dipakai.")
+
+    def unload(self, name, reason="manual"):
+        with self.lock:
+            if name not in self.resident:
+                return
+            self.backends[name].unload_model()
+            del self.resident[name]
+            logging.info(f"Model {name} dibongkar ({reason}).")
+
+    def unload_idle(self):
+        """Membongkar model yang tidak dipakai lebih lama dari idle_timeout."""
+        now = time.monotonic()
+        with self.lock:
+            for name, last_used in list(self.resident.items()):
+                if self.in_use.get(name, 0) == 0 and now - last_used > self.idle_timeout:
+                    self.unload(name, reason="idle")
+
+    def evict_unused(self, keep=()):
+        """Membongkar semua model yang tidak sedang dipakai (kecuali `keep`). Mengembalikan perkiraan byte yang dibebaskan."""
+        freed = 0
+        with self.lock:
+            for name in list(self.resident):
+                if name not in keep and self.in_use.get(name, 0) == 0:
+                    freed += self.specs[name].memory_bytes
+                    self.unload(name, reason="anggaran memori proses")
+        return freed
+
+    def used_bytes(self):
+        with self.lock:
+            return sum(self.specs[name].memory_bytes for name in (*self.resident, *self.loading))
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            "memory_budget_gb": round(self.memory_budget_bytes / GB, 2),
+            "memory_used_gb": round(self.used_bytes() / GB, 2),
+            "models": {
+                name: {
+                    "resident": name in self.resident,
+                    "loading": name in self.loading,
+                    "in_use": self.in_use.get(name, 0),
+                    "idle_seconds": round(now - self.resident[name], 1) if name in self.resident else None,
+                    "memory_gb": round(spec.memory_bytes / GB, 2),
+                    "tiers": sorted(spec.tiers),
+                    "languages": sorted(spec.languages),
+                }
+                for name, spec in self.specs.items()
+            },
+        }
+
+
+def translate_cached(backend, chunk, target_language, cache_dir, book_hash, model=None):
+    """
+    Menerjemahkan satu chunk dengan backend apa pun, memakai cache terjemahan buku yang sama.
+    `model` (nama di registry) dicatat di entri cache sebagai versi model.
+    """
+    path = tcache.cache_path(cache_dir, book_hash)
+    translation_cache = tcache.load_cache(path)
+    cached = tcache.lookup(translation_cache, chunk, target_language)
+    if cached is not None:
+        return cached
+    translation = backend.translate_texts([chunk], target_language)[0]
+    tcache.store(translation_cache, chunk, target_language, translation, model, getattr(backend, "prompt_version", None))
+    tcache.merge_save_cache(translation_cache, path)
+    return translation
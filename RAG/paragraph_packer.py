@@ -0,0 +1,93 @@
+# paragraph_packer.py
+import re
+
+SENTENCE_END_RE = re.compile(r'[.!?؟۔]')
+
+
+def prompt_overhead(tokenizer, template, languages=("English",)):
+    """Jumlah token prompt tanpa teks sumber (maksimum dari semua bahasa target)."""
+    return max(
+        len(tokenizer(template.format(text="", target_language=language))["input_ids"])
+        for language in languages
+    )
+
+
+def _split_with_offsets(paragraph, offsets, budget):
+    """
+    Memotong paragraf yang melebihi anggaran memakai offset token, sebisa mungkin
+    di akhir kalimat. Tidak memerlukan pemanggilan tokenizer tambahan.
+    """
+    sentence_ends = {match.end() for match in SENTENCE_END_RE.finditer(paragraph)}
+    pieces = []
+    start = 0
+    while start < len(offsets):
+        end = min(start + budget, len(offsets))
+        if end < len(offsets):
+            for j in range(end, start, -1):
+                if offsets[j - 1][1] in sentence_ends:
+                    end = j
+                    break
+        text = paragraph[offsets[start][0]:offsets[end - 1][1]].strip()
+        if text:
+            pieces.append((text, end - start))
+        start = end
+    return pieces
+
+
+def _split_without_offsets(paragraph, tokenizer, budget):
+    """Cadangan untuk tokenizer non-fast: pecah per kalimat, lalu per jendela token."""
+    sentences = [s.strip() for s in re.split(r'(?<=[.!?؟۔])\s+', paragraph) if s.strip()]
+    pieces = []
+    for sentence, ids in zip(sentences, tokenizer(sentences, add_special_tokens=False)["input_ids"]):
+        if len(ids) <= budget:
+            pieces.append((sentence, len(ids)))
+            continue
+        for start in range(0, len(ids), budget):
+            window = ids[start:start + budget]
+            pieces.append((tokenizer.decode(window, skip_special_tokens=True).strip(), len(window)))
+    return pieces
+
+
+def pack_paragraphs(paragraphs, tokenizer, max_tokens, overhead=0, separator_tokens=1):
+    """
+    Mengemas paragraf menjadi chunk yang muat dalam anggaran token (max_tokens
+    dikurangi overhead prompt). Panjang diukur dengan satu pemanggilan tokenizer
+    batch per dokumen; paragraf yang terlalu panjang dipotong di batas kalimat
+    atau token, sehingga tidak ada teks yang terpotong diam-diam oleh truncation.
+    Setiap sambungan antar paragraf dihitung `separator_tokens` sebagai batas aman.
+    """
+    budget = max_tokens - overhead
+    if budget <= 0:
+        raise ValueError(f"Overhead prompt ({overhead} token) tidak menyisakan ruang dari {max_tokens} token.")
+    if not paragraphs:
+        return []
+
+    if getattr(tokenizer, "is_fast", False):
+        encoded = tokenizer(paragraphs, add_special_tokens=False, return_offsets_mapping=True)
+        offsets_list = encoded["offset_mapping"]
+    else:
+        encoded = tokenizer(paragraphs, add_special_tokens=False)
+        offsets_list = [None] * len(paragraphs)
+
+    pieces = []
+    for paragraph, ids, offsets in zip(paragraphs, encoded["input_ids"], offsets_list):
+        if len(ids) <= budget:
+            pieces.append((paragraph, len(ids)))
+        elif offsets is not None:
+            pieces.extend(_split_with_offsets(paragraph, offsets, budget))
+        else:
+            pieces.extend(_split_without_offsets(paragraph, tokenizer, budget))
+
+    chunks = []
+    current, current_tokens = [], 0
+    for text, tokens in pieces:
+        needed = tokens + (separator_tokens if current else 0)
+        if current and current_tokens + needed > budget:
+            chunks.append(' '.join(current))
+            current, current_tokens = [], 0
+            needed = tokens
+        current.append(text)
+        current_tokens += needed
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
@@ -0,0 +1,185 @@
+# prefetch.py
+import time
+import logging
+import threading
+from collections import deque
+
+
+class PrefetchSession:
+    """Status prefetch untuk satu pembaca: satu file_id dalam satu bahasa target."""
+    def __init__(self):
+        self.last_index = None  # Nomor chunk terakhir yang diminta pengguna
+        self.generation = 0     # Naik setiap kali pengguna melompat; job lama dibatalkan
+        self.queued = set()     # Nomor chunk yang sedang menunggu atau diterjemahkan
+        self.running = {}       # Nomor chunk -> threading.Event selama prefetch menerjemahkannya
+        self.done = set()       # Nomor chunk yang selesai diterjemahkan oleh prefetch
+        self.cached = set()     # Nomor chunk yang sudah ada di cache sebelum dijadwalkan
+        self.last_access = time.monotonic()
+
+
+class Prefetcher:
+    """
+    Menerjemahkan beberapa chunk berikutnya di latar belakang selagi pengguna
+    membaca chunk saat ini. Job berjalan satu per satu di satu thread; prioritasnya
+    terhadap request interaktif diatur oleh `translate` (lihat scheduler.py). Jika
+    pengguna melompat ke luar jendela prefetch, job yang belum berjalan dibatalkan.
+    Sesi yang tidak diakses lebih lama dari `idle_timeout` detik dilepas.
+    """
+    def __init__(self, translate, cached, depth=4, idle_timeout=3600):
+        self.translate = translate  # Callable(file_id, bahasa, chunk, model) -> terjemahan
+        self.find_cached = cached   # Callable(file_id, bahasa, [chunk]) -> set chunk yang sudah di cache
+        self.depth = depth
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.jobs = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.stats = {"scheduled": 0, "completed": 0, "cancelled": 0, "failed": 0,
+                      "hits": 0, "late": 0, "misses": 0}
+        self.worker = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self.worker.start()
+
+    def on_request(self, file_id, target_language, index):
+        """
+        Dicatat saat chunk `index` (dimulai dari 1) diminta, sebelum diterjemahkan.
+        Memperbarui statistik hit/late/miss. Mengembalikan Event prefetch yang sedang
+        menerjemahkan chunk ini (atau None); pemanggil menunggunya lalu membaca cache
+        alih-alih menerjemahkan kalimat yang sama dua kali. Job yang masih antre untuk
+        chunk ini dilewati karena request interaktif yang mengerjakannya.
+        """
+        with self.condition:
+            session = self.sessions.get((file_id, target_language))
+            if session is None:
+                return None
+            session.last_access = time.monotonic()
+            if index in session.done:
+                self.stats["hits"] += 1
+            elif index in session.running:
+                self.stats["late"] += 1
+                return session.running[index]
+            elif index in session.queued:
+                self.stats["late"] += 1
+                session.queued.discard(index)
+            elif session.last_index is not None and index not in session.cached:
+                self.stats["misses"] += 1
+            return None
+
+    def on_access(self, file_id, target_language, index, all_chunks, model_name, depth=None):
+        """
+        Dicatat setelah chunk `index` (dimulai dari 1) diterjemahkan. Membatalkan
+        prefetch jika pengguna melompat, lalu menjadwalkan chunk berikutnya.
+        """
+        depth = self.depth if depth is None else depth
+        with self.condition:
+            self._forget_idle()
+            session = self.sessions.setdefault((file_id, target_language), PrefetchSession())
+            session.last_access = time.monotonic()
+
+            # Maju dalam jendela prefetch dianggap membaca berurutan; selain itu lompatan
+            sequential = session.last_index is not None and 0 <= index - session.last_index <= max(1, depth)
+            if session.last_index is not None and not sequential:
+                self._cancel(session)
+            session.last_index = index
+
+            wanted = [i for i in range(index + 1, min(index + depth, len(all_chunks)) + 1)
+                      if i not in session.queued and i not in session.running
+                      and i not in session.done and i not in session.cached]
+        if not wanted:
+            return
+
+        # Cache dibaca di luar lock karena membaca file
+        already = self.find_cached(file_id, target_language, [all_chunks[i - 1] for i in wanted])
+        with self.condition:
+            if self.closed:
+                return
+            for i in wanted:
+                if all_chunks[i - 1] in already:
+                    session.cached.add(i)
+                    continue
+                session.queued.add(i)
+                self.jobs.append((file_id, target_language, session.generation, i, all_chunks[i - 1], model_name))
+                self.stats["scheduled"] += 1
+            self.condition.notify_all()
+
+    def _cancel(self, session):
+        session.generation += 1
+        cancelled = len(session.queued)
+        session.queued.clear()
+        if cancelled:
+            self.stats["cancelled"] += cancelled
+            logging.info(f"Pengguna melompat; {cancelled} prefetch dibatalkan.")
+
+    def forget(self, file_id):
+        """Melepas semua sesi satu buku (dipanggil saat buku dilepas dari memori)."""
+        with self.condition:
+            for key in [key for key in self.sessions if key[0] == file_id]:
+                del self.sessions[key]
+            self.jobs = deque(job for job in self.jobs if job[0] != file_id)
+
+    def _forget_idle(self):
+        now = time.monotonic()
+        for key, session in list(self.sessions.items()):
+            if now - session.last_access > self.idle_timeout and not session.running:
+                del self.sessions[key]
+
+    def _next_job(self):
+        with self.condition:
+            while True:
+                if self.closed:
+                    return None
+                if self.jobs:
+                    job = self.jobs.popleft()
+                    session = self.sessions.get((job[0], job[1]))
+                    # Job dari sesi yang dilepas, generasi lama, atau chunk yang diambil alih request interaktif dilewati
+                    if session is not None and session.generation == job[2] and job[3] in session.queued:
+                        running = session.running[job[3]] = threading.Event()
+                        return job, running
+                    continue
+                self.condition.wait()
+
+    def _run(self):
+        while True:
+            item = self._next_job()
+            if item is None:
+                return
+            (file_id, target_language, generation, index, chunk, model_name), running = item
+            try:
+                self.translate(file_id, target_language, chunk, model_name)
+                ok = True
+            except Exception as e:
+                logging.error(f"Prefetch chunk #{index} dari file {file_id[:10]}... gagal: {e}", exc_info=True)
+                ok = False
+            with self.condition:
+                session = self.sessions.get((file_id, target_language))
+                if ok:
+                    self.stats["completed"] += 1
+                else:
+                    self.stats["failed"] += 1
+                if session is not None:
+                    session.queued.discard(index)
+                    session.running.pop(index, None)
+                    if ok and session.generation == generation:
+                        session.done.add(index)
+                # Request interaktif yang menunggu chunk ini kini membaca cache
+                running.set()
+
+    def report(self):
+        """Statistik prefetch beserta hit rate (chunk yang sudah siap saat diminta)."""
+        with self.condition:
+            requests = self.stats["hits"] + self.stats["late"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "pending": len(self.jobs),
+                "sessions": len(self.sessions),
+                "hit_rate": round(self.stats["hits"] / requests, 3) if requests else None,
+            }
+
+    def shutdown(self):
+        with self.condition:
+            self.closed = True
+            self.jobs.clear()
+            for session in self.sessions.values():
+                for running in session.running.values():
+                    running.set()
+            self.condition.notify_all()
+
@@ -0,0 +1,135 @@
+# scheduler.py
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Kelas prioritas: angka lebih kecil selalu didahulukan
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_PREFETCH = "prefetch"
+PRIORITY_BULK = "bulk"
+PRIORITY_CLASSES = (PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, PRIORITY_BULK)
+
+_context = contextvars.ContextVar("generation_context", default=(PRIORITY_INTERACTIVE, "anonymous"))
+
+
+@contextmanager
+def scheduling(priority, client):
+    """
+    Menetapkan kelas prioritas dan klien (mis. file_id) untuk semua generasi yang
+    dijalankan di dalam blok ini pada thread/konteks yang sama.
+    """
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Kelas prioritas tidak dikenal: {priority}")
+    token = _context.set((priority, client))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class _Ticket:
+    __slots__ = ("priority", "client", "sequence", "enqueued", "granted")
+
+    def __init__(self, priority, client, sequence):
+        self.priority = priority
+        self.client = client
+        self.sequence = sequence
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class GenerationScheduler:
+    """
+    Mengatur giliran pemanggilan model.generate. Hanya satu batch berjalan dalam
+    satu waktu; ketika batch selesai, giliran berikutnya diberikan ke kelas
+    prioritas tertinggi yang menunggu (interactive > prefetch > bulk). Di dalam
+    satu kelas, klien dilayani secara adil berbobot: setiap klien dibebani waktu
+    generasi dibagi bobotnya, dan klien dengan beban terkecil didahulukan.
+    Pekerjaan panjang terdiri dari banyak batch, sehingga request interaktif
+    baru menyalip di antara batch tanpa menghentikan batch yang sedang berjalan.
+    """
+    def __init__(self, weights=None, history_size=1000):
+        self.weights = dict(weights or {})  # klien -> bobot (default 1.0)
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.running = None
+        self.sequence = 0
+        self.virtual_time = {priority: {} for priority in PRIORITY_CLASSES}  # kelas -> {klien: beban}
+        self.waits = {priority: deque(maxlen=history_size) for priority in PRIORITY_CLASSES}
+        self.completed = {priority: 0 for priority in PRIORITY_CLASSES}
+
+    def set_weight(self, client, weight):
+        with self.condition:
+            self.weights[client] = weight
+
+    def _pick(self):
+        """Memilih tiket berikutnya: kelas prioritas, lalu beban klien terkecil, lalu FIFO."""
+        def rank(ticket):
+            return (
+                PRIORITY_CLASSES.index(ticket.priority),
+                self.virtual_time[ticket.priority].get(ticket.client, 0.0),
+                ticket.sequence,
+            )
+        return min(self.waiting, key=rank)
+
+    def _grant(self):
+        if self.running is None and self.waiting:
+            ticket = self._pick()
+            self.waiting.remove(ticket)
+            ticket.granted = True
+            self.running = ticket
+            self.condition.notify_all()
+
+    @contextmanager
+    def turn(self):
+        """Menunggu giliran untuk satu batch generasi sesuai konteks scheduling() saat ini."""
+        priority, client = _context.get()
+        with self.condition:
+            self.sequence += 1
+            ticket = _Ticket(priority, client, self.sequence)
+            # Klien baru mulai dari beban terkecil yang ada agar tidak menyalip klien lama tanpa batas
+            loads = self.virtual_time[priority]
+            if client not in loads:
+                loads[client] = min(loads.values(), default=0.0)
+            self.waiting.append(ticket)
+            self._grant()
+            while not ticket.granted:
+                self.condition.wait()
+            self.waits[priority].append(time.monotonic() - ticket.enqueued)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self.condition:
+                loads = self.virtual_time[priority]
+                loads[client] = loads.get(client, 0.0) + elapsed / self.weights.get(client, 1.0)
+                self.completed[priority] += 1
+                self.running = None
+                # Klien tanpa tiket menunggu tidak perlu diingat selamanya
+                if len(loads) > 256:
+                    active = {t.client for t in self.waiting if t.priority == priority}
+                    floor = min(loads.values())
+                    for name in [name for name in loads if name not in active]:
+                        del loads[name]
+                    for name in loads:
+                        loads[name] -= floor
+                self._grant()
+
+    def status(self):
+        """Panjang antrean dan waktu tunggu (detik) per kelas prioritas."""
+        with self.condition:
+            report = {"running": self.running.priority if self.running else None, "classes": {}}
+            for priority in PRIORITY_CLASSES:
+                waits = sorted(self.waits[priority])
+                report["classes"][priority] = {
+                    "queued": sum(1 for t in self.waiting if t.priority == priority),
+                    "completed": self.completed[priority],
+                    "wait_mean": round(sum(waits) / len(waits), 3) if waits else None,
+                    "wait_p95": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 3) if waits else None,
+                    "wait_max": round(waits[-1], 3) if waits else None,
+                }
+            return report
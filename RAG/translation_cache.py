@@ -0,0 +1,164 @@
+# translation_cache.py
+import os
+import re
+import glob
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: hanya penguncian antar thread
+    fcntl = None
+
+# Kunci cache menyertakan bahasa target, mis. "Indonesian::<kalimat Arab>".
+# Entri lama tanpa bahasa tetap dibaca, tetapi tidak dipakai untuk lookup
+# karena bahasa terjemahannya tidak diketahui.
+#
+# Nilai entri berupa {"text", "model", "prompt", "ts"} agar entri dari versi model
+# atau prompt lama bisa dibuang saat kompaksi. Nilai string lama tetap dibaca.
+KEY_SEPARATOR = "::"
+LANGUAGE_KEY_RE = re.compile(r'^([A-Za-z][A-Za-z \-]{0,31})::(.*)$', re.DOTALL)
+CACHE_SUFFIX = ".translation_cache.json"
+
+# Serialisasi baca-gabung-tulis antar thread dalam satu proses
+_save_lock = threading.Lock()
+
+
+def cache_path(cache_dir, book_hash):
+    """Path file cache terjemahan untuk satu buku."""
+    return os.path.join(cache_dir, f"{book_hash}{CACHE_SUFFIX}")
+
+
+def cache_key(chunk, target_language):
+    """Membuat kunci cache dari kalimat sumber dan bahasa target."""
+    return f"{target_language}{KEY_SEPARATOR}{chunk}"
+
+
+def split_cache_key(key):
+    """Memecah kunci cache menjadi (bahasa, kalimat). Bahasa bernilai None untuk entri lama."""
+    match = LANGUAGE_KEY_RE.match(key)
+    if match:
+        return match.group(1), match.group(2)
+    return None, key
+
+
+def entry_text(value):
+    """Teks terjemahan dari nilai entri (string lama atau dict bermetadata)."""
+    if isinstance(value, dict):
+        return value.get("text")
+    return value if isinstance(value, str) else None
+
+
+def entry_meta(value):
+    """(model, prompt, ts) dari nilai entri; None untuk entri lama tanpa metadata."""
+    if isinstance(value, dict):
+        return value.get("model"), value.get("prompt"), value.get("ts", 0)
+    return None, None, 0
+
+
+def make_entry(translation, model=None, prompt=None, ts=None):
+    return {"text": translation, "model": model, "prompt": prompt, "ts": round(time.time() if ts is None else ts, 3)}
+
+
+def lookup(cache, chunk, target_language):
+    """Mengambil terjemahan dari cache, atau None jika belum ada."""
+    return entry_text(cache.get(cache_key(chunk, target_language)))
+
+
+def store(cache, chunk, target_language, translation, model=None, prompt=None):
+    """Menyimpan satu terjemahan beserta versi model dan prompt ke dict cache (belum ditulis ke file)."""
+    cache[cache_key(chunk, target_language)] = make_entry(translation, model, prompt)
+
+
+def iter_entries(cache):
+    """Menghasilkan (bahasa, kalimat, terjemahan) untuk setiap entri cache."""
+    for key, value in cache.items():
+        translation = entry_text(value)
+        if translation is None:
+            continue
+        language, source = split_cache_key(key)
+        yield language, source, translation
+
+
+def iter_cache_dir(cache_dir):
+    """Menghasilkan (book_hash, bahasa, kalimat, terjemahan) dari semua file cache di direktori."""
+    for path in sorted(glob.glob(os.path.join(cache_dir, f"*{CACHE_SUFFIX}"))):
+        book_hash = os.path.basename(path)[:-len(CACHE_SUFFIX)]
+        for language, source, translation in iter_entries(load_cache(path)):
+            yield book_hash, language, source, translation
+
+
+def cache_version(path):
+    """Versi file cache (mtime dan ukuran) untuk ETag; "0" jika file belum ada."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return "0"
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def load_cache(path):
+    """Memuat cache terjemahan dari file JSON."""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            logging.warning(f"Tidak dapat membaca file cache: {e}. Memulai dengan cache kosong.")
+    return {}
+
+
+def save_cache(cache, path):
+    """
+    Menyimpan cache terjemahan ke file JSON secara atomik: ditulis ke file
+    sementara lalu diganti sekaligus, sehingga pembaca tidak pernah melihat
+    file setengah jadi.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            # Tanpa indentasi, dan json.dumps (encoder C) alih-alih json.dump ke file
+            # yang memakai encoder Python murni: jauh lebih cepat untuk cache besar
+            f.write(json.dumps(cache, ensure_ascii=False, separators=(',', ':')))
+        os.replace(tmp_path, path)
+    except IOError as e:
+        logging.error(f"Tidak dapat menyimpan file cache: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def _file_lock(path):
+    """Kunci eksklusif antar proses (juga antar host jika filesystem mendukung flock)."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def locked(path):
+    """Mengunci file cache untuk baca-ubah-tulis, antar thread maupun antar proses."""
+    with _save_lock, _file_lock(path):
+        yield
+
+
+def merge_save_cache(cache, path):
+    """
+    Menggabungkan dict cache dengan isi file terbaru lalu menyimpannya, sehingga
+    terjemahan yang ditulis thread atau proses lain sejak cache dimuat tidak
+    tertimpa. Entri di `cache` menang jika kuncinya sama; `cache` ikut diperbarui.
+    """
+    with locked(path):
+        merged = load_cache(path)
+        merged.update(cache)
+        save_cache(merged, path)
+        cache.update(merged)
@@ -0,0 +1,179 @@
+# translation_memory.py
+import re
+import sys
+import zlib
+import random
+import logging
+import threading
+import unicodedata
+
+# Harakat, tanda Quran, dan tatweel tidak mengubah makna untuk keperluan pencocokan
+ARABIC_MARKS_RE = re.compile(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+ALEF_RE = re.compile(r'[\u0622\u0623\u0625\u0671]')
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
+WHITESPACE_RE = re.compile(r'\s+')
+
+HASH_MASK = (1 << 32) - 1
+EMPTY_BIN = 1 << 32
+ROTATION_OFFSET = 1 << 33
+
+
+def normalize(text):
+    """Normalisasi untuk pencocokan: tanpa harakat, tanda baca, dan variasi alif/ya."""
+    text = unicodedata.normalize('NFKC', text)
+    text = ARABIC_MARKS_RE.sub('', text)
+    text = ALEF_RE.sub('\u0627', text).replace('\u0649', '\u064a')
+    text = PUNCTUATION_RE.sub(' ', text)
+    return WHITESPACE_RE.sub(' ', text).strip().lower()
+
+
+def shingles(normalized, n=3):
+    """Himpunan n-gram karakter dari teks yang sudah dinormalisasi."""
+    if len(normalized) <= n:
+        return {normalized}
+    return {normalized[i:i + n] for i in range(len(normalized) - n + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MemoryMatch:
+    """Hasil pencarian di translation memory."""
+    def __init__(self, kind, similarity, source, translation):
+        self.kind = kind              # "exact" (setelah normalisasi) atau "fuzzy"
+        self.similarity = similarity  # Jaccard n-gram karakter, 1.0 untuk exact
+        self.source = source
+        self.translation = translation
+
+    @property
+    def model_tag(self):
+        """Versi model untuk entri cache yang disajikan dari memory, bukan dihasilkan model."""
+        return f"memory:{self.kind}"
+
+
+class TranslationMemory:
+    """
+    Indeks translation memory per bahasa target: pencocokan persis setelah
+    normalisasi (dict) dan pencocokan mirip dengan MinHash LSH atas n-gram
+    karakter. Kandidat LSH diverifikasi dengan Jaccard sebenarnya.
+    """
+    def __init__(self, num_perm=32, bands=8, serve_threshold=0.92, fewshot_threshold=0.6,
+                 max_candidates=64, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm harus habis dibagi bands.")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.serve_threshold = serve_threshold
+        self.fewshot_threshold = fewshot_threshold
+        self.max_candidates = max_candidates
+        # Pengali ganjil untuk mengacak bit crc32 sebelum dibagi ke bin
+        self.multiplier = random.Random(seed).randrange(1, HASH_MASK) | 1
+        self.exact = {}    # bahasa -> {teks_normal: id}
+        self.buckets = {}  # bahasa -> [ {hash_band: [id, ...]} per band ]
+        self.entries = []  # id -> (teks_normal, kalimat_sumber, terjemahan)
+        self.lock = threading.Lock()
+        self.stats = {"exact": 0, "fuzzy": 0, "misses": 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _signature(self, shingle_set):
+        """
+        MinHash satu permutasi: setiap n-gram di-hash sekali lalu masuk ke salah satu
+        bin; bin kosong diisi dari bin berikutnya (densifikasi rotasi). Biayanya
+        sebanding dengan jumlah n-gram, bukan n-gram x jumlah permutasi.
+        """
+        num_bins = self.num_perm
+        signature = [EMPTY_BIN] * num_bins
+        for shingle in shingle_set:
+            h = (zlib.crc32(shingle.encode('utf-8')) * self.multiplier) & HASH_MASK
+            index = h % num_bins
+            value = h // num_bins
+            if value < signature[index]:
+                signature[index] = value
+        for i in range(num_bins):
+            if signature[i] == EMPTY_BIN:
+                for step in range(1, num_bins):
+                    source = signature[(i + step) % num_bins]
+                    if source < EMPTY_BIN:
+                        signature[i] = source + step * ROTATION_OFFSET
+                        break
+        return signature
+
+    def _band_keys(self, signature):
+        return [hash(tuple(signature[i * self.rows:(i + 1) * self.rows])) for i in range(self.bands)]
+
+    def add(self, source, target_language, translation):
+        """Menambahkan satu pasangan terjemahan ke indeks."""
+        normalized = normalize(source)
+        if not normalized or not translation:
+            return
+        with self.lock:
+            exact = self.exact.setdefault(target_language, {})
+            if normalized in exact:
+                entry_id = exact[normalized]
+                self.entries[entry_id] = (normalized, source, translation)
+                return
+            entry_id = len(self.entries)
+            self.entries.append((normalized, source, translation))
+            exact[normalized] = entry_id
+            bands = self.buckets.setdefault(target_language, [{} for _ in range(self.bands)])
+            for band, key in zip(bands, self._band_keys(self._signature(shingles(normalized)))):
+                band.setdefault(key, []).append(entry_id)
+
+    def approximate_bytes(self):
+        """Perkiraan memori indeks: teks entri ditambah pointer di bucket LSH."""
+        text = sum(sys.getsizeof(a) + sys.getsizeof(b) + sys.getsizeof(c) for a, b, c in self.entries)
+        return text + 8 * self.bands * len(self.entries) + 100 * len(self.entries)
+
+    def lookup(self, source, target_language):
+        """Mencari terjemahan yang sama atau mirip. Mengembalikan MemoryMatch atau None."""
+        normalized = normalize(source)
+        if not normalized:
+            return None
+
+        # Indeks dibaca di bawah lock yang sama dengan add(); MinHash dan Jaccard dihitung di luar lock
+        with self.lock:
+            exact = self.exact.get(target_language)
+            if not exact:
+                return None
+            entry_id = exact.get(normalized)
+            if entry_id is not None:
+                _, matched_source, translation = self.entries[entry_id]
+                self.stats["exact"] += 1
+                return MemoryMatch("exact", 1.0, matched_source, translation)
+
+        query = shingles(normalized)
+        band_keys = self._band_keys(self._signature(query))
+        with self.lock:
+            candidates = []
+            for band, key in zip(self.buckets.get(target_language, ()), band_keys):
+                for candidate in band.get(key, ()):
+                    if candidate not in candidates:
+                        candidates.append(candidate)
+                if len(candidates) >= self.max_candidates:
+                    break
+            candidate_entries = [self.entries[candidate] for candidate in candidates[:self.max_candidates]]
+
+        best = None
+        for candidate_normalized, matched_source, translation in candidate_entries:
+            similarity = jaccard(query, shingles(candidate_normalized))
+            if similarity >= self.fewshot_threshold and (best is None or similarity > best.similarity):
+                best = MemoryMatch("fuzzy", similarity, matched_source, translation)
+
+        self.stats["fuzzy" if best else "misses"] += 1
+        return best
+
+    def load(self, entries):
+        """Membangun indeks dari entri (bahasa, kalimat, terjemahan). Entri tanpa bahasa dilewati."""
+        added = 0
+        for language, source, translation in entries:
+            if language:
+                self.add(source, language, translation)
+                added += 1
+        logging.info(f"Translation memory berisi {len(self.entries)} entri unik dari {added} entri cache.")
+        return added
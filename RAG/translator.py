@@ -2,15 +2,18 @@
 import os
 import torch
 import gc
-import json
 import logging
 import re
+import threading
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 import ebooklib
 from ebooklib import epub
 from bs4 import BeautifulSoup, NavigableString
-from tqdm import tqdm
 from huggingface_hub import HfFolder
+from generation_budget import GenerationBudget, strip_repetition, trim_padding
+import translation_cache as tcache
+from translation_memory import TranslationMemory
+from scheduler import GenerationScheduler
 
 # --- FUNGSI UTILITAS ---
 def setup_logging(log_file='translation_api.log'):
@@ -33,18 +36,111 @@ def sentence_splitter(text):
     sentences = re.split(r'(?<=[.!?؟۔])\s+', text)
     return [s.strip() for s in sentences if s.strip()]
 
+def iter_document_sentences(item):
+    """Menghasilkan kalimat signifikan (lebih dari 2 kata) dari satu dokumen EPUB sesuai urutan baca."""
+    soup = BeautifulSoup(item.get_content(), 'html.parser')
+    text_nodes = soup.find_all(string=True)
+    for text_node in text_nodes:
+        if isinstance(text_node, NavigableString) and text_node.strip():
+            sentences_from_node = sentence_splitter(text_node.strip())
+            for sentence in sentences_from_node:
+                # Filter untuk kalimat yang signifikan (lebih dari 2 kata)
+                if len(sentence.split()) > 2:
+                    yield sentence
+
+def epub_documents(epub_path):
+    """
+    Membaca EPUB dan mengembalikan daftar (item, di_spine) untuk setiap dokumen:
+    dokumen spine dalam urutan baca lebih dulu, lalu dokumen lain di manifest.
+    """
+    book = epub.read_epub(epub_path)
+    documents = []
+    seen = set()
+    for idref, _ in book.spine:
+        item = book.get_item_with_id(idref)
+        if item is not None and item.get_type() == ebooklib.ITEM_DOCUMENT and item.get_id() not in seen:
+            seen.add(item.get_id())
+            documents.append((item, True))
+    for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
+        if item.get_id() not in seen:
+            documents.append((item, False))
+    return documents
+
+# Versi prompt dicatat di setiap entri cache; naikkan saat prompt diubah agar
+# entri lama bisa dibuang dengan kompaksi cache (cache_snapshot.py compact)
+PROMPT_VERSION = "chat-v1"
+PACKED_PROMPT_VERSION = "packed-v1"
+
+def translation_prompt(chunk, target_language):
+    return f"Translate the following Arabic text to {target_language}. Provide only the translation, without any additional text or explanations.\n\nArabic text: \"{chunk}\""
+
+def translation_messages(chunk, target_language, example=None):
+    """
+    Pesan chat untuk menerjemahkan satu kalimat Arab. `example` (MemoryMatch) yang
+    mirip dari translation memory disisipkan sebagai contoh few-shot.
+    """
+    messages = [{"role": "system", "content": "You are an expert translator."}]
+    if example is not None:
+        messages.append({"role": "user", "content": translation_prompt(example.source, target_language)})
+        messages.append({"role": "assistant", "content": example.translation})
+    messages.append({"role": "user", "content": translation_prompt(chunk, target_language)})
+    return messages
+
+PACKED_LINE_RE = re.compile(r'^\s*\[(\d+)\]\s*(.*?)\s*$')
+ARABIC_CHAR_RE = re.compile(r'[\u0600-\u06FF]')
+
+def split_packed_output(output, group):
+    """
+    Memecah output terjemahan paket bernomor menjadi terjemahan per kalimat.
+    Kalimat yang nomornya hilang, kosong, atau masih berupa teks Arab bernilai None.
+    Jika penomoran rusak (nomor ganda atau di luar rentang), seluruh paket bernilai None.
+    """
+    aligned = [None] * len(group)
+    current = None
+    for line in output.splitlines():
+        match = PACKED_LINE_RE.match(line)
+        if match:
+            number = int(match.group(1))
+            if not (1 <= number <= len(group)) or aligned[number - 1] is not None:
+                return [None] * len(group)
+            current = number - 1
+            aligned[current] = match.group(2)
+        elif current is not None and line.strip():
+            # Terjemahan yang terbawa ke baris berikutnya
+            aligned[current] = f"{aligned[current]} {line.strip()}"
+
+    for i, translation in enumerate(aligned):
+        if translation is None:
+            continue
+        translation = translation.strip().strip('"').strip()
+        arabic_ratio = len(ARABIC_CHAR_RE.findall(translation)) / max(1, len(translation))
+        aligned[i] = translation if translation and arabic_ratio < 0.5 else None
+    return aligned
+
 # --- KELAS UTAMA UNTUK PENERJEMAHAN ---
 class InteractiveTranslator:
     """
     Kelas profesional untuk menerjemahkan. Didesain untuk digunakan dalam API.
     Model dimuat sekali, dan fungsi-fungsi lain beroperasi berdasarkan permintaan.
     """
-    def __init__(self, model_id, cache_dir="cache"):
+    def __init__(self, model_id, cache_dir="cache", scheduler=None, memory_manager=None):
         self.model_id = model_id
         self.cache_dir = cache_dir
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model = None
         self.tokenizer = None
+        # Anggaran token baru diturunkan dari panjang sumber, bukan selalu 1024.
+        # Beam sengaja dimatikan (greedy seperti sebelumnya): request interaktif dan
+        # batch prefetch/bulk lebih diuntungkan latensi rendah daripada beam.
+        self.budget = GenerationBudget(legacy_budget=1024, max_new_tokens=1024, max_beams=1)
+        # Indeks terjemahan lintas buku untuk kalimat yang sama atau hampir sama
+        self.memory = TranslationMemory()
+        # Giliran generasi antara request interaktif, prefetch, dan pekerjaan massal
+        self.scheduler = scheduler or GenerationScheduler()
+        # Pembersihan memori hanya saat anggaran terlewati (lihat memory_manager.py)
+        self.memory_manager = memory_manager
+        # Tokenizer fast tidak aman dipakai bersamaan oleh thread interaktif, prefetch, dan bulk
+        self.tokenizer_lock = threading.Lock()
         
         os.makedirs(self.cache_dir, exist_ok=True)
 
@@ -71,6 +167,8 @@ class InteractiveTranslator:
         self.tokenizer = AutoTokenizer.from_pretrained(
             self.model_id, token=token, trust_remote_code=True
         )
+        # Model decoder-only harus di-padding kiri saat generasi batch
+        self.tokenizer.padding_side = "left"
         
         self.model = AutoModelForCausalLM.from_pretrained(
             self.model_id,
@@ -80,87 +178,236 @@ class InteractiveTranslator:
             trust_remote_code=True,
             token=token
         )
+        self.budget.learn(
+            ((lang, src, text) for _, lang, src, text in tcache.iter_cache_dir(self.cache_dir)),
+            self.tokenizer
+        )
+        if not len(self.memory):
+            self.memory.load((lang, src, text) for _, lang, src, text in tcache.iter_cache_dir(self.cache_dir))
         logging.info("Model berhasil dimuat dan siap digunakan.")
 
-    def scan_and_get_chunks(self, epub_path):
-        """Memindai EPUB dari path yang diberikan dan mengekstrak semua kalimat unik."""
-        if not os.path.exists(epub_path):
-            logging.error(f"Error: File EPUB tidak ditemukan di '{epub_path}'")
-            return []
-
-        logging.info(f"Memindai file EPUB: {os.path.basename(epub_path)} untuk menemukan semua kalimat...")
-        book = epub.read_epub(epub_path)
-        all_sentences = set()
-
-        for item in tqdm(book.get_items_of_type(ebooklib.ITEM_DOCUMENT), desc="Memindai item"):
-            soup = BeautifulSoup(item.get_content(), 'html.parser')
-            text_nodes = soup.find_all(string=True)
-            for text_node in text_nodes:
-                if isinstance(text_node, NavigableString) and text_node.strip():
-                    sentences_from_node = sentence_splitter(text_node.strip())
-                    for sentence in sentences_from_node:
-                        # Filter untuk kalimat yang signifikan (lebih dari 2 kata)
-                        if len(sentence.split()) > 2:
-                            all_sentences.add(sentence)
-        
-        return sorted(list(all_sentences))
+    def unload_model(self):
+        """Melepas model dan tokenizer dari memori. Model dimuat ulang saat load_model dipanggil lagi."""
+        if self.model is None:
+            return
+        self.model = None
+        self.tokenizer = None
+        gc.collect()
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+        logging.info(f"Model {self.model_id} dilepas dari memori.")
 
     def get_single_translation(self, chunk_to_translate, target_language, book_hash):
         """Menerjemahkan satu chunk, menggunakan cache spesifik untuk buku tersebut."""
-        cache_path = os.path.join(self.cache_dir, f"{book_hash}.translation_cache.json")
+        cache_path = self._cache_path(book_hash)
         translation_cache = self._load_cache(cache_path)
         
-        if chunk_to_translate in translation_cache:
+        cached = tcache.lookup(translation_cache, chunk_to_translate, target_language)
+        if cached is not None:
             logging.info(f"Terjemahan ditemukan di cache untuk chunk: '{chunk_to_translate[:30]}...'")
-            return translation_cache[chunk_to_translate]
+            return cached
+
+        match = self.memory.lookup(chunk_to_translate, target_language)
+        if match is not None and match.similarity >= self.memory.serve_threshold:
+            logging.info(f"Terjemahan diambil dari translation memory ({match.kind}, {match.similarity:.2f}) untuk chunk: '{chunk_to_translate[:30]}...'")
+            tcache.store(translation_cache, chunk_to_translate, target_language, match.translation, match.model_tag)
+            self._save_cache(translation_cache, cache_path)
+            return match.translation
 
         logging.info(f"Menerjemahkan chunk baru: '{chunk_to_translate[:30]}...'")
         
+        # Kecocokan yang kurang mirip untuk disajikan langsung tetap berguna sebagai contoh
+        messages = translation_messages(chunk_to_translate, target_language, example=match)
+        
+        source_tokens = len(self._source_ids([chunk_to_translate])[0])
+        translation = self._generate(messages, source_tokens, target_language)
+        
+        tcache.store(translation_cache, chunk_to_translate, target_language, translation, self.model_id, PROMPT_VERSION)
+        self._save_cache(translation_cache, cache_path)
+        self.memory.add(chunk_to_translate, target_language, translation)
+            
+        return translation
+
+    def get_packed_translations(self, chunks, target_language, book_hash, pack_size=4):
+        """
+        Menerjemahkan beberapa chunk berurutan dengan satu prompt bernomor.
+        Output dipecah kembali per kalimat dan divalidasi; kalimat yang gagal
+        diselaraskan diterjemahkan ulang satu per satu. Setiap kalimat tetap
+        disimpan ke cache secara terpisah.
+        """
+        cache_path = self._cache_path(book_hash)
+        translation_cache = self._load_cache(cache_path)
+
+        pending = []
+        served = False
+        for chunk in chunks:
+            if tcache.lookup(translation_cache, chunk, target_language) is not None or chunk in pending:
+                continue
+            match = self.memory.lookup(chunk, target_language)
+            if match is not None and match.similarity >= self.memory.serve_threshold:
+                tcache.store(translation_cache, chunk, target_language, match.translation, match.model_tag)
+                served = True
+            else:
+                pending.append(chunk)
+        if served:
+            # Ditulis sekarang; fallback get_single_translation memuat ulang cache dari file
+            self._save_cache(translation_cache, cache_path)
+
+        if pending:
+            logging.info(f"Menerjemahkan {len(pending)} chunk baru dalam paket berisi maksimal {pack_size} kalimat.")
+
+        fallback = []
+        for start in range(0, len(pending), pack_size):
+            group = pending[start:start + pack_size]
+            if len(group) == 1:
+                fallback.extend(group)
+                continue
+
+            aligned = self._translate_pack(group, target_language)
+            for chunk, translation in zip(group, aligned):
+                if translation is None:
+                    fallback.append(chunk)
+                else:
+                    tcache.store(translation_cache, chunk, target_language, translation, self.model_id, PACKED_PROMPT_VERSION)
+                    self.memory.add(chunk, target_language, translation)
+            self._save_cache(translation_cache, cache_path)
+
+        if fallback:
+            logging.info(f"{len(fallback)} kalimat gagal diselaraskan atau tidak dipaket. Menerjemahkan satu per satu.")
+        for chunk in fallback:
+            translation = self.get_single_translation(chunk, target_language, book_hash)
+            tcache.store(translation_cache, chunk, target_language, translation, self.model_id, PROMPT_VERSION)
+
+        return [tcache.lookup(translation_cache, chunk, target_language) for chunk in chunks]
+
+    def get_multi_translation(self, chunk_to_translate, target_languages, book_hash):
+        """
+        Menerjemahkan satu chunk ke beberapa bahasa target sekaligus. Prompt untuk
+        setiap bahasa yang belum ada di cache dijalankan dalam satu batch generasi,
+        dan semua hasilnya ditulis ke cache dalam satu kali penyimpanan.
+        """
+        cache_path = self._cache_path(book_hash)
+        translation_cache = self._load_cache(cache_path)
+
+        results = {}
+        missing = []
+        for language in dict.fromkeys(target_languages):
+            cached = tcache.lookup(translation_cache, chunk_to_translate, language)
+            if cached is not None:
+                results[language] = cached
+            else:
+                missing.append(language)
+
+        served = []
+        for language in missing:
+            match = self.memory.lookup(chunk_to_translate, language)
+            if match is not None and match.similarity >= self.memory.serve_threshold:
+                tcache.store(translation_cache, chunk_to_translate, language, match.translation, match.model_tag)
+                results[language] = match.translation
+                served.append(language)
+        missing = [language for language in missing if language not in served]
+
+        if not missing:
+            if served:
+                self._save_cache(translation_cache, cache_path)
+            logging.info(f"Semua {len(results)} bahasa ditemukan di cache untuk chunk: '{chunk_to_translate[:30]}...'")
+            return results
+
+        logging.info(f"Menerjemahkan chunk ke {len(missing)} bahasa dalam satu batch: {', '.join(missing)}")
+        messages_list = [translation_messages(chunk_to_translate, language) for language in missing]
+        # Sisi sumber cukup ditokenisasi sekali untuk semua bahasa
+        source_tokens = len(self._source_ids([chunk_to_translate])[0])
+        translations = self._generate_batch(messages_list, source_tokens, missing)
+
+        for language, translation in zip(missing, translations):
+            tcache.store(translation_cache, chunk_to_translate, language, translation, self.model_id, PROMPT_VERSION)
+            self.memory.add(chunk_to_translate, language, translation)
+            results[language] = translation
+        self._save_cache(translation_cache, cache_path)
+
+        return {language: results[language] for language in dict.fromkeys(target_languages)}
+
+    def _translate_pack(self, group, target_language):
+        """Menerjemahkan satu paket kalimat. Mengembalikan list terjemahan (None jika tidak valid)."""
+        numbered = "\n".join(f"[{i}] {chunk}" for i, chunk in enumerate(group, start=1))
         messages = [
             {"role": "system", "content": "You are an expert translator."},
-            {"role": "user", "content": f"Translate the following Arabic text to {target_language}. Provide only the translation, without any additional text or explanations.\n\nArabic text: \"{chunk_to_translate}\""}
+            {"role": "user", "content": f"Translate each numbered Arabic sentence below to {target_language}. Reply with exactly {len(group)} lines. Each line must start with the sentence number in square brackets, followed only by its translation, without any additional text or explanations.\n\n{numbered}"}
         ]
-        
-        prompt = self.tokenizer.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=True
-        )
-        
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
 
-        with torch.no_grad():
+        source_ids = self._source_ids(group)
+        # Tambahan beberapa token per baris untuk penanda nomor
+        source_tokens = sum(len(ids) for ids in source_ids) + 4 * len(group)
+        output = self._generate(messages, source_tokens, target_language)
+        return split_packed_output(output, group)
+
+    def translate_texts(self, texts, target_language):
+        """Menerjemahkan beberapa teks dalam satu batch tanpa cache (antarmuka backend registry)."""
+        messages_list = [translation_messages(text, target_language) for text in texts]
+        source_tokens = max(len(ids) for ids in self._source_ids(texts))
+        return self._generate_batch(messages_list, source_tokens, [target_language] * len(texts))
+
+    def _source_ids(self, texts):
+        """Token id teks sumber tanpa token khusus, untuk menghitung anggaran generasi."""
+        with self.tokenizer_lock:
+            return self.tokenizer(texts, add_special_tokens=False).input_ids
+
+    def _generate(self, messages, source_tokens, target_language):
+        """Menjalankan satu generasi dengan anggaran token yang disesuaikan panjang sumber."""
+        return self._generate_batch([messages], source_tokens, [target_language])[0]
+
+    def _generate_batch(self, messages_list, source_tokens, target_languages):
+        """
+        Menjalankan generasi untuk beberapa prompt dalam satu batch (padding kiri).
+        Anggaran token memakai bahasa target dengan rasio panjang terbesar.
+        """
+        prompts = [
+            self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            for messages in messages_list
+        ]
+        max_new_tokens = max(self.budget.max_new_tokens_for(source_tokens, language) for language in target_languages)
+
+        with self.scheduler.turn(), torch.no_grad():
+            # Tokenisasi (padding kiri dari load_model) di dalam giliran generasi
+            with self.tokenizer_lock:
+                inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+            prompt_length = inputs.input_ids.shape[1]
+            special_ids = {self.tokenizer.eos_token_id, self.tokenizer.pad_token_id}
+            stopping_criteria = self.budget.stopping_criteria(prompt_length, special_ids)
             outputs = self.model.generate(
                 inputs.input_ids, 
-                max_new_tokens=1024, 
+                attention_mask=inputs.attention_mask,
+                max_new_tokens=max_new_tokens, 
+                num_beams=self.budget.num_beams_for(source_tokens),
                 do_sample=False,
+                stopping_criteria=stopping_criteria,
                 pad_token_id=self.tokenizer.eos_token_id # Mencegah warning
             )
         
-        translation = self.tokenizer.decode(outputs[0][len(inputs.input_ids[0]):], skip_special_tokens=True).strip()
+        translations = []
+        looped = self.budget.looped_rows(stopping_criteria, len(messages_list))
+        for row, language, row_looped in zip(outputs, target_languages, looped):
+            generated = row[prompt_length:].tolist()
+            # Baris yang selesai lebih awal diisi token EOS sampai akhir batch
+            if self.tokenizer.eos_token_id in generated:
+                generated = generated[:generated.index(self.tokenizer.eos_token_id) + 1]
+            self.budget.report(language, source_tokens, max_new_tokens, len(generated), looped=row_looped)
+            # EOS di ekor dibuang sebelum mencari pengulangan
+            generated = trim_padding(generated, special_ids)
+            translations.append(self.tokenizer.decode(strip_repetition(generated), skip_special_tokens=True).strip())
         
-        translation_cache[chunk_to_translate] = translation
-        self._save_cache(translation_cache, cache_path)
-        
-        # Membersihkan memori GPU setelah setiap generasi
-        if self.device == "cuda":
-            torch.cuda.empty_cache()
-            gc.collect()
-            
-        return translation
+        if self.memory_manager is not None:
+            self.memory_manager.after_generation()
+
+        return translations
+
+    def _cache_path(self, book_hash):
+        return tcache.cache_path(self.cache_dir, book_hash)
 
     def _load_cache(self, path):
         """Memuat cache terjemahan dari file JSON."""
-        if os.path.exists(path):
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError) as e:
-                logging.warning(f"Tidak dapat membaca file cache: {e}. Memulai dengan cache kosong.")
-        return {}
+        return tcache.load_cache(path)
 
     def _save_cache(self, state, path):
-        """Menyimpan cache terjemahan ke file JSON."""
-        try:
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(state, f, ensure_ascii=False, indent=4)
-        except IOError as e:
-            logging.error(f"Tidak dapat menyimpan file cache: {e}")
+        """Menyimpan cache terjemahan ke file JSON, digabung dengan entri yang ditulis thread lain."""
+        tcache.merge_save_cache(state, path)
@@ -0,0 +1,345 @@
+# work_queue.py
+import os
+import glob
+import json
+import time
+import socket
+import sqlite3
+import logging
+import argparse
+
+from translator import InteractiveTranslator, setup_logging, PROMPT_VERSION
+from epub_export import file_sha256
+from book_scan import BookScan
+from scheduler import scheduling, PRIORITY_BULK
+import translation_cache as tcache
+
+DEFAULT_DB = "library_queue.sqlite"
+DEFAULT_MODEL_ID = "Qwen/Qwen2-1.5B-Instruct"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    book_hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    total_chunks INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_hash TEXT NOT NULL REFERENCES books(book_hash),
+    language TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    chunks TEXT NOT NULL,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started REAL,
+    finished REAL,
+    generated INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    UNIQUE (book_hash, language, start)
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, lease_expires);
+"""
+
+
+class WorkQueue:
+    """
+    Antrean kerja tahan lama di atas SQLite untuk menerjemahkan seluruh pustaka.
+    Setiap tugas adalah satu rentang chunk dari satu buku dalam satu bahasa.
+    Worker mengambil tugas dengan lease berbatas waktu; lease yang tidak
+    diperpanjang (worker mati) otomatis bisa diambil worker lain. Hasil ditulis
+    ke cache terjemahan bersama, sehingga mengulang tugas tidak menerjemahkan ulang.
+
+    Untuk beberapa host, letakkan database dan direktori cache di filesystem
+    bersama yang mendukung penguncian file.
+    """
+    def __init__(self, path=DEFAULT_DB, timeout=60):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Menambah kolom chunk_count ke database lama dan mengisinya sekali dari daftar chunk."""
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(tasks)")}
+        if "chunk_count" in columns:
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("ALTER TABLE tasks ADD COLUMN chunk_count INTEGER NOT NULL DEFAULT 0")
+            for row in self.conn.execute("SELECT id, chunks FROM tasks").fetchall():
+                self.conn.execute("UPDATE tasks SET chunk_count = ? WHERE id = ?", (len(json.loads(row["chunks"])), row["id"]))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self.conn.close()
+
+    def add_book(self, book_hash, path, chunks, languages, range_size=64):
+        """Mendaftarkan buku dan membaginya menjadi tugas per rentang chunk. Aman dipanggil ulang."""
+        added = 0
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO books (book_hash, path, total_chunks, created) VALUES (?, ?, ?, ?)",
+                (book_hash, path, len(chunks), time.time())
+            )
+            for language in languages:
+                for start in range(0, len(chunks), range_size):
+                    task_chunks = chunks[start:start + range_size]
+                    cursor = self.conn.execute(
+                        "INSERT OR IGNORE INTO tasks (book_hash, language, start, chunks, chunk_count) VALUES (?, ?, ?, ?, ?)",
+                        (book_hash, language, start, json.dumps(task_chunks, ensure_ascii=False), len(task_chunks))
+                    )
+                    added += cursor.rowcount
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def claim(self, owner, lease_seconds=600, max_attempts=3):
+        """
+        Mengambil satu tugas yang belum dikerjakan atau yang lease-nya kedaluwarsa.
+        Mengembalikan baris tugas, atau None jika antrean kosong.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Tugas yang lease-nya habis terlalu sering dianggap gagal agar tidak berputar selamanya
+            self.conn.execute(
+                "UPDATE tasks SET status = 'failed', owner = NULL, error = 'lease kedaluwarsa terlalu sering' "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, max_attempts)
+            )
+            task = self.conn.execute(
+                "SELECT * FROM tasks WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY book_hash, language, start LIMIT 1",
+                (now,)
+            ).fetchone()
+            if task is None:
+                self.conn.execute("COMMIT")
+                return None
+            if task["status"] == "leased":
+                logging.warning(f"Lease tugas #{task['id']} milik {task['owner']} kedaluwarsa. Diambil alih oleh {owner}.")
+            self.conn.execute(
+                "UPDATE tasks SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "started = COALESCE(started, ?) WHERE id = ?",
+                (owner, now + lease_seconds, now, task["id"])
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return task
+
+    def renew(self, task_id, owner, lease_seconds=600):
+        """Memperpanjang lease. Mengembalikan False jika tugas sudah diambil alih worker lain."""
+        cursor = self.conn.execute(
+            "UPDATE tasks SET lease_expires = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+            (time.time() + lease_seconds, task_id, owner)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, task_id, owner, generated):
+        cursor = self.conn.execute(
+            "UPDATE tasks SET status = 'done', finished = ?, generated = generated + ?, lease_expires = NULL "
+            "WHERE id = ? AND owner = ? AND status = 'leased'",
+            (time.time(), generated, task_id, owner)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, task_id, owner, error, max_attempts=3):
+        """Mengembalikan tugas ke antrean, atau menandainya gagal setelah max_attempts."""
+        self.conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "owner = NULL, lease_expires = NULL, error = ? WHERE id = ? AND owner = ?",
+            (max_attempts, error[:500], task_id, owner)
+        )
+
+    def progress(self):
+        """Ringkasan per buku dan bahasa: jumlah tugas per status, chunk selesai, dan throughput."""
+        # Diagregasi di SQLite dari chunk_count; daftar chunk setiap tugas tidak perlu di-parse
+        rows = self.conn.execute(
+            "SELECT b.book_hash, b.path, b.total_chunks, t.language, t.status, COUNT(*) AS tasks, "
+            "SUM(t.chunk_count) AS chunks, SUM(t.generated) AS generated, MIN(t.started) AS started, "
+            "MAX(t.finished) AS finished FROM tasks t JOIN books b USING (book_hash) "
+            "GROUP BY b.book_hash, t.language, t.status ORDER BY b.path, t.language"
+        ).fetchall()
+        now = time.time()
+        books = {}
+        for row in rows:
+            entry = books.setdefault((row["book_hash"], row["language"]), {
+                "book_hash": row["book_hash"], "path": row["path"], "language": row["language"],
+                "total_chunks": row["total_chunks"], "done_chunks": 0, "generated": 0,
+                "tasks": {"pending": 0, "leased": 0, "done": 0, "failed": 0},
+                "workers": set(), "first_started": None, "last_finished": None,
+            })
+            entry["tasks"][row["status"]] += row["tasks"]
+            if row["status"] == "done":
+                entry["done_chunks"] += row["chunks"]
+                entry["generated"] += row["generated"]
+                entry["last_finished"] = max(entry["last_finished"] or 0, row["finished"] or 0)
+            if row["started"]:
+                entry["first_started"] = min(entry["first_started"] or row["started"], row["started"])
+        for row in self.conn.execute(
+            "SELECT DISTINCT book_hash, language, owner FROM tasks WHERE status = 'leased' AND lease_expires >= ?", (now,)
+        ):
+            entry = books.get((row["book_hash"], row["language"]))
+            if entry is not None:
+                entry["workers"].add(row["owner"])
+
+        report = []
+        for entry in books.values():
+            elapsed = (entry.pop("last_finished") or now) - (entry.pop("first_started") or now)
+            entry["workers"] = sorted(entry["workers"])
+            entry["percent"] = round(100 * entry["done_chunks"] / max(1, entry["total_chunks"]), 1)
+            entry["chunks_per_minute"] = round(60 * entry["done_chunks"] / elapsed, 1) if elapsed > 0 else None
+            report.append(entry)
+        return report
+
+
+def find_epubs(paths):
+    """Mengumpulkan file EPUB dari daftar file dan/atau direktori."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(glob.glob(os.path.join(path, "**", "*.epub"), recursive=True)))
+        else:
+            found.append(path)
+    return found
+
+
+def enqueue(args):
+    """Koordinator: memindai buku dan memasukkan rentang chunk ke antrean."""
+    queue = WorkQueue(args.db)
+    try:
+        for path in find_epubs(args.paths):
+            # Penomoran chunk dalam urutan baca, sama dengan API
+            scan = BookScan(path)
+            scan.run()
+            chunks = scan.chunks
+            if not chunks:
+                logging.warning(f"Tidak ada kalimat yang dapat diterjemahkan di {path}. Dilewati.")
+                continue
+            book_hash = file_sha256(path)
+            added = queue.add_book(book_hash, os.path.abspath(path), chunks, args.languages, args.range_size)
+            logging.info(f"{os.path.basename(path)} ({book_hash[:10]}...): {len(chunks)} chunk, {added} tugas baru.")
+    finally:
+        queue.close()
+
+
+def work(args):
+    """Worker: mengambil lease, menerjemahkan lewat cache bersama, lalu menandai selesai."""
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    queue = WorkQueue(args.db)
+    translator = InteractiveTranslator(args.model_id, cache_dir=args.cache_dir)
+    translator.load_model()
+    logging.info(f"Worker {owner} siap.")
+    try:
+        while True:
+            task = queue.claim(owner, args.lease_seconds, args.max_attempts)
+            if task is None:
+                if args.exit_when_empty:
+                    logging.info("Antrean kosong. Worker berhenti.")
+                    return
+                time.sleep(args.poll_seconds)
+                continue
+
+            chunks = json.loads(task["chunks"])
+            book_hash, language = task["book_hash"], task["language"]
+            logging.info(f"Tugas #{task['id']}: {book_hash[:10]}... [{task['start'] + 1}-{task['start'] + len(chunks)}] ke {language}")
+            # Cache diperiksa lebih dulu, sehingga tugas yang diulang hanya melanjutkan sisa chunk
+            cache_path = tcache.cache_path(args.cache_dir, book_hash)
+            cache = tcache.load_cache(cache_path)
+            pending = [chunk for chunk in chunks if tcache.lookup(cache, chunk, language) is None]
+            # Translation memory disajikan lebih dulu seperti di jalur interaktif
+            served = {}
+            for chunk in pending:
+                match = translator.memory.lookup(chunk, language)
+                if match is not None and match.similarity >= translator.memory.serve_threshold:
+                    tcache.store(served, chunk, language, match.translation, match.model_tag)
+            if served:
+                tcache.merge_save_cache(served, cache_path)
+                pending = [chunk for chunk in pending if tcache.lookup(served, chunk, language) is None]
+            generated = 0
+            try:
+                with scheduling(PRIORITY_BULK, book_hash):
+                    # Satu generate per batch dan satu penulisan cache per batch, bukan per kalimat
+                    for start in range(0, len(pending), args.batch_size):
+                        batch = pending[start:start + args.batch_size]
+                        translations = translator.translate_texts(batch, language)
+                        updates = {}
+                        for chunk, translation in zip(batch, translations):
+                            tcache.store(updates, chunk, language, translation, translator.model_id, PROMPT_VERSION)
+                            translator.memory.add(chunk, language, translation)
+                        tcache.merge_save_cache(updates, cache_path)
+                        generated += len(batch)
+                        if not queue.renew(task["id"], owner, args.lease_seconds):
+                            raise RuntimeError("Lease hilang; tugas sudah diambil worker lain.")
+            except Exception as e:
+                logging.error(f"Tugas #{task['id']} gagal: {e}", exc_info=True)
+                queue.fail(task["id"], owner, str(e), args.max_attempts)
+                continue
+            queue.complete(task["id"], owner, generated)
+    finally:
+        queue.close()
+
+
+def show_status(args):
+    queue = WorkQueue(args.db)
+    try:
+        report = queue.progress()
+    finally:
+        queue.close()
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+    for entry in report:
+        tasks = entry["tasks"]
+        print(
+            f"{os.path.basename(entry['path'])} [{entry['language']}] {entry['done_chunks']}/{entry['total_chunks']} chunk "
+            f"({entry['percent']}%) | tugas selesai {tasks['done']}, berjalan {tasks['leased']}, menunggu {tasks['pending']}, "
+            f"gagal {tasks['failed']} | {entry['chunks_per_minute'] or '-'} chunk/menit | worker: {', '.join(entry['workers']) or '-'}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed whole-library translation with a SQLite work queue.")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Path to the SQLite queue database (shared between workers).")
+    parser.add_argument("--cache_dir", default="cache", help="Shared translation cache directory.")
+    parser.add_argument("--model_id", default=DEFAULT_MODEL_ID, help="Model ID from Hugging Face.")
+    parser.add_argument("--log_file", default="work_queue.log", help="File to store logs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser("enqueue", help="Scan EPUB files or directories and queue their chunk ranges.")
+    enqueue_parser.add_argument("paths", nargs="+", help="EPUB files or directories containing EPUB files.")
+    enqueue_parser.add_argument("-lang", "--languages", nargs="+", default=["English"], help="Target languages.")
+    enqueue_parser.add_argument("--range_size", type=int, default=64, help="Number of chunks per task.")
+    enqueue_parser.set_defaults(handler=enqueue)
+
+    worker_parser = commands.add_parser("worker", help="Claim and translate tasks until stopped.")
+    worker_parser.add_argument("--lease_seconds", type=int, default=600, help="Lease duration; renewed after every batch.")
+    worker_parser.add_argument("--max_attempts", type=int, default=3, help="Attempts before a task is marked failed.")
+    worker_parser.add_argument("--batch_size", type=int, default=8, help="Sentences per generate call and per cache write.")
+    worker_parser.add_argument("--poll_seconds", type=float, default=10, help="Wait time when the queue is empty.")
+    worker_parser.add_argument("--exit_when_empty", action="store_true", help="Stop when no task is left.")
+    worker_parser.set_defaults(handler=work)
+
+    status_parser = commands.add_parser("status", help="Show progress and throughput per book.")
+    status_parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    status_parser.set_defaults(handler=show_status)
+
+    args = parser.parse_args()
+    setup_logging(args.log_file)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,22 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from ebooklib import epub
 from bs4 import BeautifulSoup
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer
+from RAG.generation_budget import GenerationBudget, strip_repetition, trim_padding
+from RAG.paragraph_packer import pack_paragraphs, prompt_overhead
+from RAG.model_loading import load_causal_lm_low_memory
 
 # === KONFIGURASI ===
 CHECKPOINT = "bigscience/bloomz-7b1-mt"
 CACHE_DIR = "./model_cache/bloomz-7b1-mt"
 MAX_INPUT_LENGTH = 256
 MAX_OUTPUT_LENGTH = 512
+PROMPT_TEMPLATE = "Translate the following Islamic Arabic text to {target_language}.\nText: {text}\n\nTranslation:"
+PROMPT_LANGUAGES = ("English", "Indonesian", "Malay", "Japanese", "Korean")
+# Mode muat hemat memori: bfloat16/float16/float32/int8, dan offload disk di atas batas RAM (mis. "20GiB")
+MODEL_DTYPE = os.environ.get("BLOOMZ_DTYPE", "float16" if torch.cuda.is_available() else "float32")
+MAX_CPU_MEMORY = os.environ.get("BLOOMZ_MAX_CPU_MEMORY") or None
+OFFLOAD_DIR = os.environ.get("BLOOMZ_OFFLOAD_DIR") or None
 
 app = FastAPI()
 
@@ -28,18 +37,28 @@ app.add_middleware(
 
 tokenizer = None
 model = None
+load_report = None
 chunks = []
+budget = GenerationBudget(legacy_budget=MAX_OUTPUT_LENGTH, max_new_tokens=MAX_OUTPUT_LENGTH, max_beams=2)
 
 
-def load_model():
-    global tokenizer, model
-    if tokenizer is None or model is None:
+def load_tokenizer():
+    global tokenizer
+    if tokenizer is None:
         tokenizer = AutoTokenizer.from_pretrained(CHECKPOINT, cache_dir=CACHE_DIR)
-        model = AutoModelForCausalLM.from_pretrained(
+    return tokenizer
+
+
+def load_model():
+    global model, load_report
+    load_tokenizer()
+    if model is None:
+        model, load_report = load_causal_lm_low_memory(
             CHECKPOINT,
             cache_dir=CACHE_DIR,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-            device_map={"": "cpu"}
+            dtype=MODEL_DTYPE,
+            max_cpu_memory=MAX_CPU_MEMORY,
+            offload_dir=OFFLOAD_DIR
         )
 
 
@@ -65,30 +84,35 @@ def extract_text_from_epub(epub_file):
 
 
 def split_paragraphs(paragraphs, max_chunk_length=MAX_INPUT_LENGTH):
-    chunks, current = [], ''
-    for para in paragraphs:
-        if len(current) + len(para) < max_chunk_length:
-            current += para + ' '
-        else:
-            chunks.append(current.strip())
-            current = para + ' '
-    if current:
-        chunks.append(current.strip())
-    return chunks
+    # Dikemas berdasarkan jumlah token termasuk prompt, sehingga tidak ada yang terpotong
+    tok = load_tokenizer()
+    overhead = prompt_overhead(tok, PROMPT_TEMPLATE, PROMPT_LANGUAGES)
+    return pack_paragraphs(paragraphs, tok, max_chunk_length, overhead)
 
 
 def translate_text(text, target_language):
     load_model()
-    prompt = f"Translate the following Islamic Arabic text to {target_language}.\nText: {text}\n\nTranslation:"
+    prompt = PROMPT_TEMPLATE.format(target_language=target_language, text=text)
+    # Chunk dari split_paragraphs sudah muat; truncation tetap menjadi pengaman untuk teks dari luar
     inputs = tokenizer(prompt, return_tensors='pt', truncation=True, max_length=MAX_INPUT_LENGTH).to(model.device)
+    prompt_length = inputs['input_ids'].shape[1]
+    source_tokens = len(tokenizer(text, add_special_tokens=False)['input_ids'])
+    # Batas lama: MAX_OUTPUT_LENGTH termasuk prompt
+    legacy_budget = max(1, MAX_OUTPUT_LENGTH - prompt_length)
+    max_new_tokens = min(legacy_budget, budget.max_new_tokens_for(source_tokens, target_language))
+    special_ids = {tokenizer.pad_token_id, tokenizer.eos_token_id}
+    stopping_criteria = budget.stopping_criteria(prompt_length, special_ids)
     outputs = model.generate(
         **inputs,
-        max_length=MAX_OUTPUT_LENGTH,
-        num_beams=2,
+        max_new_tokens=max_new_tokens,
+        num_beams=budget.num_beams_for(source_tokens),
         no_repeat_ngram_size=2,
-        early_stopping=True
+        early_stopping=True,
+        stopping_criteria=stopping_criteria
     )
-    result = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    generated = outputs[0][prompt_length:].tolist()
+    budget.report(target_language, source_tokens, max_new_tokens, len(generated), stopping_criteria, legacy_budget)
+    result = tokenizer.decode(strip_repetition(trim_padding(generated, special_ids)), skip_special_tokens=True)
     return result.split('Translation:')[-1].strip()
 
 
@@ -105,6 +129,13 @@ async def get_total_chunk(file: UploadFile = File(...)):
     return {"total": len(chunks)}
 
 
+@app.get("/load-report")
+async def get_load_report():
+    if load_report is None:
+        return JSONResponse(status_code=404, content={"error": "Model belum dimuat."})
+    return load_report
+
+
 @app.post("/process-chunk")
 async def process_chunk(file: UploadFile = File(...), chunk: int = Form(...), target_language: str = Form(...)):
     if chunk < 0 or chunk >= len(chunks):
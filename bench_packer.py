@@ -0,0 +1,79 @@
+# bench_packer.py
+import json
+import time
+import argparse
+from transformers import AutoTokenizer
+from api import (
+    CHECKPOINT, CACHE_DIR, MAX_INPUT_LENGTH, PROMPT_TEMPLATE, PROMPT_LANGUAGES, extract_text_from_epub
+)
+from RAG.paragraph_packer import pack_paragraphs, prompt_overhead
+
+
+def legacy_split_paragraphs(paragraphs, max_chunk_length=MAX_INPUT_LENGTH):
+    """Packer lama berbasis jumlah karakter, disalin apa adanya sebagai pembanding."""
+    chunks, current = [], ''
+    for para in paragraphs:
+        if len(current) + len(para) < max_chunk_length:
+            current += para + ' '
+        else:
+            chunks.append(current.strip())
+            current = para + ' '
+    if current:
+        chunks.append(current.strip())
+    return chunks
+
+
+def measure(name, packer, tokenizer, overhead, repeats):
+    """Mengukur waktu packing dan token yang terpotong/terbuang untuk satu packer."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        chunks = packer()
+    elapsed = (time.perf_counter() - start) / repeats
+
+    lengths = [len(ids) + overhead for ids in tokenizer(chunks, add_special_tokens=False)["input_ids"]] if chunks else []
+    truncated = sum(max(0, length - MAX_INPUT_LENGTH) for length in lengths)
+    wasted = sum(max(0, MAX_INPUT_LENGTH - length) for length in lengths)
+    return {
+        "packer": name,
+        "seconds": round(elapsed, 4),
+        "chunks": len(chunks),
+        "empty_chunks": sum(1 for chunk in chunks if not chunk),
+        "truncated_chunks": sum(1 for length in lengths if length > MAX_INPUT_LENGTH),
+        "truncated_tokens": truncated,
+        "wasted_tokens": wasted,
+        "fill_ratio": round(sum(min(length, MAX_INPUT_LENGTH) for length in lengths) / max(1, MAX_INPUT_LENGTH * len(lengths)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark character-based vs token-budget paragraph packing for an EPUB.")
+    parser.add_argument("epub_path", help="Path to the source Arabic EPUB file.")
+    parser.add_argument("--checkpoint", default=CHECKPOINT, help="Tokenizer to measure with.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of packing runs to average.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.checkpoint, cache_dir=CACHE_DIR)
+    paragraphs = extract_text_from_epub(args.epub_path)
+    overhead = prompt_overhead(tokenizer, PROMPT_TEMPLATE, PROMPT_LANGUAGES)
+
+    results = [
+        measure("char (lama)", lambda: legacy_split_paragraphs(paragraphs), tokenizer, overhead, args.repeats),
+        measure("token", lambda: pack_paragraphs(paragraphs, tokenizer, MAX_INPUT_LENGTH, overhead),
+                tokenizer, overhead, args.repeats),
+    ]
+
+    if args.json:
+        print(json.dumps({"paragraphs": len(paragraphs), "prompt_overhead": overhead, "results": results}, indent=2))
+        return
+
+    print(f"Paragraf: {len(paragraphs)} | overhead prompt: {overhead} token | batas input: {MAX_INPUT_LENGTH} token\n")
+    columns = list(results[0].keys())
+    print("| " + " | ".join(columns) + " |")
+    print("|" + "---|" * len(columns))
+    for result in results:
+        print("| " + " | ".join(str(result[column]) for column in columns) + " |")
+
+
+if __name__ == "__main__":
+    main()
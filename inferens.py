@@ -4,6 +4,7 @@ from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 from main import Config, TextPreprocessor  # Mengimpor konfigurasi dan preprocessor yang sama
 import argparse
 import time
+from RAG.generation_budget import GenerationBudget, strip_repetition, trim_padding
 
 class TranslationInference:
     def __init__(self, model_path):
@@ -12,6 +13,8 @@ class TranslationInference:
         self.model = AutoModelForSeq2SeqLM.from_pretrained(model_path).to(self.device)
         self.preprocessor = TextPreprocessor()
         self.model.eval()  # Mode evaluasi
+        # Beam hingga 5 hanya untuk batch pendek; batch panjang memakai beam lebih sempit
+        self.budget = GenerationBudget(max_beams=5, beam_schedule=((48, 5), (128, 3), (192, 2)))
 
     def preprocess_input(self, text):
         """Proses teks input sama seperti saat training"""
@@ -19,7 +22,7 @@ class TranslationInference:
         sentences = self.preprocessor.split_sentences(clean_text)
         return self.preprocessor.filter_sentences(sentences)
 
-    def translate(self, text, batch_size=4, max_length=256):
+    def translate(self, text, batch_size=4, max_length=256, target_language="English"):
         # Preprocess teks input
         sentences = self.preprocess_input(text)
         print(f"Memproses {len(sentences)} kalimat...")
@@ -39,18 +42,35 @@ class TranslationInference:
                     return_tensors="pt"
                 ).to(self.device)
 
+                # Anggaran ditentukan oleh kalimat terpanjang dalam batch
+                row_source_tokens = inputs.attention_mask.sum(dim=1).tolist()
+                source_tokens = max(row_source_tokens)
+                max_new_tokens = min(max_length, self.budget.max_new_tokens_for(source_tokens, target_language))
+                # Decoder seq2seq diawali satu token start; baris yang selesai diisi pad/EOS
+                special_ids = {self.tokenizer.pad_token_id, self.tokenizer.eos_token_id}
+                stopping_criteria = self.budget.stopping_criteria(1, special_ids)
+
                 # Generate terjemahan
                 outputs = self.model.generate(
                     input_ids=inputs.input_ids,
                     attention_mask=inputs.attention_mask,
-                    max_length=max_length,
-                    num_beams=5,  # Meningkatkan kualitas terjemahan
-                    early_stopping=True
+                    max_new_tokens=max_new_tokens,
+                    num_beams=self.budget.num_beams_for(source_tokens),
+                    early_stopping=True,
+                    stopping_criteria=stopping_criteria
                 )
+                # Statistik per baris; padding/EOS di ekor dibuang dulu agar pengulangan sebelum EOS terdeteksi
+                rows = []
+                looped = self.budget.looped_rows(stopping_criteria, len(batch))
+                for row, row_tokens, row_looped in zip(outputs.tolist(), row_source_tokens, looped):
+                    generated = trim_padding(row[1:], special_ids)
+                    self.budget.report(target_language, row_tokens, max_new_tokens, len(generated),
+                                       legacy_budget=max_length, looped=row_looped)
+                    rows.append(strip_repetition(generated))
 
                 # Decode hasil
                 batch_translations = self.tokenizer.batch_decode(
-                    outputs,
+                    rows,
                     skip_special_tokens=True,
                     clean_up_tokenization_spaces=True
                 )
@@ -111,6 +131,7 @@ def main():
     print(f"\nWaktu total: {end_time - start_time:.2f} detik")
     print(f"Jumlah kalimat: {len(sentences)}")
     print(f"Kecepatan: {len(sentences)/(end_time - start_time):.2f} kalimat/detik")
+    print(f"Token dihemat oleh anggaran generasi: {translator.budget.total_saved}")
 
 if __name__ == "__main__":
     main()
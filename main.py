@@ -1,20 +1,32 @@
 # pre_train_translation_model.py
 import os
 import re
+import json
+import time
+import socket
+import shutil
+import argparse
 import zipfile
 import xml.etree.ElementTree as ET
 from datetime import datetime
 from bs4 import BeautifulSoup
 import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
 from transformers import (
     AutoTokenizer,
     AutoModelForSeq2SeqLM,
     Seq2SeqTrainingArguments,
     Seq2SeqTrainer,
-    DataCollatorForSeq2Seq
+    DataCollatorForSeq2Seq,
+    TrainerCallback
 )
 from datasets import Dataset
 import pandas as pd
+try:
+    from sacrebleu.metrics import BLEU, CHRF
+except ImportError:  # sacrebleu hanya dibutuhkan untuk evaluasi sampel
+    BLEU = CHRF = None
 import html
 import ebooklib
 from ebooklib import epub# pre_train_translation_model.py
@@ -34,6 +46,15 @@ class Config:
     MAX_LENGTH = 256
     MIN_SENTENCE_LENGTH = 15
     MAX_SENTENCE_LENGTH = 300
+    SEED = 42  # Split train/test harus sama di setiap proses training terdistribusi
+    NUM_PROCS = 1  # Jumlah proses training data-parallel di CPU (gloo)
+    SCALING_STEPS = 30  # Langkah per ukuran pada laporan skala --scaling
+    # "sampled" (sampel, async; perlu sacrebleu), "full" (seluruh split test), "none"
+    EVAL_MODE = "sampled" if BLEU is not None else "none"
+    EVAL_SAMPLES = 200  # Ukuran sampel evaluasi, distratifikasi berdasarkan panjang kalimat
+    EVAL_LENGTH_BUCKETS = 4
+    EVAL_BATCH_SIZE = 32
+    EVAL_THREADS = 2  # Thread CPU untuk proses evaluasi agar tidak berebut dengan training
 
 # 2. Ekstraksi EPUB yang Diperbaiki
 class EPUBProcessor:
@@ -105,8 +126,8 @@ class TextPreprocessor:
 
 # 4. Pipeline Training
 class TranslationTrainer:
-    def __init__(self):
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    def __init__(self, device=None):
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
         self.tokenizer = AutoTokenizer.from_pretrained(Config.MODEL_NAME, use_auth_token=True)
         self.model = AutoModelForSeq2SeqLM.from_pretrained(Config.MODEL_NAME, use_auth_token=True).to(self.device)
 
@@ -134,9 +155,24 @@ class TranslationTrainer:
         for i in range(0, len(lst), n):
             yield lst[i:i + n]
 
-    def train(self, train_df):
+    def train(self, train_df, distributed=False, max_steps=None, eval_mode=Config.EVAL_MODE, eval_samples=Config.EVAL_SAMPLES,
+              eval_cores=None):
+        """
+        Fine-tuning model. Dengan `distributed=True` fungsi ini dijalankan di setiap
+        proses dari launch_distributed (process group gloo sudah dibuat) dan hanya
+        rank 0 yang menyimpan model. `max_steps` dipakai laporan skala: training
+        dibatasi sejumlah langkah tanpa evaluasi dan checkpoint.
+        `eval_mode` "sampled" menilai sampel split test dari setiap checkpoint di
+        proses terpisah (lihat AsyncEvalCallback); "full" memakai evaluasi bawaan
+        Trainer per epoch atas seluruh split test. `eval_cores` mengunci proses
+        evaluasi ke core yang tidak dipakai rank training.
+        Mengembalikan metrik training (termasuk train_samples_per_second).
+        """
         dataset = Dataset.from_pandas(train_df)
-        dataset = dataset.train_test_split(test_size=0.1)
+        dataset = dataset.train_test_split(test_size=0.1, seed=Config.SEED)
+        benchmark = max_steps is not None
+        if benchmark:
+            eval_mode = "none"
 
         def preprocess(examples):
             inputs = [ex for ex in examples['source']]
@@ -166,37 +202,315 @@ class TranslationTrainer:
             remove_columns=dataset["train"].column_names
         )
 
+        if distributed:
+            # CPU saja: tiap proses memegang satu replika model, gradien di-all-reduce lewat gloo
+            distributed_args = dict(
+                use_cpu=True,
+                ddp_backend="gloo",
+                ddp_find_unused_parameters=False,
+                bf16=cpu_supports_bf16(),
+                dataloader_num_workers=0
+            )
+        else:
+            distributed_args = dict(fp16=torch.cuda.is_available())
+
         args = Seq2SeqTrainingArguments(
             output_dir=Config.SAVE_DIR,
-            evaluation_strategy="epoch",
+            evaluation_strategy="epoch" if eval_mode == "full" else "no",
+            save_strategy="no" if benchmark else ("epoch" if eval_mode == "sampled" else "steps"),
             learning_rate=Config.LEARNING_RATE,
             per_device_train_batch_size=Config.BATCH_SIZE,
             per_device_eval_batch_size=Config.BATCH_SIZE,
             num_train_epochs=Config.EPOCHS,
+            max_steps=max_steps if benchmark else -1,
             weight_decay=0.01,
             save_total_limit=3,
             predict_with_generate=True,
-            fp16=torch.cuda.is_available(),
             logging_steps=100,
-            report_to="none"
+            seed=Config.SEED,
+            report_to="none",
+            **distributed_args
         )
 
+        callbacks = []
+        if eval_mode == "sampled":
+            sample = stratified_sample(dataset["test"].to_pandas(), eval_samples)
+            callbacks.append(AsyncEvalCallback(
+                sample["source"].tolist(), sample["target"].tolist(), Config.SAVE_DIR, cores=eval_cores
+            ))
+
         trainer = Seq2SeqTrainer(
             self.model,
             args,
             train_dataset=tokenized_ds["train"],
-            eval_dataset=tokenized_ds["test"],
+            eval_dataset=tokenized_ds["test"] if eval_mode == "full" else None,
             data_collator=DataCollatorForSeq2Seq(self.tokenizer),
-            tokenizer=self.tokenizer
+            tokenizer=self.tokenizer,
+            callbacks=callbacks
         )
 
-        print("Memulai training...")
-        trainer.train()
-        self.model.save_pretrained(Config.SAVE_DIR)
-        self.tokenizer.save_pretrained(Config.SAVE_DIR)
+        if trainer.is_world_process_zero():
+            print("Memulai training...")
+        result = trainer.train()
+        if not benchmark and trainer.is_world_process_zero():
+            self.model.save_pretrained(Config.SAVE_DIR)
+            self.tokenizer.save_pretrained(Config.SAVE_DIR)
+        return result.metrics
+
+# 5. Evaluasi Sampel Asinkron
+def stratified_sample(df, size, buckets=Config.EVAL_LENGTH_BUCKETS, seed=Config.SEED):
+    """
+    Sampel tetap dari split test dengan proporsi kelompok panjang kalimat yang sama,
+    sehingga skor antar-checkpoint sebanding dan kalimat panjang tetap terwakili.
+    """
+    if len(df) <= size:
+        return df
+    strata = pd.qcut(df["source"].str.len().rank(method="first"), q=min(buckets, len(df)), labels=False)
+    return df.groupby(strata, group_keys=False).sample(frac=size / len(df), random_state=seed)
+
+def _eval_worker(sources, references, jobs, results_path, threads, cores=None):
+    """
+    Proses evaluasi yang hidup selama training. Tokenisasi sumber dan statistik
+    referensi BLEU/chrF dihitung sekali, lalu dipakai ulang untuk setiap checkpoint.
+    """
+    if cores:
+        # Jangan mewarisi blok core rank 0; pakai core yang disisihkan untuk evaluasi
+        os.sched_setaffinity(0, cores)
+        threads = len(cores)
+    torch.set_num_threads(threads)
+    tokenizer = AutoTokenizer.from_pretrained(Config.MODEL_NAME)
+    # Urutkan berdasarkan panjang agar padding di setiap batch minimal
+    order = sorted(range(len(sources)), key=lambda i: len(sources[i]))
+    batches = []
+    for i in range(0, len(order), Config.EVAL_BATCH_SIZE):
+        indices = order[i:i + Config.EVAL_BATCH_SIZE]
+        inputs = tokenizer(
+            [sources[j] for j in indices],
+            max_length=Config.MAX_LENGTH,
+            truncation=True,
+            padding='longest',
+            return_tensors="pt"
+        )
+        batches.append((indices, inputs))
+    bleu = BLEU(references=[references])
+    chrf = CHRF(references=[references])
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        checkpoint, step, epoch = job
+        start = time.perf_counter()
+        try:
+            model = AutoModelForSeq2SeqLM.from_pretrained(checkpoint).eval()
+            hypotheses = [None] * len(sources)
+            with torch.inference_mode():
+                for indices, inputs in batches:
+                    outputs = model.generate(**inputs, num_beams=1, do_sample=False, max_new_tokens=Config.MAX_LENGTH)
+                    for index, text in zip(indices, tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+                        hypotheses[index] = text
+            del model
+            result = {
+                "step": step,
+                "epoch": epoch,
+                "checkpoint": os.path.basename(checkpoint),
+                "samples": len(sources),
+                "bleu": round(bleu.corpus_score(hypotheses, None).score, 2),
+                "chrf": round(chrf.corpus_score(hypotheses, None).score, 2),
+                "seconds": round(time.perf_counter() - start, 1)
+            }
+        except Exception as e:
+            # Satu checkpoint yang gagal tidak menghentikan evaluasi checkpoint berikutnya
+            print(f"Evaluasi langkah {step} gagal: {e}")
+            result = {"step": step, "epoch": epoch, "checkpoint": os.path.basename(checkpoint), "error": str(e)}
+        finally:
+            # Salinan checkpoint khusus evaluasi tidak diperlukan lagi
+            shutil.rmtree(checkpoint, ignore_errors=True)
+        with open(results_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+        if "error" not in result:
+            print(f"Evaluasi langkah {step}: BLEU {result['bleu']}, chrF {result['chrf']} ({result['seconds']} detik)")
+
+def _link_or_copy(src, dst):
+    """Hard link jika bisa (tanpa menyalin data), selain itu salin file."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+class AsyncEvalCallback(TrainerCallback):
+    """
+    Menilai setiap checkpoint yang disimpan dengan decoding greedy atas sampel tetap
+    di proses terpisah, sehingga training tidak berhenti menunggu evaluasi. Hasil
+    ditulis ke eval_results.jsonl di output_dir. Hanya rank 0 yang menjalankannya.
+    Bobot checkpoint di-hard-link ke eval-pending/ saat disimpan, sehingga rotasi
+    save_total_limit tidak menghapusnya sebelum dinilai.
+    """
+    def __init__(self, sources, references, output_dir, threads=Config.EVAL_THREADS, cores=None):
+        if BLEU is None:
+            raise RuntimeError("Evaluasi sampel memerlukan paket 'sacrebleu'; pasang atau gunakan --eval full.")
+        self.args = (sources, references)
+        self.results_path = os.path.join(output_dir, "eval_results.jsonl")
+        self.pending_dir = os.path.join(output_dir, "eval-pending")
+        self.threads = threads
+        self.cores = cores
+        self.jobs = None
+        self.process = None
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        context = mp.get_context("spawn")
+        self.jobs = context.Queue()
+        self.process = context.Process(
+            target=_eval_worker,
+            args=(*self.args, self.jobs, self.results_path, self.threads, self.cores),
+            name="async-eval"
+        )
+        self.process.start()
+
+    def on_save(self, args, state, control, **kwargs):
+        if self.jobs is not None:
+            checkpoint = os.path.join(args.output_dir, f"checkpoint-{state.global_step}")
+            staged = os.path.join(self.pending_dir, f"checkpoint-{state.global_step}")
+            # State optimizer tidak diperlukan untuk evaluasi; dihapus proses evaluasi setelah dinilai
+            shutil.copytree(
+                checkpoint, staged, copy_function=_link_or_copy, dirs_exist_ok=True,
+                ignore=shutil.ignore_patterns("optimizer.pt", "scheduler.pt", "rng_state*", "global_step*")
+            )
+            self.jobs.put((staged, state.global_step, state.epoch))
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self.process is not None:
+            # Checkpoint terakhir tetap dinilai sebelum training dianggap selesai
+            self.jobs.put(None)
+            self.process.join()
+            self.process = None
+
+# 6. Training Data-Parallel di CPU
+def cpu_supports_bf16():
+    """bf16 autocast hanya dipakai jika CPU punya instruksi bf16 native (AVX512-BF16 atau AMX)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+def partition_cores(world_size, reserved=0):
+    """
+    Membagi core yang tersedia menjadi blok berurutan yang tidak tumpang tindih per
+    rank, setelah menyisihkan `reserved` core terakhir (mis. untuk proses evaluasi).
+    Mengembalikan (blok per rank, core yang disisihkan).
+    """
+    cores = sorted(os.sched_getaffinity(0))
+    if len(cores) - reserved < world_size:
+        reserved = 0  # Terlalu sedikit core; evaluasi berbagi core dengan training
+    training, spare = cores[:len(cores) - reserved], cores[len(cores) - reserved:]
+    per_rank = max(1, len(training) // world_size)
+    blocks = [training[(rank * per_rank) % len(training):][:per_rank] for rank in range(world_size)]
+    return blocks, spare
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _distributed_worker(rank, world_size, port, train_df, max_steps, eval_mode, eval_samples, results):
+    # Setiap rank dikunci ke blok core sendiri agar thread intra-op tidak saling berebut;
+    # evaluasi sampel mendapat core sendiri yang tidak dipakai rank mana pun
+    reserved = Config.EVAL_THREADS if eval_mode == "sampled" else 0
+    blocks, eval_cores = partition_cores(world_size, reserved)
+    cores = blocks[rank]
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+
+    os.environ.update({
+        "MASTER_ADDR": "127.0.0.1", "MASTER_PORT": str(port),
+        "RANK": str(rank), "LOCAL_RANK": str(rank), "WORLD_SIZE": str(world_size)
+    })
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    try:
+        trainer = TranslationTrainer(device="cpu")
+        metrics = trainer.train(
+            train_df, distributed=True, max_steps=max_steps,
+            eval_mode=eval_mode, eval_samples=eval_samples, eval_cores=eval_cores or None
+        )
+        if rank == 0 and results is not None:
+            results.put({"processes": world_size, "threads_per_process": len(cores), **metrics})
+    finally:
+        dist.destroy_process_group()
+
+def launch_distributed(train_df, num_procs, max_steps=None, eval_mode=Config.EVAL_MODE, eval_samples=Config.EVAL_SAMPLES):
+    """
+    Menjalankan training data-parallel di `num_procs` proses lokal (backend gloo,
+    tanpa GPU). Ukuran batch per proses tetap Config.BATCH_SIZE, sehingga batch
+    global = num_procs x Config.BATCH_SIZE. Mengembalikan metrik dari rank 0.
+    """
+    context = mp.get_context("spawn")
+    results = context.SimpleQueue()
+    mp.spawn(
+        _distributed_worker,
+        args=(num_procs, _free_port(), train_df, max_steps, eval_mode, eval_samples, results),
+        nprocs=num_procs,
+        join=True
+    )
+    return results.get() if not results.empty() else {}
+
+def scaling_report(train_df, max_procs, steps=Config.SCALING_STEPS):
+    """Mengukur samples/detik untuk 1, 2, 4, ... hingga `max_procs` proses dan menyimpan laporannya."""
+    sizes = sorted({n for n in (2 ** i for i in range(max_procs.bit_length())) if n <= max_procs} | {max_procs})
+    rows = []
+    for num_procs in sizes:
+        start = time.perf_counter()
+        # Benchmark tanpa evaluasi: semua core dipakai rank training, tidak ada yang dicadangkan
+        metrics = launch_distributed(train_df, num_procs, max_steps=steps, eval_mode="none")
+        rows.append({
+            "processes": num_procs,
+            "threads_per_process": metrics.get("threads_per_process"),
+            "samples_per_second": metrics.get("train_samples_per_second"),
+            "wall_seconds": round(time.perf_counter() - start, 1)
+        })
+    baseline = rows[0]["samples_per_second"]
+    print(f"\n{'proses':>6} {'thread':>6} {'sampel/s':>10} {'speedup':>8} {'efisiensi':>9}")
+    for row in rows:
+        speedup = row["samples_per_second"] / baseline if baseline and row["samples_per_second"] else None
+        row["speedup"] = round(speedup, 2) if speedup else None
+        row["efficiency"] = round(speedup / row["processes"], 2) if speedup else None
+        print(f"{row['processes']:>6} {row['threads_per_process'] or '-':>6} {row['samples_per_second'] or 0:>10.2f} "
+              f"{row['speedup'] or 0:>8.2f} {row['efficiency'] or 0:>9.0%}")
+    os.makedirs(Config.SAVE_DIR, exist_ok=True)
+    report_path = os.path.join(Config.SAVE_DIR, "scaling_report.json")
+    with open(report_path, "w") as f:
+        json.dump({"steps": steps, "batch_size_per_process": Config.BATCH_SIZE, "bf16": cpu_supports_bf16(), "runs": rows}, f, indent=2)
+    print(f"Laporan skala disimpan di: {report_path}")
+    return rows
+
+# 7. Pipeline Utama
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fine-tune the Marian translation model on an EPUB.")
+    parser.add_argument("--nproc", type=int, default=Config.NUM_PROCS,
+                        help="Number of local CPU processes for data-parallel training (gloo). 1 = single process.")
+    parser.add_argument("--scaling", action="store_true",
+                        help="Measure samples/sec for 1..nproc processes instead of training to completion.")
+    parser.add_argument("--scaling_steps", type=int, default=Config.SCALING_STEPS,
+                        help="Training steps per run in the scaling report.")
+    parser.add_argument("--eval", choices=("sampled", "full", "none"), default=Config.EVAL_MODE,
+                        help="sampled: greedy BLEU/chrF on a length-stratified sample in a separate process "
+                             "(requires sacrebleu; default when installed, otherwise none); "
+                             "full: Trainer evaluation on the whole test split every epoch.")
+    parser.add_argument("--eval_samples", type=int, default=Config.EVAL_SAMPLES,
+                        help="Number of test sentences scored in sampled evaluation.")
+    args = parser.parse_args()
+    # Diperiksa sebelum dataset dibuat, karena pelabelan dataset memakan waktu lama
+    if args.eval == "sampled" and BLEU is None:
+        parser.error("--eval sampled memerlukan paket 'sacrebleu' (pip install sacrebleu); atau gunakan --eval full/none.")
+    if BLEU is None:
+        print("Peringatan: sacrebleu tidak terpasang; evaluasi sampel dinonaktifkan.")
+    return args
 
-# 5. Pipeline Utama
 def main():
+    args = parse_args()
     # Ekstraksi teks
     print("Memproses EPUB...")
     epub_processor = EPUBProcessor()
@@ -224,8 +538,18 @@ def main():
     trainer = TranslationTrainer()
     train_df = trainer.create_dataset(filtered)
 
-    print("Memulai training model...")
-    trainer.train(train_df)
+    if args.scaling or args.nproc > 1:
+        # Model di proses induk hanya dipakai membuat dataset; setiap rank memuat replikanya sendiri
+        del trainer
+        if args.scaling:
+            print(f"Mengukur skala training CPU hingga {args.nproc} proses...")
+            scaling_report(train_df, args.nproc, steps=args.scaling_steps)
+            return
+        print(f"Memulai training model di {args.nproc} proses CPU (gloo)...")
+        launch_distributed(train_df, args.nproc, eval_mode=args.eval, eval_samples=args.eval_samples)
+    else:
+        print("Memulai training model...")
+        trainer.train(train_df, eval_mode=args.eval, eval_samples=args.eval_samples)
     print(f"Model disimpan di: {Config.SAVE_DIR}")
 
 if __name__ == "__main__":
@@ -4,7 +4,10 @@ import torch
 from ebooklib import epub
 from ebooklib.utils import debug
 from bs4 import BeautifulSoup
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer
+from RAG.generation_budget import GenerationBudget, strip_repetition, trim_padding
+from RAG.paragraph_packer import pack_paragraphs, prompt_overhead
+from RAG.model_loading import load_causal_lm_low_memory
 
 # === KONFIGURASI ===
 CHECKPOINT = "bigscience/bloomz-7b1-mt"
@@ -13,6 +16,13 @@ EPUB_PATH = 'تيسير اللطيف المنان في خلاصة تفسير ا
 TARGET_LANGUAGE = "English"
 MAX_INPUT_LENGTH = 256  # Diperkecil agar lebih ringan diproses
 MAX_OUTPUT_LENGTH = 512  # Dikurangi untuk mempercepat output
+MODEL_DTYPE = "float16" if torch.cuda.is_available() else "float32"  # "bfloat16"/"int8" untuk RAM lebih kecil
+MAX_CPU_MEMORY = None  # Mis. "20GiB": layer di atas batas ini di-offload ke disk
+PROMPT_TEMPLATE = (
+    "Translate the following Islamic Arabic text to {target_language}.\n"
+    "Text: {text}\n\nTranslation:"
+)
+budget = GenerationBudget(legacy_budget=MAX_OUTPUT_LENGTH, max_new_tokens=MAX_OUTPUT_LENGTH, max_beams=2)
 
 
 def extract_text_from_epub(epub_path):
@@ -43,45 +53,50 @@ def extract_text_from_epub(epub_path):
     return paragraphs
 
 
-def split_paragraphs(paragraphs, max_chunk_length=MAX_INPUT_LENGTH):
-    chunks, current = [], ''
-    for para in paragraphs:
-        if len(current) + len(para) < max_chunk_length:
-            current += para + ' '
-        else:
-            chunks.append(current.strip())
-            current = para + ' '
-    if current:
-        chunks.append(current.strip())
-    return chunks
+def split_paragraphs(paragraphs, tokenizer, max_chunk_length=MAX_INPUT_LENGTH, target_language=TARGET_LANGUAGE):
+    # Dikemas berdasarkan jumlah token termasuk prompt, sehingga tidak ada yang terpotong
+    overhead = prompt_overhead(tokenizer, PROMPT_TEMPLATE, (target_language,))
+    return pack_paragraphs(paragraphs, tokenizer, max_chunk_length, overhead)
 
 
-def load_model(checkpoint=CHECKPOINT, cache_dir=CACHE_DIR):
+def load_tokenizer(checkpoint=CHECKPOINT, cache_dir=CACHE_DIR):
+    return AutoTokenizer.from_pretrained(checkpoint, cache_dir=cache_dir)
+
+
+def load_model(checkpoint=CHECKPOINT, cache_dir=CACHE_DIR, tokenizer=None):
     print(f"Memuat model dari {cache_dir} ...")
-    tokenizer = AutoTokenizer.from_pretrained(checkpoint, cache_dir=cache_dir)
-    model = AutoModelForCausalLM.from_pretrained(
+    tokenizer = tokenizer or load_tokenizer(checkpoint, cache_dir)
+    model, report = load_causal_lm_low_memory(
         checkpoint,
         cache_dir=cache_dir,
-        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-        device_map={"": "cpu"}
+        dtype=MODEL_DTYPE,
+        max_cpu_memory=MAX_CPU_MEMORY
     )
+    print(f"Model dimuat dalam {report['seconds']} detik, RSS puncak {report['peak_rss_gb']} GB.")
     return tokenizer, model
 
 
 def translate_text(text, tokenizer, model, target_language=TARGET_LANGUAGE):
-    prompt = (
-        f"Translate the following Islamic Arabic text to {target_language}.\n"
-        f"Text: {text}\n\nTranslation:"
-    )
+    prompt = PROMPT_TEMPLATE.format(target_language=target_language, text=text)
     inputs = tokenizer(prompt, return_tensors='pt', truncation=True, max_length=MAX_INPUT_LENGTH).to(model.device)
+    prompt_length = inputs['input_ids'].shape[1]
+    source_tokens = len(tokenizer(text, add_special_tokens=False)['input_ids'])
+    # Batas lama: MAX_OUTPUT_LENGTH termasuk prompt
+    legacy_budget = max(1, MAX_OUTPUT_LENGTH - prompt_length)
+    max_new_tokens = min(legacy_budget, budget.max_new_tokens_for(source_tokens, target_language))
+    special_ids = {tokenizer.pad_token_id, tokenizer.eos_token_id}
+    stopping_criteria = budget.stopping_criteria(prompt_length, special_ids)
     outputs = model.generate(
         **inputs,
-        max_length=MAX_OUTPUT_LENGTH,
-        num_beams=2,  # Kurangi beam untuk kecepatan
+        max_new_tokens=max_new_tokens,
+        num_beams=budget.num_beams_for(source_tokens),
         no_repeat_ngram_size=2,
-        early_stopping=True
+        early_stopping=True,
+        stopping_criteria=stopping_criteria
     )
-    return tokenizer.decode(outputs[0], skip_special_tokens=True)
+    generated = outputs[0][prompt_length:].tolist()
+    budget.report(target_language, source_tokens, max_new_tokens, len(generated), stopping_criteria, legacy_budget)
+    return tokenizer.decode(strip_repetition(trim_padding(generated, special_ids)), skip_special_tokens=True).strip()
 
 
 def main():
@@ -89,7 +104,8 @@ def main():
     paragraphs = extract_text_from_epub(EPUB_PATH)
     print(f"✅ Ditemukan {len(paragraphs)} paragraf yang valid.")
 
-    chunks = split_paragraphs(paragraphs)
+    tokenizer = load_tokenizer()
+    chunks = split_paragraphs(paragraphs, tokenizer)
     print(f"\U0001F4E6 Total chunk siap terjemah: {len(chunks)}")
 
     if not chunks:
@@ -109,7 +125,7 @@ def main():
         print("Nomor chunk di luar rentang. Menggunakan chunk 0.")
         selected_chunk = 0
 
-    tokenizer, model = load_model()
+    tokenizer, model = load_model(tokenizer=tokenizer)
 
     print("\n=== HASIL TERJEMAHAN ===\n")
     print(f"\n--- Chunk {selected_chunk} ---")